@@ -0,0 +1,37 @@
+"""
+按内容寻址的上传文件存储
+同一份文件（SHA-256相同）无论被多少个会话上传都只在磁盘上保存一份，
+会话中的文件记录通过 content_hash 引用；引用数归零时才删除文件
+"""
+
+import os
+from pathlib import Path
+
+
+class BlobStore:
+    """blobs/{哈希前两位}/{哈希} 形式的内容寻址存储"""
+
+    def __init__(self, root: str):
+        self.root = Path(root)
+        self.tmp_dir = self.root / "tmp"
+        self.tmp_dir.mkdir(parents=True, exist_ok=True)
+
+    def path_for(self, content_hash: str) -> Path:
+        return self.root / content_hash[:2] / content_hash
+
+    def commit(self, tmp_path: Path, content_hash: str) -> Path:
+        """把临时文件放入存储；相同内容已存在时丢弃临时文件，保留原文件（修改时间不变，解析缓存继续有效）"""
+        path = self.path_for(content_hash)
+        if path.exists():
+            os.remove(tmp_path)
+            return path
+        path.parent.mkdir(exist_ok=True)
+        os.replace(tmp_path, path)
+        return path
+
+    def delete(self, content_hash: str) -> bool:
+        try:
+            os.remove(self.path_for(content_hash))
+            return True
+        except OSError:
+            return False
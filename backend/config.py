@@ -22,10 +22,71 @@ class Config:
     CUSTOM_AI_API_KEY = os.getenv("CUSTOM_AI_API_KEY")
     CUSTOM_AI_API_URL = os.getenv("CUSTOM_AI_API_URL")
     
+    # 大模型HTTP连接池配置
+    LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", 10))  # 建立连接超时（秒）
+    LLM_CHAT_TIMEOUT = float(os.getenv("LLM_CHAT_TIMEOUT", 60))  # 聊天请求读取超时（秒）
+    LLM_QUESTIONS_TIMEOUT = float(os.getenv("LLM_QUESTIONS_TIMEOUT", 120))  # 生成题目请求读取超时（秒）
+    LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", 500))  # 每个api_base的最大连接数
+    LLM_MAX_KEEPALIVE = int(os.getenv("LLM_MAX_KEEPALIVE", 100))  # 每个api_base保持的空闲长连接数
+    LLM_KEEPALIVE_EXPIRY = float(os.getenv("LLM_KEEPALIVE_EXPIRY", 60))  # 空闲长连接保持时间（秒）
+    LLM_PREWARM = os.getenv("LLM_PREWARM", "true").lower() == "true"  # 启动时预建立连接
+    
+    # 批量出题配置
+    QUESTIONS_BATCH_SIZE = int(os.getenv("QUESTIONS_BATCH_SIZE", 5))  # 每个出题子请求生成的题目数，数量更多时拆分为并发子请求
+    QUESTIONS_MAX_CONCURRENCY = int(os.getenv("QUESTIONS_MAX_CONCURRENCY", 4))  # 一次出题请求同时进行的子请求数上限
+    QUESTIONS_DUPLICATE_SIMILARITY = float(os.getenv("QUESTIONS_DUPLICATE_SIMILARITY", 0.9))  # 题干内容词特征集合的Jaccard相似度不低于该值时视为重复
+    QUESTIONS_TOPUP_ROUNDS = int(os.getenv("QUESTIONS_TOPUP_ROUNDS", 2))  # 去重或子请求失败后题目不足时最多补题的轮数
+
+    # 大模型回答缓存配置
+    LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "true").lower() == "true"
+    LLM_CACHE_DIR = os.getenv("LLM_CACHE_DIR", os.path.join("data", "llm_cache"))
+    LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", 1000))  # 内存层最多缓存的回答数
+    LLM_CACHE_MAX_DISK_ENTRIES = int(os.getenv("LLM_CACHE_MAX_DISK_ENTRIES", 10000))  # 磁盘层最多缓存的回答数
+    LLM_CACHE_MAX_DISK_BYTES = int(os.getenv("LLM_CACHE_MAX_DISK_BYTES", 256 * 1024 * 1024))  # 磁盘层最多占用的空间
+    LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", 24 * 3600))  # 回答有效期（秒）
+    LLM_CACHE_STALE_TTL = float(os.getenv("LLM_CACHE_STALE_TTL", 7 * 24 * 3600))  # 过期后上游失败时仍可返回的时长（秒）
+    
     # 文件上传配置
     MAX_FILE_SIZE = int(os.getenv("MAX_FILE_SIZE", 10 * 1024 * 1024))  # 10MB
+    MAX_UPLOAD_REQUEST_SIZE = int(os.getenv("MAX_UPLOAD_REQUEST_SIZE", MAX_FILE_SIZE + 1024 * 1024))  # 一次上传请求体（含multipart开销）的上限，按 Content-Length 在读取前拒绝
+    UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", 1024 * 1024))  # 上传分块写盘的块大小
+    BLOB_DIR = os.getenv("BLOB_DIR", os.path.join("data", "blobs"))  # 按内容哈希存储的上传文件目录
+    MANIFEST_WATCH = os.getenv("MANIFEST_WATCH", "true").lower() == "true"  # 安装了watchfiles时监听上传目录变化
+    MANIFEST_RECONCILE_INTERVAL = float(os.getenv("MANIFEST_RECONCILE_INTERVAL", 300))  # 不监听时定期对账的间隔（秒）
+    RESCAN_CONCURRENCY = int(os.getenv("RESCAN_CONCURRENCY", 4))  # 重新扫描时同时同步的会话数
     UPLOAD_DIR = os.getenv("UPLOAD_DIR", "uploads")
     
+    # 会话存储配置
+    SESSION_DB_PATH = os.getenv("SESSION_DB_PATH", os.path.join("data", "sessions.db"))  # 会话/文件元数据SQLite数据库
+    
+    # 文件解析缓存配置
+    PARSE_CACHE_DIR = os.getenv("PARSE_CACHE_DIR", os.path.join("data", "parse_cache"))
+    PARSE_CACHE_MAX_BYTES = int(os.getenv("PARSE_CACHE_MAX_BYTES", 512 * 1024 * 1024))  # 512MB
+    INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", 2))  # 上传后台解析的worker数量
+    INGEST_STATUS_TTL = float(os.getenv("INGEST_STATUS_TTL", 3600))  # 解析结束（ready/failed）后状态记录的保留时间（秒）
+    PARSE_WORKERS = int(os.getenv("PARSE_WORKERS", min(4, os.cpu_count() or 1)))  # 解析进程数，0表示使用线程池
+    PARSE_MAX_CONCURRENCY = int(os.getenv("PARSE_MAX_CONCURRENCY", 8))  # 同时提交到进程池的解析任务上限
+    PDF_PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", 16))  # 大PDF拆分解析时每个任务的页数
+    PAGE_RANGE_MAX_PAGES = int(os.getenv("PAGE_RANGE_MAX_PAGES", 50))  # 按页读取时一次最多返回的页数
+    
+    # 知识库检索配置
+    RETRIEVAL_CANDIDATES = int(os.getenv("RETRIEVAL_CANDIDATES", 32))  # 每个知识库参与上下文预算分配的候选文本块数
+    MAX_CONTEXT_TOKENS = int(os.getenv("MAX_CONTEXT_TOKENS", 12000))  # 即使模型窗口更大，知识库上下文也不超过这么多token
+    DEFAULT_CONTEXT_WINDOW = int(os.getenv("DEFAULT_CONTEXT_WINDOW", 16384))  # MODEL_CONFIGS 中没有的模型按此窗口计算
+    DEFAULT_MAX_OUTPUT_TOKENS = int(os.getenv("DEFAULT_MAX_OUTPUT_TOKENS", 4096))
+    RETRIEVAL_CHUNK_CHARS = int(os.getenv("RETRIEVAL_CHUNK_CHARS", 800))  # 文本块最大字符数
+    RETRIEVAL_MAX_SESSIONS = int(os.getenv("RETRIEVAL_MAX_SESSIONS", 200))  # 内存中保留索引的会话数
+    RETRIEVAL_MAX_ANONYMOUS = int(os.getenv("RETRIEVAL_MAX_ANONYMOUS", 16))  # 不带会话ID的请求保留的索引数
+    VECTOR_DIM = int(os.getenv("VECTOR_DIM", 4096))  # 本地向量检索的哈希维度
+    SHARED_ANALYSIS_ENTRIES = int(os.getenv("SHARED_ANALYSIS_ENTRIES", 64))  # 没有会话引用时仍保留的共享文档段（切块、倒排表、向量）数
+    
+    # 日志配置
+    LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+    LOG_FILE = os.getenv("LOG_FILE")  # 不设置时输出到标准输出
+    LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", 10000))  # 待写出日志的队列长度，队列满时丢弃新日志
+    LOG_SAMPLE_RATES = os.getenv("LOG_SAMPLE_RATES", "")  # 按类别采样INFO日志，如 "request=0.1,upstream=0.5"
+    LOG_MAX_FIELD_CHARS = int(os.getenv("LOG_MAX_FIELD_CHARS", 2000))  # 单个日志字段的最大字符数
+    
     # 安全配置
     SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-change-this")
     ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", 30))
@@ -77,10 +138,14 @@ MODEL_CONFIGS = {
     "deepseek-chat": {
         "api_base": "https://api.deepseek.com",
         "api_key": DEFAULT_API_KEY,
+        "context_window": 65536,  # 上下文窗口（token），包含输出
+        "max_output_tokens": 8192,  # 单次回答的最大token数
     },
     "step-1-8k": {
         "api_base": "https://api.stepfun.com/v1",
         "api_key": "",
+        "context_window": 8192,
+        "max_output_tokens": 4096,
     },
     # 可扩展其它模型
 } 
\ No newline at end of file
@@ -0,0 +1,95 @@
+"""
+文件内容提取函数
+这里的函数都是同步、无状态的模块级函数，可以直接在子进程中运行（由 parser_pool 调度），
+输出格式与 extract_file_content 保持一致：PDF按页标注【第N页】，DOCX/TXT按章节标注【章节】
+"""
+
+import os
+import re
+from typing import List, Tuple
+
+# PyPDF2 / python-docx 导入较慢，在第一次解析对应类型的文件时才导入
+
+SECTION_TITLE_PATTERNS = (r"^第[0-9一二三四五六七八九十]+章", r"^[0-9]+(\\.[0-9]+)+")
+
+
+def _is_section_title(text: str) -> bool:
+    return any(re.match(pattern, text) for pattern in SECTION_TITLE_PATTERNS)
+
+
+def count_pdf_pages(file_path: str) -> int:
+    """获取PDF页数"""
+    import PyPDF2
+    with open(file_path, 'rb') as file:
+        return len(PyPDF2.PdfReader(file).pages)
+
+
+def extract_pdf_pages(file_path: str, start: int, end: int) -> List[Tuple[int, str]]:
+    """提取PDF第 start 到 end-1 页（从0开始）的文本，返回 [(页码, 带页码标注的文本)]"""
+    import PyPDF2
+    pages = []
+    with open(file_path, 'rb') as file:
+        pdf_reader = PyPDF2.PdfReader(file)
+        end = min(end, len(pdf_reader.pages))
+        for i in range(start, end):
+            page_text = pdf_reader.pages[i].extract_text()
+            if page_text:
+                try:
+                    page_text = page_text.encode('utf-8', errors='ignore').decode('utf-8')
+                except UnicodeError:
+                    continue
+                pages.append((i + 1, f"【第{i+1}页】\n" + page_text + "\n"))
+    return pages
+
+
+def _sectioned_lines(lines) -> str:
+    """按章节标题整理文本行：标题行标注为【章节】，正文行前加上所属章节"""
+    content = ""
+    current_section = ""
+    for line in lines:
+        if _is_section_title(line):
+            current_section = line.strip()
+            content += f"\n【{current_section}】\n"
+        else:
+            if current_section:
+                content += f"[{current_section}] "
+            content += line + "\n"
+    return content.strip()
+
+
+def extract_docx(file_path: str) -> str:
+    """提取DOCX内容，尝试分章节"""
+    from docx import Document
+    doc = Document(file_path)
+    lines = []
+    for paragraph in doc.paragraphs:
+        text = paragraph.text
+        if text:
+            try:
+                text = text.encode('utf-8', errors='ignore').decode('utf-8')
+            except UnicodeError:
+                continue
+            lines.append(text)
+    return _sectioned_lines(lines)
+
+
+def extract_text_file(file_path: str) -> str:
+    """提取文本文件内容，尝试分章节；UTF-8读取失败时回退到GBK"""
+    try:
+        with open(file_path, 'r', encoding='utf-8', errors='ignore') as file:
+            raw_content = file.read()
+    except Exception:
+        with open(file_path, 'r', encoding='gbk', errors='ignore') as file:
+            raw_content = file.read()
+    lines = [line.strip() for line in raw_content.splitlines()]
+    return _sectioned_lines([line for line in lines if line])
+
+
+def extract_binary_file(file_path: str) -> str:
+    """其他类型的文件按UTF-8尽量解码"""
+    with open(file_path, 'rb') as file:
+        binary_content = file.read()
+    try:
+        return binary_content.decode('utf-8', errors='ignore').strip()
+    except Exception:
+        return f"无法解析文件内容: {os.path.basename(file_path)}"
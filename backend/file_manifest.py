@@ -0,0 +1,244 @@
+"""
+上传目录文件清单
+为每个上传目录持久化保存 (路径, 大小, 修改时间, 内容哈希) 清单，重新扫描时只对新增/变化的文件计算哈希；
+读接口通过内存中的清单判断文件是否存在，不再对每个文件调用 os.path.exists。
+安装了 watchfiles（uvicorn[standard] 自带）时监听目录变化（Linux 下基于 inotify）实时更新清单，
+否则由后台任务定期增量对账
+"""
+
+import asyncio
+import hashlib
+import os
+import sqlite3
+import stat
+import threading
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+try:
+    from watchfiles import Change, awatch
+except ImportError:  # 可选依赖
+    awatch = None
+
+HASH_CHUNK_SIZE = 1024 * 1024
+TEMP_SUFFIXES = (".part", ".tmp")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS file_manifest (
+    path TEXT PRIMARY KEY,
+    root TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    hash TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_file_manifest_root ON file_manifest(root);
+"""
+
+# 清单条目：(大小, 修改时间, 内容哈希)
+Entry = Tuple[int, int, str]
+
+
+def hash_file(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _is_ignored(name: str) -> bool:
+    """临时文件（上传中的 .part、原子写入的 .tmp）和隐藏文件不进入清单"""
+    return name.startswith('.') or name.endswith(TEMP_SUFFIXES)
+
+
+class FileManifest:
+    """多个上传目录的文件清单，保存在SQLite中并在内存中保留一份副本"""
+
+    def __init__(self, db_path: str):
+        Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        # 根目录 -> 是否递归扫描子目录
+        self._roots: Dict[str, bool] = {}
+        self._entries: Dict[str, Dict[str, Entry]] = {}
+        self.watching = False
+
+    @staticmethod
+    def _normalize(path: str) -> str:
+        return os.path.abspath(path)
+
+    def add_root(self, root: str, recursive: bool = True):
+        """登记一个上传目录，并从数据库加载它的清单"""
+        root = self._normalize(root)
+        with self._lock:
+            self._roots[root] = recursive
+            rows = self._conn.execute(
+                "SELECT path, size, mtime_ns, hash FROM file_manifest WHERE root = ?", (root,)
+            ).fetchall()
+            self._entries[root] = {path: (size, mtime_ns, content_hash) for path, size, mtime_ns, content_hash in rows}
+
+    def _root_of(self, path: str) -> Optional[str]:
+        for root, recursive in self._roots.items():
+            parent = os.path.dirname(path)
+            if parent == root or (recursive and path.startswith(root + os.sep)):
+                return root
+        return None
+
+    def _walk(self, root: str, recursive: bool) -> Iterator[Tuple[str, os.stat_result]]:
+        try:
+            with os.scandir(root) as it:
+                entries = list(it)
+        except OSError:
+            return
+        for entry in entries:
+            if _is_ignored(entry.name):
+                continue
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    if recursive:
+                        yield from self._walk(entry.path, recursive)
+                elif entry.is_file():
+                    yield entry.path, entry.stat()
+            except OSError:
+                continue
+
+    def reconcile(self, root: str) -> Dict[str, List[str]]:
+        """
+        增量对账：只对新增或大小/修改时间变化的文件计算哈希，删除已不存在的条目。
+        同步执行（包含磁盘IO），应放在线程池中调用；返回变化的路径
+        """
+        root = self._normalize(root)
+        recursive = self._roots.get(root, True)
+        with self._lock:
+            known = dict(self._entries.get(root, {}))
+        changes: Dict[str, List[str]] = {"added": [], "changed": [], "removed": []}
+        seen = set()
+        upserts = []
+        for path, stat in self._walk(root, recursive):
+            seen.add(path)
+            entry = known.get(path)
+            if entry and entry[0] == stat.st_size and entry[1] == stat.st_mtime_ns:
+                continue
+            try:
+                content_hash = hash_file(path)
+            except OSError:
+                continue
+            upserts.append((path, (stat.st_size, stat.st_mtime_ns, content_hash)))
+            changes["changed" if entry else "added"].append(path)
+        changes["removed"] = [path for path in known if path not in seen]
+
+        with self._lock:
+            entries = self._entries.setdefault(root, {})
+            self._conn.execute("BEGIN")
+            try:
+                for path, entry in upserts:
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO file_manifest (path, root, size, mtime_ns, hash) VALUES (?, ?, ?, ?, ?)",
+                        (path, root) + entry
+                    )
+                    entries[path] = entry
+                for path in changes["removed"]:
+                    self._conn.execute("DELETE FROM file_manifest WHERE path = ?", (path,))
+                    entries.pop(path, None)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return changes
+
+    def reconcile_all(self) -> Dict[str, List[str]]:
+        merged: Dict[str, List[str]] = {"added": [], "changed": [], "removed": []}
+        for root in list(self._roots):
+            for kind, paths in self.reconcile(root).items():
+                merged[kind].extend(paths)
+        return merged
+
+    def record(self, path: str, content_hash: Optional[str] = None):
+        """记录一个新写入的文件（上传时已算出哈希则不再读取文件）"""
+        path = self._normalize(path)
+        root = self._root_of(path)
+        if root is None:
+            return
+        try:
+            stat = os.stat(path)
+            entry = (stat.st_size, stat.st_mtime_ns, content_hash or hash_file(path))
+        except OSError:
+            self.forget(path)
+            return
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO file_manifest (path, root, size, mtime_ns, hash) VALUES (?, ?, ?, ?, ?)",
+                (path, root) + entry
+            )
+            self._entries[root][path] = entry
+
+    def forget(self, path: str):
+        path = self._normalize(path)
+        root = self._root_of(path)
+        if root is None:
+            return
+        with self._lock:
+            self._conn.execute("DELETE FROM file_manifest WHERE path = ?", (path,))
+            self._entries[root].pop(path, None)
+
+    def is_present(self, path: str) -> Optional[bool]:
+        """
+        根据清单判断文件是否存在；路径不在任何登记目录下时返回None。
+        清单可能落后于磁盘（如其他进程刚写入的文件），返回False时调用方应再确认一次
+        """
+        path = self._normalize(path)
+        root = self._root_of(path)
+        if root is None:
+            return None
+        with self._lock:
+            return path in self._entries[root]
+
+    def entries(self, root: str) -> Dict[str, Entry]:
+        """某个目录下所有文件的清单副本"""
+        with self._lock:
+            return dict(self._entries.get(self._normalize(root), {}))
+
+    def get(self, path: str) -> Optional[Entry]:
+        path = self._normalize(path)
+        root = self._root_of(path)
+        if root is None:
+            return None
+        with self._lock:
+            return self._entries[root].get(path)
+
+    async def watch(self, stop_event: asyncio.Event) -> bool:
+        """监听所有登记目录的变化并更新清单；未安装 watchfiles 时立即返回False"""
+        if awatch is None:
+            return False
+        roots = [root for root in self._roots if os.path.isdir(root)]
+        if not roots:
+            return False
+        loop = asyncio.get_running_loop()
+        self.watching = True
+        try:
+            async for changes in awatch(*roots, stop_event=stop_event, recursive=True):
+                for change, path in changes:
+                    if _is_ignored(os.path.basename(path)):
+                        continue
+                    try:
+                        file_stat = os.stat(path)
+                    except OSError:
+                        file_stat = None
+                    if change == Change.deleted or file_stat is None or not stat.S_ISREG(file_stat.st_mode):
+                        self.forget(path)
+                        continue
+                    # 上传时已用边写边算出的哈希登记过的文件，大小和修改时间一致时不再读取计算哈希
+                    entry = self.get(path)
+                    if entry and entry[0] == file_stat.st_size and entry[1] == file_stat.st_mtime_ns:
+                        continue
+                    await loop.run_in_executor(None, self.record, path)
+        finally:
+            self.watching = False
+        return True
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
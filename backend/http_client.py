@@ -0,0 +1,135 @@
+"""
+大模型API的异步HTTP客户端
+每个 api_base 共享一个 httpx.AsyncClient（长连接池），避免每次请求重新进行TLS握手，
+请求期间不阻塞事件循环；启动时可预先建立连接
+"""
+
+import asyncio
+import json
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Any, AsyncIterator, Dict, Iterable, Optional
+
+from backend.structured_log import get_logger
+
+log = get_logger("upstream")
+
+if TYPE_CHECKING:
+    import httpx
+
+
+def _httpx():
+    """httpx 在第一次创建客户端时才导入，缩短服务启动时间"""
+    import httpx
+    return httpx
+
+
+class LLMHttpClient:
+    """按 api_base 管理的异步连接池"""
+
+    def __init__(
+        self,
+        connect_timeout: float,
+        read_timeout: float,
+        max_connections: int,
+        max_keepalive_connections: int,
+        keepalive_expiry: float,
+        max_clients: int = 32
+    ):
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.max_connections = max_connections
+        self.max_keepalive_connections = max_keepalive_connections
+        self.keepalive_expiry = keepalive_expiry
+        # 前端可以传入任意 api_base，限制客户端数量，超出时关闭最久未使用的
+        self.max_clients = max_clients
+        self._clients: "OrderedDict[str, httpx.AsyncClient]" = OrderedDict()
+
+    def _timeout(self, read_timeout: Optional[float] = None) -> "httpx.Timeout":
+        return _httpx().Timeout(
+            read_timeout or self.read_timeout,
+            connect=self.connect_timeout
+        )
+
+    def get_client(self, api_base: str) -> "httpx.AsyncClient":
+        api_base = api_base.rstrip('/')
+        client = self._clients.get(api_base)
+        if client is not None and not client.is_closed:
+            self._clients.move_to_end(api_base)
+            return client
+        httpx = _httpx()
+        limits = httpx.Limits(
+            max_connections=self.max_connections,
+            max_keepalive_connections=self.max_keepalive_connections,
+            keepalive_expiry=self.keepalive_expiry
+        )
+        client = httpx.AsyncClient(timeout=self._timeout(), limits=limits)
+        self._clients[api_base] = client
+        while len(self._clients) > self.max_clients:
+            _, old_client = self._clients.popitem(last=False)
+            asyncio.ensure_future(old_client.aclose())
+        return client
+
+    async def post_chat_completions(
+        self,
+        api_base: str,
+        api_key: str,
+        payload: Dict[str, Any],
+        timeout: Optional[float] = None
+    ) -> "httpx.Response":
+        """调用 {api_base}/chat/completions"""
+        client = self.get_client(api_base)
+        return await client.post(
+            f"{api_base.rstrip('/')}/chat/completions",
+            headers={"Authorization": f"Bearer {api_key}"},
+            json=payload,
+            timeout=self._timeout(timeout)
+        )
+
+    async def stream_chat_completions(
+        self,
+        api_base: str,
+        api_key: str,
+        payload: Dict[str, Any],
+        timeout: Optional[float] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """以 stream 模式调用 {api_base}/chat/completions，逐个返回上游推送的数据块"""
+        client = self.get_client(api_base)
+        async with client.stream(
+            "POST",
+            f"{api_base.rstrip('/')}/chat/completions",
+            headers={"Authorization": f"Bearer {api_key}"},
+            json={**payload, "stream": True},
+            timeout=self._timeout(timeout)
+        ) as response:
+            if response.status_code != 200:
+                body = await response.aread()
+                log.warning("流式调用返回错误状态码", api_base=api_base, status=response.status_code, body=body[:500].decode('utf-8', 'replace'))
+                raise Exception(f"API调用失败，状态码: {response.status_code}")
+            async for line in response.aiter_lines():
+                line = line.strip()
+                if not line.startswith("data:"):
+                    continue
+                data = line[len("data:"):].strip()
+                if data == "[DONE]":
+                    break
+                try:
+                    yield json.loads(data)
+                except ValueError:
+                    continue
+
+    async def prewarm(self, api_bases: Iterable[str]):
+        """预先建立到各个 api_base 的连接（DNS解析、TCP和TLS握手），失败时忽略"""
+        async def warm(api_base: str):
+            try:
+                client = self.get_client(api_base)
+                await client.get(f"{api_base.rstrip('/')}/models", timeout=self._timeout(self.connect_timeout))
+                log.info("已预建立连接", api_base=api_base)
+            except Exception as e:
+                log.warning("预建立连接失败（忽略）", api_base=api_base, error=str(e))
+
+        await asyncio.gather(*[warm(api_base) for api_base in set(api_bases) if api_base])
+
+    async def aclose(self):
+        clients = list(self._clients.values())
+        self._clients.clear()
+        await asyncio.gather(*[client.aclose() for client in clients], return_exceptions=True)
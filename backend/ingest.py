@@ -0,0 +1,136 @@
+"""
+上传文件后台解析流水线
+/upload 保存文件后把文件放入队列，由后台worker立即完成提取、规范化和缓存，
+并记录每个文件的解析状态（queued / parsing / ready / failed）和进度；
+已结束（ready / failed）的状态记录保留 status_ttl 秒后移除，之后查询时由调用方根据解析缓存判断
+"""
+
+import asyncio
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from backend.structured_log import get_logger
+
+log = get_logger("ingest")
+
+STATUS_QUEUED = "queued"
+STATUS_PARSING = "parsing"
+STATUS_READY = "ready"
+STATUS_FAILED = "failed"
+
+# 解析函数：接收文件信息和进度回调，返回提取出的文本；失败时抛出异常
+ProcessFunc = Callable[[Dict[str, Any], Callable[[int, int], None]], Awaitable[str]]
+
+
+class IngestPipeline:
+    """基于 asyncio.Queue 的解析流水线"""
+
+    def __init__(self, process_func: ProcessFunc, workers: int = 2, max_queue_size: int = 1000, status_ttl: float = 3600):
+        self.process_func = process_func
+        self.workers = max(1, workers)
+        self.max_queue_size = max_queue_size
+        self.status_ttl = status_ttl
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        # (session_id, file_id) -> 状态记录
+        self._status: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        # 已结束的记录 -> 结束时间（单调时钟），按结束先后排列
+        self._finished: "OrderedDict[Tuple[str, str], float]" = OrderedDict()
+
+    async def start(self):
+        """启动后台worker，需要在事件循环中调用"""
+        if self._tasks:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_queue_size)
+        self._tasks = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+        log.info("解析流水线已启动", workers=self.workers)
+
+    async def stop(self):
+        """停止所有worker"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._queue = None
+
+    def _set_status(self, key: Tuple[str, str], **fields) -> Dict[str, Any]:
+        record = self._status.setdefault(key, {})
+        record.update(fields)
+        record["updated_at"] = datetime.now().isoformat()
+        return record
+
+    def _finish(self, key: Tuple[str, str], **fields):
+        """记录最终状态（ready / failed），保留 status_ttl 秒"""
+        self._set_status(key, **fields)
+        self._finished.pop(key, None)
+        self._finished[key] = time.monotonic()
+        self._prune_finished()
+
+    def _prune_finished(self):
+        deadline = time.monotonic() - self.status_ttl
+        while self._finished:
+            key, finished_at = next(iter(self._finished.items()))
+            if finished_at > deadline:
+                break
+            del self._finished[key]
+            self._status.pop(key, None)
+
+    def enqueue(self, session_id: str, file_info: Dict[str, Any]) -> Dict[str, Any]:
+        """把文件加入解析队列，返回当前状态记录"""
+        key = (session_id, file_info["id"])
+        self._prune_finished()
+        self._finished.pop(key, None)
+        record = self._set_status(
+            key,
+            file_id=file_info["id"],
+            name=file_info.get("name", ""),
+            status=STATUS_QUEUED,
+            progress=0.0,
+            error=None
+        )
+        if self._queue is None:
+            # 流水线未启动（例如直接调用而非通过服务器运行），保持queued，读取时再懒解析
+            return dict(record)
+        try:
+            self._queue.put_nowait((session_id, dict(file_info)))
+        except asyncio.QueueFull:
+            self._finish(key, status=STATUS_FAILED, error="解析队列已满，请稍后重试")
+        return dict(record)
+
+    def get_status(self, session_id: str, file_id: str) -> Optional[Dict[str, Any]]:
+        self._prune_finished()
+        record = self._status.get((session_id, file_id))
+        return dict(record) if record else None
+
+    def forget(self, session_id: str, file_id: str):
+        """文件被删除时移除其状态记录"""
+        self._status.pop((session_id, file_id), None)
+        self._finished.pop((session_id, file_id), None)
+
+    async def _worker(self, worker_no: int):
+        while True:
+            session_id, file_info = await self._queue.get()
+            key = (session_id, file_info["id"])
+            try:
+                if key not in self._status:
+                    # 排队期间文件已被删除
+                    continue
+                self._set_status(key, status=STATUS_PARSING, progress=0.0)
+
+                def on_progress(done: int, total: int, key=key):
+                    if total > 0 and key in self._status:
+                        self._status[key]["progress"] = round(done / total, 3)
+
+                content = await self.process_func(file_info, on_progress)
+                if key in self._status:
+                    self._finish(key, status=STATUS_READY, progress=1.0, chars=len(content))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                log.error("解析失败", worker=worker_no, file=file_info.get('name'), error=str(e))
+                if key in self._status:
+                    self._finish(key, status=STATUS_FAILED, error=str(e))
+            finally:
+                self._queue.task_done()
@@ -1,24 +1,41 @@
 from fastapi import FastAPI, File, UploadFile, HTTPException, Form, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse, Response
 from pydantic import BaseModel
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Callable, Sequence, Tuple
+from contextlib import contextmanager
 import uvicorn
 import os
 import json
 import asyncio
 from datetime import datetime
 import aiofiles
-import requests
-import PyPDF2
-from docx import Document
-import io
 import re
 import uuid
+import hashlib
+import time
 from pathlib import Path
-import glob
-from backend.config import DEFAULT_MODEL, DEFAULT_API_BASE, DEFAULT_API_KEY, MODEL_CONFIGS
-from openai import OpenAI
+from backend.config import Config, DEFAULT_MODEL, DEFAULT_API_BASE, DEFAULT_API_KEY, MODEL_CONFIGS
+from backend.parse_cache import ParseCache, MappedText
+from backend.ingest import IngestPipeline, STATUS_READY
+from backend.parser_pool import ParserPool, PDF_TYPE, DOCX_TYPE, TEXT_TYPES
+from backend.http_client import LLMHttpClient
+from backend.retrieval import SessionIndex, SessionIndexRegistry, DocumentSegment, SegmentCache, analyze_document
+from backend.question_bank import parse_question_bank, strip_label
+from backend.response_cache import ResponseCache
+from backend.singleflight import SingleFlight
+from backend.session_store import SessionStore
+from backend.blob_store import BlobStore
+from backend.token_budget import estimate_tokens, context_budget, pack_chunks, split_candidates, group_lines
+from backend.file_manifest import FileManifest
+from backend.metrics import MetricsRegistry, CONTENT_TYPE
+from backend.near_duplicates import NearDuplicateFilter
+from backend.structured_log import setup_logging, shutdown_logging, get_logger, parse_sample_rates, log_stats
+
+app_log = get_logger("app")
+request_log = get_logger("request")
+upstream_log = get_logger("upstream")
+files_log = get_logger("files")
 
 # 创建FastAPI应用
 app = FastAPI(
@@ -27,6 +44,17 @@ app = FastAPI(
     version="1.0.0"
 )
 
+@app.on_event("startup")
+async def start_logging():
+    # 最先执行：日志由后台线程写出，请求处理中只做入队
+    setup_logging(
+        Config.LOG_LEVEL,
+        Config.LOG_QUEUE_SIZE,
+        parse_sample_rates(Config.LOG_SAMPLE_RATES),
+        Config.LOG_MAX_FIELD_CHARS,
+        Config.LOG_FILE
+    )
+
 # 配置CORS
 app.add_middleware(
     CORSMiddleware,
@@ -49,47 +77,126 @@ app.add_middleware(
     expose_headers=["*"],  # 暴露所有响应头
 )
 
+# Prometheus 指标，由 /metrics 输出
+metrics = MetricsRegistry()
+http_requests_in_flight = metrics.gauge("http_requests_in_flight", "正在处理的HTTP请求数")
+http_request_duration = metrics.histogram(
+    "http_request_duration_seconds", "HTTP请求耗时（到响应头返回为止，流式响应不含后续传输）", ("method", "route", "status")
+)
+extraction_duration = metrics.histogram(
+    "extraction_duration_seconds", "文件内容提取耗时（不含缓存命中）", ("file_type", "pages")
+)
+llm_request_duration = metrics.histogram(
+    "llm_request_duration_seconds", "上游大模型请求耗时", ("model", "kind", "outcome")
+)
+llm_time_to_first_token = metrics.histogram(
+    "llm_time_to_first_token_seconds", "流式请求收到第一个回答片段的等待时间", ("model",)
+)
+llm_tokens = metrics.counter(
+    "llm_tokens_total", "上游返回的token用量（type 为 prompt、completion 或 prompt_cached：命中上游前缀缓存的部分）", ("model", "type")
+)
+llm_requests_in_flight = metrics.gauge("llm_requests_in_flight", "正在进行的上游大模型请求数", ("model",))
+parse_cache_lookups = metrics.counter("parse_cache_lookups_total", "全文解析缓存查询次数", ("result",))
+questions_near_duplicates = metrics.counter("questions_near_duplicates_total", "合并出题子请求结果时过滤掉的近似重复题目数")
+questions_topups = metrics.counter("questions_topup_rounds_total", "题目去重或子请求失败后不足数量而发起的补题轮数")
+
+@app.middleware("http")
+async def reject_oversized_uploads(request: Request, call_next):
+    """上传请求按 Content-Length 在读取请求体之前拒绝超限的请求；没有该请求头时由分块写入时的大小检查兜底"""
+    if request.method == "POST" and request.url.path == "/upload":
+        declared = request.headers.get("content-length", "")
+        if declared.isdigit() and int(declared) > Config.MAX_UPLOAD_REQUEST_SIZE:
+            limit_mb = Config.MAX_UPLOAD_REQUEST_SIZE // (1024 * 1024)
+            return JSONResponse(status_code=413, content={"detail": f"上传请求超过大小限制（{limit_mb}MB）"})
+    return await call_next(request)
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    """按路由模板（而不是实际路径，避免会话ID撑爆标签）统计请求耗时"""
+    start = time.perf_counter()
+    status = 500
+    try:
+        with http_requests_in_flight.track_inprogress():
+            response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        route = request.scope.get("route")
+        http_request_duration.observe(
+            time.perf_counter() - start,
+            method=request.method,
+            route=getattr(route, "path", "unmatched"),
+            status=str(status)
+        )
+
+@contextmanager
+def track_llm_request(model: str, kind: str):
+    """统计一次上游请求的耗时和并发数，代码块内抛出异常时记为 error"""
+    start = time.perf_counter()
+    outcome = "success"
+    try:
+        with llm_requests_in_flight.track_inprogress(model=model):
+            yield
+    except BaseException:
+        outcome = "error"
+        raise
+    finally:
+        llm_request_duration.observe(time.perf_counter() - start, model=model, kind=kind, outcome=outcome)
+
+def record_llm_usage(model: str, usage: Optional[Dict[str, Any]]):
+    """记录上游响应中的 usage 字段"""
+    if not isinstance(usage, dict):
+        return
+    for token_type, field in (("prompt", "prompt_tokens"), ("completion", "completion_tokens")):
+        value = usage.get(field)
+        if isinstance(value, (int, float)):
+            llm_tokens.inc(value, model=model, type=token_type)
+    # 命中上游前缀缓存的prompt token数：DeepSeek 为 prompt_cache_hit_tokens，OpenAI 为 prompt_tokens_details.cached_tokens
+    cached = usage.get("prompt_cache_hit_tokens")
+    if cached is None:
+        cached = (usage.get("prompt_tokens_details") or {}).get("cached_tokens")
+    if isinstance(cached, (int, float)):
+        llm_tokens.inc(cached, model=model, type="prompt_cached")
+
+def page_bucket(page_count: int) -> str:
+    """把PDF页数归到固定区间，控制指标标签的取值数量"""
+    if page_count <= 0:
+        return "n/a"
+    for bound, label in ((10, "1-10"), (50, "11-50"), (200, "51-200")):
+        if page_count <= bound:
+            return label
+    return "200+"
+
+def extraction_type_label(file_type: str) -> str:
+    if file_type == PDF_TYPE:
+        return "pdf"
+    if file_type == DOCX_TYPE:
+        return "docx"
+    if file_type in TEXT_TYPES:
+        return "text"
+    return "other"
+
 # 数据存储目录
 DATA_DIR = Path("data")
 USERS_DIR = DATA_DIR / "users"
 DATA_DIR.mkdir(exist_ok=True)
 USERS_DIR.mkdir(exist_ok=True)
 
-# 用户会话管理
-user_sessions = {}
-
-def get_user_session(session_id: str):
-    """获取或创建用户会话"""
-    if session_id not in user_sessions:
-        user_sessions[session_id] = {
-            "knowledge": [],
-            "questions": [],
-            "file_id_counter": 0
-        }
-    return user_sessions[session_id]
-
-def save_user_data(session_id: str):
-    """保存用户数据到文件"""
-    user_data = user_sessions.get(session_id, {})
-    user_file = USERS_DIR / f"{session_id}.json"
-    try:
-        with open(user_file, 'w', encoding='utf-8') as f:
-            json.dump(user_data, f, ensure_ascii=False, indent=2)
-    except Exception as e:
-        print(f"保存用户数据失败: {e}")
-
-def load_user_data(session_id: str):
-    """从文件加载用户数据"""
-    user_file = USERS_DIR / f"{session_id}.json"
-    if user_file.exists():
-        try:
-            with open(user_file, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                user_sessions[session_id] = data
-                return data
-        except Exception as e:
-            print(f"加载用户数据失败: {e}")
-    return None
+# 用户会话管理（SQLite存储，首次启动时在启动钩子中导入旧的JSON会话文件）
+session_store = SessionStore(Config.SESSION_DB_PATH)
+# 上传文件按内容哈希存储，多个会话上传同一文件只保存一份
+blob_store = BlobStore(Config.BLOB_DIR)
+# 上传目录文件清单：记录每个文件的大小、修改时间和哈希，重新扫描时只处理变化的文件
+file_manifest = FileManifest(Config.SESSION_DB_PATH)
+file_manifest.add_root(Config.BLOB_DIR)
+file_manifest.add_root(str(DATA_DIR / "uploads"))
+file_manifest.add_root(Config.UPLOAD_DIR, recursive=False)
+
+@app.on_event("startup")
+async def migrate_legacy_sessions():
+    migrated_sessions = session_store.migrate_json_sessions(USERS_DIR)
+    if migrated_sessions:
+        app_log.info("已导入JSON会话文件", sessions=migrated_sessions)
 
 def generate_session_id():
     """生成唯一的会话ID"""
@@ -111,6 +218,8 @@ class ChatMessage(BaseModel):
     session_id: str
     knowledge_base_1: List[Dict[str, Any]] = []
     knowledge_base_2: List[Dict[str, Any]] = []
+    knowledge_base_1_ids: Optional[List[str]] = None  # 只传文件ID，内容由服务端从会话中读取
+    knowledge_base_2_ids: Optional[List[str]] = None
     options: Optional[Dict[str, Any]] = {}
 
 class QuestionRequest(BaseModel):
@@ -121,6 +230,8 @@ class QuestionRequest(BaseModel):
     question_type: str = "multiple_choice"
     knowledge_base_1: List[Dict[str, Any]] = []
     knowledge_base_2: List[Dict[str, Any]] = []
+    knowledge_base_1_ids: Optional[List[str]] = None
+    knowledge_base_2_ids: Optional[List[str]] = None
 
 class FileInfo(BaseModel):
     id: str
@@ -140,16 +251,12 @@ uploaded_files = {
 # 用于生成唯一ID的计数器
 file_id_counter = 0
 
-# 扫描uploads目录并重建文件信息
-def scan_uploads_directory():
-    """扫描uploads目录，重建文件信息"""
+# 按文件清单重建uploads目录的文件信息
+def rebuild_uploaded_files():
+    """按文件清单中uploads目录的条目重建文件信息（目录由 file_manifest.reconcile_all 对账，这里不再访问磁盘）"""
     global uploaded_files, file_id_counter
     
-    uploads_dir = "uploads"
-    if not os.path.exists(uploads_dir):
-        return
-    
-    print("正在扫描uploads目录...")
+    uploads_dir = Config.UPLOAD_DIR
     
     # 重置计数器
     file_id_counter = 0
@@ -160,54 +267,75 @@ def scan_uploads_directory():
         "questions": []
     }
     
-    # 扫描目录中的所有文件
-    for filename in os.listdir(uploads_dir):
-        file_path = os.path.join(uploads_dir, filename)
-        if os.path.isfile(file_path):
-            # 获取文件信息
-            file_size = os.path.getsize(file_path)
-            file_stat = os.stat(file_path)
-            
-            # 生成文件ID
-            file_id_counter += 1
-            file_id = f"file_{file_id_counter}_{int(file_stat.st_mtime)}"
-            
-            # 确定文件类型
-            file_type = "knowledge"  # 默认为知识库类型
-            
-            # 根据文件名判断类型（可以根据需要调整规则）
-            if any(keyword in filename.lower() for keyword in ['题目', '题', 'question', 'test', 'exam']):
-                file_type = "questions"
-            
-            # 确定MIME类型
-            mime_type = "application/octet-stream"
-            if filename.lower().endswith('.pdf'):
-                mime_type = "application/pdf"
-            elif filename.lower().endswith('.docx'):
-                mime_type = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
-            elif filename.lower().endswith('.txt'):
-                mime_type = "text/plain"
-            elif filename.lower().endswith('.md'):
-                mime_type = "text/markdown"
-            
-            # 创建文件信息
-            file_data = {
-                "id": file_id,
-                "name": filename,
-                "size": file_size,
-                "type": mime_type,
-                "path": file_path,
-                "upload_time": datetime.fromtimestamp(file_stat.st_mtime).isoformat()
-            }
-            
-            # 添加到对应的知识库
-            uploaded_files[file_type].append(file_data)
-            print(f"重建文件信息: {filename} -> {file_type}")
+    # 清单中的所有文件（无需再逐个stat）
+    for file_path, (file_size, mtime_ns, _) in sorted(file_manifest.entries(uploads_dir).items()):
+        filename = os.path.basename(file_path)
+        mtime = mtime_ns / 1e9
+        
+        # 生成文件ID
+        file_id_counter += 1
+        file_id = f"file_{file_id_counter}_{int(mtime)}"
+        
+        # 确定文件类型
+        file_type = "knowledge"  # 默认为知识库类型
+        
+        # 根据文件名判断类型（可以根据需要调整规则）
+        if any(keyword in filename.lower() for keyword in ['题目', '题', 'question', 'test', 'exam']):
+            file_type = "questions"
+        
+        # 确定MIME类型
+        mime_type = "application/octet-stream"
+        if filename.lower().endswith('.pdf'):
+            mime_type = "application/pdf"
+        elif filename.lower().endswith('.docx'):
+            mime_type = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+        elif filename.lower().endswith('.txt'):
+            mime_type = "text/plain"
+        elif filename.lower().endswith('.md'):
+            mime_type = "text/markdown"
+        
+        # 创建文件信息
+        file_data = {
+            "id": file_id,
+            "name": filename,
+            "size": file_size,
+            "type": mime_type,
+            "path": os.path.join(uploads_dir, filename),
+            "upload_time": datetime.fromtimestamp(mtime).isoformat()
+        }
+        
+        # 添加到对应的知识库
+        uploaded_files[file_type].append(file_data)
     
-    print(f"扫描完成，知识库文件: {len(uploaded_files['knowledge'])} 个，题目文件: {len(uploaded_files['questions'])} 个")
-
-# 在应用启动时扫描uploads目录
-scan_uploads_directory()
+    files_log.info(
+        "uploads目录文件信息已重建",
+        knowledge=len(uploaded_files['knowledge']),
+        questions=len(uploaded_files['questions'])
+    )
+
+# 大模型API共享连接池（按api_base复用长连接）
+llm_http_client = LLMHttpClient(
+    connect_timeout=Config.LLM_CONNECT_TIMEOUT,
+    read_timeout=Config.LLM_CHAT_TIMEOUT,
+    max_connections=Config.LLM_MAX_CONNECTIONS,
+    max_keepalive_connections=Config.LLM_MAX_KEEPALIVE,
+    keepalive_expiry=Config.LLM_KEEPALIVE_EXPIRY
+)
+llm_prewarm_task = None
+
+@app.on_event("startup")
+async def start_llm_http_client():
+    global llm_prewarm_task
+    if Config.LLM_PREWARM:
+        # 后台预建立连接，不阻塞启动
+        api_bases = [conf.get("api_base") for conf in MODEL_CONFIGS.values()] + [DEFAULT_API_BASE]
+        llm_prewarm_task = asyncio.create_task(llm_http_client.prewarm(api_bases))
+
+@app.on_event("shutdown")
+async def stop_llm_http_client():
+    if llm_prewarm_task:
+        llm_prewarm_task.cancel()
+    await llm_http_client.aclose()
 
 # 新增：获取模型配置
 
@@ -216,72 +344,236 @@ def get_model_config(model_name, api_key=None, api_base=None):
     return {
         "api_base": api_base or config.get("api_base", DEFAULT_API_BASE),
         "api_key": api_key or config.get("api_key", DEFAULT_API_KEY),
+        "context_window": config.get("context_window", Config.DEFAULT_CONTEXT_WINDOW),
+        "max_output_tokens": config.get("max_output_tokens", Config.DEFAULT_MAX_OUTPUT_TOKENS),
     }
 
-# 调用大模型API
-async def call_large_model_api(message: str, knowledge_base_1: List, knowledge_base_2: List, model: str, api_key: str, api_base: str) -> Dict[str, Any]:
+# 各类请求期望的回答长度（token），不超过模型的输出上限
+CHAT_OUTPUT_TOKENS = 2000
+QUESTIONS_OUTPUT_TOKENS = 4000
+# 补题请求中列出的每道已有题干的最大字数
+QUESTIONS_AVOID_STEM_CHARS = 40
+
+def get_output_tokens(model: str, wanted: int) -> int:
+    return min(wanted, get_model_config(model)["max_output_tokens"])
+
+def get_context_budget(model: str, output_tokens: int, prompt_tokens: int) -> int:
+    """按模型上下文窗口计算可用于知识库内容的token数"""
+    return context_budget(
+        get_model_config(model)["context_window"], output_tokens, prompt_tokens, Config.MAX_CONTEXT_TOKENS
+    )
+
+# 大模型回答缓存（内存LRU + 磁盘，支持上游失败时返回过期回答）
+response_cache = ResponseCache(
+    Config.LLM_CACHE_DIR,
+    Config.LLM_CACHE_MAX_ENTRIES,
+    Config.LLM_CACHE_TTL,
+    Config.LLM_CACHE_STALE_TTL,
+    enabled=Config.LLM_CACHE_ENABLED,
+    max_disk_entries=Config.LLM_CACHE_MAX_DISK_ENTRIES,
+    max_disk_bytes=Config.LLM_CACHE_MAX_DISK_BYTES
+)
+
+# 并发请求合并：相同的大模型请求 / 相同文件的解析同时只执行一次
+llm_flights = SingleFlight("llm")
+extraction_flights = SingleFlight("extraction")
+
+# 会话级分块检索索引（上传解析完成时增量加入，删除文件时移除）
+session_indexes = SessionIndexRegistry(Config.RETRIEVAL_MAX_SESSIONS, Config.VECTOR_DIM)
+# 不带会话ID的请求按文件内容复用的索引
+anonymous_indexes = SessionIndexRegistry(Config.RETRIEVAL_MAX_ANONYMOUS, Config.VECTOR_DIM)
+
+# 内容相同的文件（如多个学生上传的同一份课件）在所有会话之间共享切块、倒排表、向量和题目解析结果
+shared_segments = SegmentCache(Config.SHARED_ANALYSIS_ENTRIES)
+
+def build_document_segment(content: str) -> DocumentSegment:
+    """切块统计词频、建立倒排表和向量，同时把内容按题库格式切分成结构化题目（非题库文件通常切不出记录）"""
+    return DocumentSegment(
+        analyze_document(content, Config.RETRIEVAL_CHUNK_CHARS), parse_question_bank(content), Config.VECTOR_DIM
+    )
+
+async def index_file_content(index: SessionIndex, file_id: str, file_name: str, content: str):
+    """把文件内容加入索引（引用共享的文档段，内容第一次出现时才构建）；内容未变化时跳过"""
+    fingerprint = (len(content), hash(content))
+    if index.has_file(file_id, fingerprint):
+        return
+    segment = shared_segments.get(fingerprint)
+    if segment is None:
+        loop = asyncio.get_running_loop()
+        segment = await loop.run_in_executor(None, build_document_segment, content)
+        shared_segments.put(fingerprint, segment)
+    index.add_document(file_id, file_name, segment, fingerprint)
+
+def get_session_index(session_id: Optional[str], files: List) -> SessionIndex:
     """
-    调用阶跃星辰大模型API的函数
-    使用您提供的API密钥
+    获取会话的检索索引；没有会话ID时按请求中文件的ID和内容复用匿名索引，
+    不再每个请求新建一个索引（匿名索引单独限量，不挤占会话索引）
     """
-    try:
-        # 新增：知识库为空时直接友好提示
-        if (not knowledge_base_1 or len(knowledge_base_1) == 0) and (not knowledge_base_2 or len(knowledge_base_2) == 0):
-            return {
-                "answer": "知识库为空，请先上传复习资料或题库文件后再提问。",
-                "references": []
-            }
-        
-        # 题号正则（如2-2、2_2、2．2、2.2、2题2小题等）
-        question_no_match = re.search(r'(\d+[\-_.．、]?[\d]+)', message)
-        if question_no_match and knowledge_base_2:
-            qno = question_no_match.group(1)
-            # 在题库内容中查找题号
-            for file in knowledge_base_2:
-                content = file.get('content', '')
-                # 常见题号格式匹配
-                pattern = rf'(题目[\s\S]{{0,20}}{qno}[\s\S]{{0,2000}}?)(答案[\s\S]{{0,1000}}?)(解析[\s\S]{{0,1000}}?)?(---|$)'
-                match = re.search(pattern, content, re.IGNORECASE)
-                if match:
-                    question_part = match.group(1).strip()
-                    answer_part = match.group(2).strip() if match.group(2) else ''
-                    explain_part = match.group(3).strip() if match.group(3) else ''
-                    result = f"【题目内容】\n{question_part}\n\n【答案】\n{answer_part}\n\n【解析】\n{explain_part}"
-                    return {
-                        "answer": result,
-                        "references": [{"file": file.get('name', ''), "content": question_part[:200] + '...'}]
-                    }
-        
-        # 检查是否是询问题库内题目的请求
-        is_question_query = any(keyword in message.lower() for keyword in [
-            '题目', '题', '答案', '解答', '解析', '这道题', '这个题', '第几题'
-        ])
-        
-        # 构建知识库上下文
-        knowledge_context = "\n".join([
-            f"- {file.get('name', 'Unknown')}: {file.get('content', '')[:500]}..."
-            for file in knowledge_base_1
-        ])
-        
-        questions_context = "\n".join([
-            f"- {file.get('name', 'Unknown')}: {file.get('content', '')[:500]}..."
-            for file in knowledge_base_2
-        ])
-        
-        # 根据请求类型构建不同的系统提示词
-        if is_question_query and knowledge_base_2:
-            # 用户询问题库内题目，优先从题库中查找
-            system_prompt = f"""你是一个专业的考试复习助手，专门回答题库中的题目。
+    if session_id:
+        return session_indexes.get(session_id)
+    key = hashlib.sha1(repr(sorted(
+        (str(file.get('id') or file.get('name', '')), len(file.get('content', '')), hash(file.get('content', '')))
+        for file in files
+    )).encode('utf-8')).hexdigest()
+    return anonymous_indexes.get(key)
+
+async def ensure_files_indexed(index: SessionIndex, files: List) -> set:
+    """确保请求中的文件都已加入索引，返回这些文件的ID集合"""
+    file_ids = set()
+    for file in files:
+        file_id = str(file.get('id') or file.get('name', ''))
+        content = file.get('content', '')
+        if content and not content.startswith(EXTRACT_ERROR_PREFIXES):
+            await index_file_content(index, file_id, file.get('name', 'Unknown'), content)
+        file_ids.add(file_id)
+    return file_ids
+
+def format_chunk_line(chunk: Dict[str, Any]) -> str:
+    if chunk.get('label'):
+        return f"- {chunk['file_name']}（{chunk['label']}）: {chunk['text']}"
+    return f"- {chunk['file_name']}: {chunk['text']}"
+
+def chunk_line(chunk: Dict[str, Any]) -> Tuple[str, int]:
+    """块渲染后的文本行及其token数（缓存在块上，同一会话的后续请求不再重复估算）"""
+    cached = chunk.get("rendered")
+    if cached is None:
+        line = format_chunk_line(chunk)
+        cached = chunk["rendered"] = (line, estimate_tokens(line))
+    return cached
+
+async def collect_knowledge_chunks(query: str, files: List, session_id: Optional[str] = None, limit: Optional[int] = None) -> Tuple[List[Tuple[float, Dict[str, Any]]], List[Dict[str, Any]]]:
+    """
+    用BM25和本地向量检索给文本块排序；返回 (按得分排序的最多 limit 个候选 (得分, 块), 这些文件的全部块)
+    """
+    if not files:
+        return [], []
+    index = get_session_index(session_id, files)
+    file_ids = await ensure_files_indexed(index, files)
+    
+    all_chunks = [chunk for file_id in sorted(file_ids) for chunk in index.file_chunks(file_id)]
+    ranked = index.search(query, limit or Config.RETRIEVAL_CANDIDATES, file_ids)
+    if not ranked:
+        # 没有命中任何块时，退回到每个文件的开头部分
+        ranked = [(0.0, chunk) for file_id in sorted(file_ids) for chunk in index.file_chunks(file_id)[:1]]
+    if not ranked:
+        # 无法建立索引的内容（如解析失败的提示）整段参与分配
+        all_chunks = [
+            {"file_id": str(file.get('id') or ''), "file_name": file.get('name', 'Unknown'), "label": "", "text": file.get('content', ''), "position": 0}
+            for file in files
+        ]
+        ranked = [(0.0, chunk) for chunk in all_chunks]
+    return ranked, all_chunks
+
+async def build_knowledge_context_slices(
+    query: str,
+    knowledge_base_1: List,
+    knowledge_base_2: List,
+    session_id: Optional[str],
+    budget_tokens: int,
+    parts: int = 1
+) -> List[Tuple[str, str]]:
+    """
+    把两个知识库分成最多 parts 个切片，每个切片在 budget_tokens 内挑选文本块，返回各切片的 (复习资料上下文, 考试题目上下文)。
+    知识库能整个放进各切片的预算时全部发送，否则按得分从高到低装入与查询最相关的块（候选数随切片数增加）；
+    每个知识库按 (文件ID, 块顺序) 切成token数相近的连续切片，选中的块一律按 (知识库, 文件ID, 块顺序) 排列，
+    使同一会话各轮请求的提示词前缀尽量相同，便于命中上游的前缀缓存
+    """
+    ranked_candidates: Dict[int, List] = {}
+    all_candidates: Dict[int, List] = {}
+    for group, files in ((1, knowledge_base_1), (2, knowledge_base_2)):
+        ranked, all_chunks = await collect_knowledge_chunks(query, files, session_id, Config.RETRIEVAL_CANDIDATES * parts)
+        for target, items in ((ranked_candidates, ranked), (all_candidates, [(0.0, chunk) for chunk in all_chunks])):
+            target[group] = []
+            for score, chunk in items:
+                line, tokens = chunk_line(chunk)
+                target[group].append((score, (group, chunk.get("file_id", ""), chunk.get("position", 0)), line, tokens))
+    total_tokens = sum(tokens + 1 for candidates in all_candidates.values() for _, _, _, tokens in candidates)
+    candidates = all_candidates if total_tokens <= budget_tokens * parts else ranked_candidates
+    # 两个知识库分别切片，第 i 个请求使用两者各自的第 i 段
+    group_slices = {group: split_candidates(items, parts) for group, items in candidates.items()}
+    count = max(1, max(len(slices) for slices in group_slices.values()))
+    contexts = []
+    for i in range(count):
+        selected = [candidate for slices in group_slices.values() if i < len(slices) for candidate in slices[i]]
+        grouped = group_lines(pack_chunks(selected, budget_tokens))
+        contexts.append((grouped.get(1, ""), grouped.get(2, "")))
+    return contexts
+
+async def build_knowledge_contexts(
+    query: str,
+    knowledge_base_1: List,
+    knowledge_base_2: List,
+    session_id: Optional[str],
+    budget_tokens: int
+) -> Tuple[str, str]:
+    """在 budget_tokens 内挑选两个知识库的文本块，返回 (复习资料上下文, 考试题目上下文)"""
+    return (await build_knowledge_context_slices(query, knowledge_base_1, knowledge_base_2, session_id, budget_tokens))[0]
+
+# 所有聊天和出题请求共用的系统提示词：只包含固定说明和按固定顺序排列的知识库内容，
+# 问题、主题等每次不同的内容都放在用户消息中，同一会话的多轮请求前缀相同，可以命中上游的前缀缓存
+SESSION_SYSTEM_PROMPT = """你是一个专业的考试复习助手，基于用户提供的知识库内容回答问题、讲解题库中的题目，以及从题库中提取或基于知识点生成题目。
+
+通用要求：
+1. 基于知识库内容作答，并标注知识库引用
+2. 如果知识库中没有相关信息，请明确说明
+3. 拒绝黄赌毒、暴力恐怖主义等内容
 
 用户的知识库包含以下内容：
 
 **复习资料：**
-{knowledge_context or "暂无复习资料"}
+{knowledge_context}
 
 **考试题目库：**
-{questions_context or "暂无考试题目"}
+{questions_context}"""
 
-用户正在询问题库中的题目，请：
+def build_session_system_prompt(knowledge_context: str, questions_context: str) -> str:
+    return SESSION_SYSTEM_PROMPT.format(
+        knowledge_context=knowledge_context or "暂无复习资料",
+        questions_context=questions_context or "暂无考试题目"
+    )
+
+# 构建聊天提示词
+async def build_chat_prompt(message: str, knowledge_base_1: List, knowledge_base_2: List, session_id: Optional[str] = None, model: str = DEFAULT_MODEL) -> Dict[str, Any]:
+    """
+    构建聊天请求的提示词
+    无需调用大模型即可回答时（知识库为空、命中题库题号）直接返回 answer/references，
+    否则返回 system_prompt/user_message
+    """
+    # 新增：知识库为空时直接友好提示
+    if (not knowledge_base_1 or len(knowledge_base_1) == 0) and (not knowledge_base_2 or len(knowledge_base_2) == 0):
+        return {
+            "answer": "知识库为空，请先上传复习资料或题库文件后再提问。",
+            "references": []
+        }
+    
+    # 题号正则（如2-2、2_2、2．2、2.2、2题2小题等）
+    question_no_match = re.search(r'(\d+[\-_.．、]?[\d]+)', message)
+    if question_no_match and knowledge_base_2:
+        qno = question_no_match.group(1)
+        # 在题库索引中按题号查找（题库文件入库时已切分为结构化题目）
+        index = get_session_index(session_id, knowledge_base_2)
+        file_ids = await ensure_files_indexed(index, knowledge_base_2)
+        hit = index.questions.lookup(qno, file_ids)
+        if hit:
+            file_name, record = hit
+            question_part = record["stem"]
+            result = f"【题目内容】\n{question_part}\n\n【答案】\n{record['answer']}\n\n【解析】\n{record['explanation']}"
+            return {
+                "answer": result,
+                "references": [{"file": file_name, "content": question_part[:200] + '...'}]
+            }
+    
+    # 检查是否是询问题库内题目的请求
+    is_question_query = any(keyword in message.lower() for keyword in [
+        '题目', '题', '答案', '解答', '解析', '这道题', '这个题', '第几题'
+    ])
+    
+    def render(knowledge_context: str, questions_context: str) -> Tuple[str, str]:
+        # 系统提示词对所有请求相同；问题和随请求类型变化的说明放在用户消息中
+        system_prompt = build_session_system_prompt(knowledge_context, questions_context)
+        if is_question_query and knowledge_base_2:
+            # 用户询问题库内题目，优先从题库中查找
+            user_message = f"""用户正在询问题库中的题目，请：
 
 1. **优先从考试题目库中查找相关题目**
 2. **如果找到相关题目，提供完整的题目内容、答案和详细解析**
@@ -296,137 +588,316 @@ async def call_large_model_api(message: str, knowledge_base_1: List, knowledge_b
 - 解题思路
 - 知识库引用
 
-请确保回答准确、详细，并标注知识库引用。"""
+请确保回答准确、详细，并标注知识库引用。
 
-            user_message = f"""用户问题：{message}
+用户问题：{message}
 
 请从我的题库中查找相关题目并提供详细解答。如果题库中没有相关内容，请基于复习资料提供相关知识点的解答。"""
         else:
             # 普通知识问答
-            system_prompt = f"""你是一个专业的考试复习助手，擅长基于用户提供的知识库内容回答问题。
-
-用户的知识库包含以下内容：
-
-**复习资料：**
-{knowledge_context or "暂无复习资料"}
-
-**考试题目：**
-{questions_context or "暂无考试题目"}
-
-请基于以上知识库内容回答用户的问题，并在回答中标注知识库引用。如果知识库中没有相关信息，请明确说明。
+            user_message = f"""请基于以上知识库内容回答用户的问题。
 
 回答要求：
 1. 准确回答用户问题
 2. 基于知识库内容
 3. 标注知识库引用
 4. 如果可能，生成相关的练习题
-5. 拒绝黄赌毒、暴力恐怖主义等内容"""
 
-            user_message = f"用户问题：{message}\n\n请基于我的知识库内容回答这个问题，并在回答中标注知识库引用。"
-        
-        # 获取模型配置，兼容前端未传递时用后端默认
-        model_conf = get_model_config(model, api_key, api_base)
-        real_api_key = model_conf["api_key"]
-        real_api_base = model_conf["api_base"]
-        print(f"[call_large_model_api] 调用API: url={real_api_base}/chat/completions, model={model}, api_key={real_api_key[:8]}")
-        print(f"API密钥: {real_api_key[:10]}...")
-        print(f"模型: {model}")
-        
-        # 调用阶跃星辰API
-        completion = requests.post(
-            f"{real_api_base}/chat/completions",
-            headers={"Authorization": f"Bearer {real_api_key}"},
-            json={
+用户问题：{message}
+
+请基于我的知识库内容回答这个问题，并在回答中标注知识库引用。"""
+        return system_prompt, user_message
+    
+    # 构建知识库上下文：按模型窗口扣除提示词和回答预留后，装入与问题最相关的文本块
+    template_tokens = sum(estimate_tokens(text) for text in render("", ""))
+    budget = get_context_budget(model, get_output_tokens(model, CHAT_OUTPUT_TOKENS), template_tokens)
+    system_prompt, user_message = render(*await build_knowledge_contexts(
+        message, knowledge_base_1, knowledge_base_2, session_id, budget
+    ))
+    
+    return {
+        "system_prompt": system_prompt,
+        "user_message": user_message
+    }
+
+def build_references_text(answer: str, knowledge_base_1: List, knowledge_base_2: List) -> str:
+    """根据回答中出现的文件名生成知识库引用附录（拼接为字符串，避免前端显示 [object Object]）"""
+    references = []
+    for file in knowledge_base_1 + knowledge_base_2:
+        if file.get('name', '') in answer:
+            references.append({
+                "file": file.get('name', ''),
+                "content": file.get('content', '')[:200] + "..."
+            })
+    if not references:
+        return ""
+    references_text = "\n\n【知识库引用】\n"
+    for ref in references:
+        references_text += f"- {ref['file']}: {ref['content']}\n"
+    return references_text
+
+# 请求大模型聊天接口
+async def request_chat_answer(system_prompt: str, user_message: str, model: str, api_key: str, api_base: str) -> str:
+    """调用上游 chat/completions 并返回回答文本，失败时抛出异常"""
+    # 获取模型配置，兼容前端未传递时用后端默认
+    model_conf = get_model_config(model, api_key, api_base)
+    real_api_key = model_conf["api_key"]
+    real_api_base = model_conf["api_base"]
+    upstream_log.debug("调用上游", kind="chat", api_base=real_api_base, model=model)
+    
+    # 调用大模型API（共享连接池，不阻塞事件循环）
+    with track_llm_request(model, "chat"):
+        completion = await llm_http_client.post_chat_completions(
+            real_api_base,
+            real_api_key,
+            {
                 "model": model,
                 "messages": [
                     {"role": "system", "content": system_prompt},
                     {"role": "user", "content": user_message}
                 ],
-                "max_tokens": 2000,
+                "max_tokens": get_output_tokens(model, CHAT_OUTPUT_TOKENS),
                 "temperature": 0.7
             },
-            timeout=60
+            timeout=Config.LLM_CHAT_TIMEOUT
         )
         
-        print(f"API响应状态码: {completion.status_code}")
-        
         if completion.status_code != 200:
-            print(f"API调用失败，状态码: {completion.status_code}")
-            print(f"响应内容: {completion.text}")
+            upstream_log.warning("上游返回错误状态码", kind="chat", model=model, status=completion.status_code, body=completion.text)
             raise Exception(f"API调用失败，状态码: {completion.status_code}")
         
         # 提取回答
         response_data = completion.json()
-        print(f"API响应数据: {response_data}")
-        # 更严格的健壮性校验，防止 NoneType 报错
-        if not response_data or not isinstance(response_data, dict):
-            raise Exception(f"API响应为空或非字典: {response_data}")
-        if "choices" not in response_data or not isinstance(response_data["choices"], list) or not response_data["choices"]:
-            raise Exception(f"API响应格式异常: {response_data}")
-        if "message" not in response_data["choices"][0] or "content" not in response_data["choices"][0]["message"]:
-            raise Exception(f"API响应内容缺失: {response_data}")
-        answer = response_data["choices"][0]["message"]["content"]
+    if isinstance(response_data, dict):
+        record_llm_usage(model, response_data.get("usage"))
+    upstream_log.debug("上游响应", kind="chat", model=model, response=response_data)
+    # 更严格的健壮性校验，防止 NoneType 报错
+    if not response_data or not isinstance(response_data, dict):
+        raise Exception(f"API响应为空或非字典: {response_data}")
+    if "choices" not in response_data or not isinstance(response_data["choices"], list) or not response_data["choices"]:
+        raise Exception(f"API响应格式异常: {response_data}")
+    if "message" not in response_data["choices"][0] or "content" not in response_data["choices"][0]["message"]:
+        raise Exception(f"API响应内容缺失: {response_data}")
+    answer = response_data["choices"][0]["message"]["content"]
+    return answer
+
+# 调用大模型API
+async def call_large_model_api(message: str, knowledge_base_1: List, knowledge_base_2: List, model: str, api_key: str, api_base: str, session_id: Optional[str] = None) -> Dict[str, Any]:
+    """
+    调用阶跃星辰大模型API的函数
+    使用您提供的API密钥
+    """
+    cache_key = None
+    try:
+        prompt = await build_chat_prompt(message, knowledge_base_1, knowledge_base_2, session_id, model)
+        if "answer" in prompt:
+            return prompt
+        system_prompt = prompt["system_prompt"]
+        user_message = prompt["user_message"]
+        
+        # 相同模型、相同问题、相同知识库内容的回答直接从缓存返回
+        cache_key = response_cache.make_key("chat", model, message, knowledge_base_1 + knowledge_base_2)
+        cached = response_cache.get(cache_key)
+        if cached is not None:
+            return cached
         
-        # 提取引用（简单解析）
+        # 相同请求并发到达时只调用一次上游，其余请求等待同一个结果
+        answer = await llm_flights.do(
+            cache_key,
+            lambda: request_chat_answer(system_prompt, user_message, model, api_key, api_base)
+        )
+        
+        # 提取引用（简单解析）并拼接到回答末尾
+        answer += build_references_text(answer, knowledge_base_1, knowledge_base_2)
         references = []
-        for file in knowledge_base_1 + knowledge_base_2:
-            if file.get('name', '') in answer:
-                references.append({
-                    "file": file.get('name', ''),
-                    "content": file.get('content', '')[:200] + "..."
-                })
-        # 优化：拼接引用为字符串，避免 [object Object]
-        if references:
-            references_text = "\n\n【知识库引用】\n"
-            for ref in references:
-                references_text += f"- {ref['file']}: {ref['content']}\n"
-            answer += references_text
-            references = []
         
-        return {
+        result = {
             "answer": answer,
             "references": references
         }
+        response_cache.put(cache_key, result)
+        return result
         
     except Exception as e:
-        print(f"API调用失败: {e}")
-        print(f"错误类型: {type(e)}")
-        import traceback
-        print(f"错误堆栈: {traceback.format_exc()}")
+        # 上游失败时优先返回过期的缓存回答
+        stale = response_cache.get_stale(cache_key) if cache_key else None
+        upstream_log.error("聊天调用失败", exc_info=True, model=model, error_type=type(e).__name__, served_stale=stale is not None)
+        if stale is not None:
+            return stale
         # 如果API调用失败，返回错误信息而不是默认提示
         return {
             "answer": f"抱歉，AI服务调用失败: {str(e)}。请检查网络连接或稍后重试。",
             "references": []
         }
 
-# 调用大模型API生成题目
-async def call_large_model_for_questions(topic: str, difficulty: str, count: int, question_type: str, knowledge_base_1: List, knowledge_base_2: List, model: str, api_key: str, api_base: str) -> Dict[str, Any]:
+def format_sse(event: str, data: Dict[str, Any]) -> str:
+    """格式化一条Server-Sent Events消息"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+# 流式调用大模型API
+async def stream_large_model_api(message: str, knowledge_base_1: List, knowledge_base_2: List, model: str, api_key: str, api_base: str, session_id: Optional[str] = None):
     """
-    调用阶跃星辰大模型API生成题目的函数
-    优先从考试题目知识库中提取题目，或基于知识点生成同类型题目
+    以SSE形式转发上游的流式回答
+    事件依次为：若干 delta（回答片段）、references（知识库引用附录）、done；出错时发送 error
     """
+    cache_key = None
+    answer = ""
     try:
-        # 构建知识库上下文
-        knowledge_context = "\n".join([
-            f"- {file.get('name', 'Unknown')}: {file.get('content', '')[:500]}..."
-            for file in knowledge_base_1
-        ])
+        prompt = await build_chat_prompt(message, knowledge_base_1, knowledge_base_2, session_id, model)
+        if "answer" in prompt:
+            yield format_sse("delta", {"content": prompt["answer"]})
+            yield format_sse("done", {})
+            return
         
-        questions_context = "\n".join([
-            f"- {file.get('name', 'Unknown')}: {file.get('content', '')[:500]}..."
-            for file in knowledge_base_2
-        ])
+        cache_key = response_cache.make_key("chat", model, message, knowledge_base_1 + knowledge_base_2)
+        cached = response_cache.get(cache_key)
+        if cached is not None:
+            yield format_sse("delta", {"content": cached["answer"]})
+            yield format_sse("done", {})
+            return
         
-        # 构建系统提示词 - 优先从考试题目库提取题目
-        system_prompt = f"""你是一个专业的考试题目助手，擅长从考试题目库中提取题目或基于知识点生成同类型题目。
+        model_conf = get_model_config(model, api_key, api_base)
+        real_api_key = model_conf["api_key"]
+        real_api_base = model_conf["api_base"]
+        upstream_log.debug("调用上游", kind="chat_stream", api_base=real_api_base, model=model)
+        
+        start = time.perf_counter()
+        with track_llm_request(model, "chat_stream"):
+            async for chunk in llm_http_client.stream_chat_completions(
+                real_api_base,
+                real_api_key,
+                {
+                    "model": model,
+                    "messages": [
+                        {"role": "system", "content": prompt["system_prompt"]},
+                        {"role": "user", "content": prompt["user_message"]}
+                    ],
+                    "max_tokens": get_output_tokens(model, CHAT_OUTPUT_TOKENS),
+                    "temperature": 0.7
+                },
+                timeout=Config.LLM_CHAT_TIMEOUT
+            ):
+                # 部分上游在最后一个片段中附带 usage
+                record_llm_usage(model, chunk.get("usage"))
+                choices = chunk.get("choices") or []
+                if not choices:
+                    continue
+                content = (choices[0].get("delta") or {}).get("content")
+                if content:
+                    if not answer:
+                        llm_time_to_first_token.observe(time.perf_counter() - start, model=model)
+                    answer += content
+                    yield format_sse("delta", {"content": content})
+        
+        # 知识库引用附录作为最后一个事件发送
+        references_text = build_references_text(answer, knowledge_base_1, knowledge_base_2)
+        if references_text:
+            yield format_sse("references", {"content": references_text})
+        yield format_sse("done", {})
+        if answer:
+            response_cache.put(cache_key, {"answer": answer + references_text, "references": []})
+    
+    except Exception as e:
+        # 已经发出部分回答时不能再补发完整的过期回答，否则客户端会收到两份回答
+        stale = response_cache.get_stale(cache_key) if cache_key and not answer else None
+        upstream_log.error("流式聊天调用失败", model=model, error=str(e), served_stale=stale is not None, streamed_chars=len(answer))
+        if stale is not None:
+            yield format_sse("delta", {"content": stale["answer"]})
+            yield format_sse("done", {})
+            return
+        yield format_sse("error", {"message": f"抱歉，AI服务调用失败: {str(e)}。请检查网络连接或稍后重试。"})
 
-用户的知识库包含以下内容：
+# 调用大模型API生成题目
+def question_batch_counts(count: int) -> List[int]:
+    """把题目数平均分给各子请求，每个子请求不超过 QUESTIONS_BATCH_SIZE 道"""
+    batch_size = max(1, Config.QUESTIONS_BATCH_SIZE)
+    batches = max(1, -(-count // batch_size))
+    base, extra = divmod(count, batches)
+    return [base + 1] * extra + [base] * (batches - extra)
+
+def parse_questions_json(response_text: str) -> Optional[Dict[str, Any]]:
+    """从回答中截取JSON部分并解析，失败时返回None"""
+    start_idx = response_text.find('{')
+    end_idx = response_text.rfind('}') + 1
+    if start_idx == -1 or end_idx == 0:
+        return None
+    try:
+        result = json.loads(response_text[start_idx:end_idx])
+    except ValueError:
+        return None
+    if not isinstance(result, dict) or not isinstance(result.get("questions", []), list):
+        return None
+    return result
+
+def merge_question_batches(results: List[Dict[str, Any]], count: int, duplicates: NearDuplicateFilter, questions: List, source_types: List[str]) -> Dict[str, Any]:
+    """按子请求顺序把题目追加到 questions 中，过滤题干近似重复的题目，最多保留 count 道"""
+    for result in results:
+        source_type = result.get("source_type")
+        if source_type and source_type not in source_types:
+            source_types.append(source_type)
+        for question in result.get("questions", []):
+            if len(questions) >= count:
+                break
+            stem = question.get("question", "") if isinstance(question, dict) else question
+            if duplicates.add(str(stem)):
+                questions.append(question)
+            else:
+                questions_near_duplicates.inc()
+    return {
+        "questions": questions,
+        "total": len(questions),
+        "source_type": "、".join(source_types) or "未知"
+    }
 
-**复习资料：**
-{knowledge_context or "暂无复习资料"}
+def question_stem_preview(question: Any) -> str:
+    """补题请求中列出的已有题干（截断）"""
+    stem = str(question.get("question", "") if isinstance(question, dict) else question)
+    return stem[:QUESTIONS_AVOID_STEM_CHARS]
 
-**考试题目库：**
-{questions_context or "暂无考试题目"}
+async def call_large_model_for_questions(topic: str, difficulty: str, count: int, question_type: str, knowledge_base_1: List, knowledge_base_2: List, model: str, api_key: str, api_base: str, session_id: Optional[str] = None) -> Dict[str, Any]:
+    """
+    调用阶跃星辰大模型API生成题目的函数
+    优先从考试题目知识库中提取题目，或基于知识点生成同类型题目
+    """
+    cache_key = None
+    try:
+        # 题库中已有足够多与主题相关的题目时，直接从题库索引返回，无需调用大模型
+        if knowledge_base_2 and topic:
+            index = get_session_index(session_id, knowledge_base_2)
+            file_ids = await ensure_files_indexed(index, knowledge_base_2)
+            extracted = index.questions.search_by_topic(topic, count, file_ids)
+            if len(extracted) >= count:
+                return {
+                    "questions": [
+                        {
+                            "question": record["stem"],
+                            "answer": strip_label(record["answer"]),
+                            "explanation": strip_label(record["explanation"]),
+                            "difficulty": difficulty,
+                            "type": question_type,
+                            "references": [f"{file_name} (第{record['page']}页)" if record["page"] else file_name],
+                            "source": "extracted"
+                        }
+                        for file_name, record in extracted
+                    ],
+                    "total": len(extracted),
+                    "source_type": "从题目库提取"
+                }
+        
+        cache_key = response_cache.make_key(
+            "questions", model, f"{topic}|{difficulty}|{count}|{question_type}", knowledge_base_1 + knowledge_base_2
+        )
+        cached = response_cache.get(cache_key)
+        if cached is not None:
+            return cached
+        
+        def render(knowledge_context: str, questions_context: str, batch_count: int = count, sliced: bool = False, avoid: Sequence[str] = ()) -> Tuple[str, str]:
+            # 系统提示词与聊天共用，出题要求放在用户消息中
+            system_prompt = build_session_system_prompt(knowledge_context, questions_context)
+            scope_note = "\n8. 只围绕上面提供的知识库片段出题，不要编造片段以外的内容" if sliced else ""
+            if avoid:
+                scope_note += f"\n{9 if sliced else 8}. 不要与以下已有题目重复或只是换个问法：\n" + "\n".join(f"   - {stem}" for stem in avoid)
+            user_message = f"""请为"{topic}"生成{batch_count}道{difficulty}难度的{question_type}题目。
 
 请按照以下优先级处理：
 
@@ -436,11 +907,11 @@ async def call_large_model_for_questions(topic: str, difficulty: str, count: int
 题目要求：
 1. 题目类型：{question_type}
 2. 难度级别：{difficulty}
-3. 数量：{count}道题目
+3. 数量：{batch_count}道题目
 4. 基于知识库内容
 5. 包含详细答案和解释
 6. 标注知识库引用
-7. 拒绝黄赌毒、暴力恐怖主义等内容
+7. 每道题都要标注来源（提取自题目库 或 基于知识点生成）{scope_note}
 
 请以JSON格式返回，格式如下：
 {{
@@ -455,69 +926,119 @@ async def call_large_model_for_questions(topic: str, difficulty: str, count: int
             "source": "extracted" 或 "generated"
         }}
     ],
-    "total": {count},
+    "total": {batch_count},
     "source_type": "从题目库提取" 或 "基于知识点生成"
 }}"""
-
-        # 构建用户消息
-        user_message = f"""请为"{topic}"生成{count}道{difficulty}难度的{question_type}题目。
-
-要求：
-1. 优先从考试题目库中提取相关题目
-2. 如果没有直接相关题目，请基于复习资料中的知识点，参考题目库的题型风格生成同类型题目
-3. 每道题都要标注来源（提取自题目库 或 基于知识点生成）
-4. 包含详细答案和解释"""
-
+            return system_prompt, user_message
+        
+        # 题目较多时拆分为多个子请求，每个子请求使用知识库的不同切片，并发生成后合并去重
+        batch_counts = question_batch_counts(count)
+        sliced = len(batch_counts) > 1
+        # 构建知识库上下文：按模型窗口扣除提示词和回答预留后，装入与主题最相关的文本块
+        output_tokens = get_output_tokens(model, QUESTIONS_OUTPUT_TOKENS)
+        # 按补题请求（列出全部已有题干）预留提示词的token
+        placeholder_stems = ["题" * QUESTIONS_AVOID_STEM_CHARS] * count if Config.QUESTIONS_TOPUP_ROUNDS > 0 else []
+        template_tokens = sum(estimate_tokens(text) for text in render("", "", max(batch_counts), sliced, placeholder_stems))
+        contexts = await build_knowledge_context_slices(
+            topic, knowledge_base_1, knowledge_base_2, session_id,
+            get_context_budget(model, output_tokens, template_tokens), len(batch_counts)
+        )
+        # 知识库切片少于子请求数时循环使用
+        prompts = [
+            render(*contexts[i % len(contexts)], batch_count, sliced)
+            for i, batch_count in enumerate(batch_counts)
+        ]
+        
         # 获取模型配置，兼容前端未传递时用后端默认
         model_conf = get_model_config(model, api_key, api_base)
         real_api_key = model_conf["api_key"]
         real_api_base = model_conf["api_base"]
-        print(f"[call_large_model_for_questions] 调用API: url={real_api_base}/chat/completions, model={model}, api_key={real_api_key[:8]}")
-        completion = requests.post(
-            f"{real_api_base}/chat/completions",
-            headers={"Authorization": f"Bearer {real_api_key}"},
-            json={
-                "model": model,
-                "messages": [
-                    {
-                        "role": "system",
-                        "content": system_prompt
-                    },
-                    {
-                        "role": "user", 
-                        "content": user_message
-                    }
-                ],
-                "max_tokens": 4000,
-                "temperature": 0.7
-            }
-        )
+        upstream_log.debug("调用上游", kind="questions", api_base=real_api_base, model=model, batches=len(prompts))
+        semaphore = asyncio.Semaphore(max(1, Config.QUESTIONS_MAX_CONCURRENCY))
         
-        # 提取回答
-        response_text = completion.json()["choices"][0]["message"]["content"]
+        async def request_batch(batch: str, system_prompt: str, user_message: str) -> Optional[Dict[str, Any]]:
+            async def request_questions_text() -> str:
+                async with semaphore:
+                    with track_llm_request(model, "questions"):
+                        completion = await llm_http_client.post_chat_completions(
+                            real_api_base,
+                            real_api_key,
+                            {
+                                "model": model,
+                                "messages": [
+                                    {
+                                        "role": "system",
+                                        "content": system_prompt
+                                    },
+                                    {
+                                        "role": "user", 
+                                        "content": user_message
+                                    }
+                                ],
+                                "max_tokens": output_tokens,
+                                "temperature": 0.7
+                            },
+                            timeout=Config.LLM_QUESTIONS_TIMEOUT
+                        )
+                        response_data = completion.json()
+                        text = response_data["choices"][0]["message"]["content"]
+                record_llm_usage(model, response_data.get("usage"))
+                return text
+            
+            try:
+                # 相同请求并发到达时只调用一次上游
+                response_text = await llm_flights.do(f"{cache_key}:{batch}", request_questions_text)
+            except Exception as e:
+                upstream_log.error("题目生成子请求失败", model=model, batch=batch, error=str(e))
+                return None
+            result = parse_questions_json(response_text)
+            if result is None:
+                upstream_log.warning("题目JSON解析失败", model=model, batch=batch, response=response_text)
+            return result
         
-        # 尝试解析JSON
-        try:
-            # 查找JSON部分
-            start_idx = response_text.find('{')
-            end_idx = response_text.rfind('}') + 1
-            if start_idx != -1 and end_idx != 0:
-                json_str = response_text[start_idx:end_idx]
-                result = json.loads(json_str)
-                return {
-                    "questions": result.get("questions", []),
-                    "total": len(result.get("questions", [])),
-                    "source_type": result.get("source_type", "未知")
-                }
-        except:
-            pass
+        results = await asyncio.gather(*(request_batch(str(batch), *prompt) for batch, prompt in enumerate(prompts)))
+        parsed = [result for result in results if result is not None]
+        if parsed:
+            duplicates = NearDuplicateFilter(Config.QUESTIONS_DUPLICATE_SIMILARITY)
+            questions, source_types = [], []
+            questions_result = merge_question_batches(parsed, count, duplicates, questions, source_types)
+            # 去重或子请求失败导致题目不足时补题，每轮换用后面的知识库切片并列出已有题目，最多 QUESTIONS_TOPUP_ROUNDS 轮
+            for topup in range(1, Config.QUESTIONS_TOPUP_ROUNDS + 1):
+                missing = count - questions_result["total"]
+                if missing <= 0:
+                    break
+                questions_topups.inc()
+                avoid = [question_stem_preview(question) for question in questions]
+                offset = topup * len(prompts)
+                topup_prompts = [
+                    render(*contexts[(offset + i) % len(contexts)], batch_count, sliced, avoid)
+                    for i, batch_count in enumerate(question_batch_counts(missing))
+                ]
+                topup_results = await asyncio.gather(
+                    *(request_batch(f"topup{topup}-{batch}", *prompt) for batch, prompt in enumerate(topup_prompts))
+                )
+                questions_result = merge_question_batches(
+                    [result for result in topup_results if result is not None], count, duplicates, questions, source_types
+                )
+            if questions_result["total"] < count:
+                upstream_log.warning("补题后题目仍不足", model=model, wanted=count, got=questions_result["total"])
+            else:
+                # 题目数不足时不写入缓存
+                response_cache.put(cache_key, questions_result)
+            return questions_result
         
-        # 如果JSON解析失败，使用模拟响应
-        print("JSON解析失败，使用模拟响应")
+        # 所有子请求都失败时，优先返回过期的缓存结果，否则使用模拟响应
+        stale = response_cache.get_stale(cache_key)
+        if stale is not None:
+            return stale
+        upstream_log.warning("题目生成失败，使用模拟响应", model=model)
         return await mock_questions_response(topic, difficulty, count, question_type, knowledge_base_1, knowledge_base_2)
         
     except Exception as e:
-        print(f"题目生成API调用失败: {e}")
+        upstream_log.error("题目生成调用失败", model=model, error=str(e))
+        stale = response_cache.get_stale(cache_key) if cache_key else None
+        if stale is not None:
+            return stale
         # 如果API调用失败，返回模拟响应
         return await mock_questions_response(topic, difficulty, count, question_type, knowledge_base_1, knowledge_base_2)
 
@@ -616,110 +1137,244 @@ async def mock_questions_response(topic: str, difficulty: str, count: int, quest
         "source_type": source_type
     }
 
+# 文件解析进程池：解析在子进程中进行，不阻塞事件循环
+parser_pool = ParserPool(Config.PARSE_WORKERS, Config.PARSE_MAX_CONCURRENCY, Config.PDF_PAGES_PER_TASK)
+
 # 文件内容解析函数
-async def extract_file_content(file_path: str, file_type: str) -> str:
-    """提取文件内容，并标注页码或章节信息"""
+async def extract_file_content(file_path: str, file_type: str, progress: Optional[Callable[[int, int], None]] = None) -> str:
+    """提取文件内容，并标注页码或章节信息；progress(已完成, 总数) 用于汇报解析进度"""
     try:
         if not os.path.exists(file_path):
             return f"文件不存在: {file_path}"
-        if file_type == "application/pdf":
-            # 提取PDF内容，按页分割并标注页码
-            try:
-                with open(file_path, 'rb') as file:
-                    pdf_reader = PyPDF2.PdfReader(file)
-                    content = ""
-                    for i, page in enumerate(pdf_reader.pages):
-                        page_text = page.extract_text()
-                        if page_text:
-                            try:
-                                page_text = page_text.encode('utf-8', errors='ignore').decode('utf-8')
-                                content += f"【第{i+1}页】\n" + page_text + "\n"
-                            except UnicodeError:
-                                continue
-                    return content.strip()
-            except Exception as e:
+        start = time.perf_counter()
+        page_count = 0
+
+        def on_progress(done: int, total: int):
+            nonlocal page_count
+            page_count = total
+            if progress:
+                progress(done, total)
+
+        try:
+            content = await parser_pool.extract(file_path, file_type, on_progress)
+            extraction_duration.observe(
+                time.perf_counter() - start,
+                file_type=extraction_type_label(file_type),
+                pages=page_bucket(page_count) if file_type == PDF_TYPE else "n/a"
+            )
+            return content
+        except Exception as e:
+            if file_type == PDF_TYPE:
                 return f"PDF解析失败: {str(e)}"
-        elif file_type == "application/vnd.openxmlformats-officedocument.wordprocessingml.document":
-            # 提取DOCX内容，尝试分章节
-            try:
-                doc = Document(file_path)
-                content = ""
-                current_section = ""
-                for paragraph in doc.paragraphs:
-                    text = paragraph.text
-                    if text:
-                        try:
-                            text = text.encode('utf-8', errors='ignore').decode('utf-8')
-                        except UnicodeError:
-                            continue
-                        # 检查是否为章节标题
-                        if re.match(r"^第[0-9一二三四五六七八九十]+章", text) or re.match(r"^[0-9]+(\\.[0-9]+)+", text):
-                            current_section = text.strip()
-                            content += f"\n【{current_section}】\n"
-                        else:
-                            if current_section:
-                                content += f"[{current_section}] "
-                            content += text + "\n"
-                return content.strip()
-            except Exception as e:
+            elif file_type == DOCX_TYPE:
                 return f"DOCX解析失败: {str(e)}"
-        elif file_type in ["text/plain", "text/markdown"]:
-            # 提取文本文件内容，尝试分章节
-            try:
-                async with aiofiles.open(file_path, 'r', encoding='utf-8', errors='ignore') as file:
-                    raw_content = await file.read()
-                content = ""
-                lines = raw_content.splitlines()
-                current_section = ""
-                for line in lines:
-                    line = line.strip()
-                    if not line:
-                        continue
-                    # 检查是否为章节标题
-                    if re.match(r"^第[0-9一二三四五六七八九十]+章", line) or re.match(r"^[0-9]+(\\.[0-9]+)+", line):
-                        current_section = line
-                        content += f"\n【{current_section}】\n"
-                    else:
-                        if current_section:
-                            content += f"[{current_section}] "
-                        content += line + "\n"
-                return content.strip()
-            except Exception as e:
-                try:
-                    async with aiofiles.open(file_path, 'r', encoding='gbk', errors='ignore') as file:
-                        raw_content = await file.read()
-                    content = ""
-                    lines = raw_content.splitlines()
-                    current_section = ""
-                    for line in lines:
-                        line = line.strip()
-                        if not line:
-                            continue
-                        if re.match(r"^第[0-9一二三四五六七八九十]+章", line) or re.match(r"^[0-9]+(\\.[0-9]+)+", line):
-                            current_section = line
-                            content += f"\n【{current_section}】\n"
-                        else:
-                            if current_section:
-                                content += f"[{current_section}] "
-                            content += line + "\n"
-                    return content.strip()
-                except:
-                    return f"文本文件解析失败: {str(e)}"
-        else:
-            # 其他类型
-            try:
-                with open(file_path, 'rb') as file:
-                    binary_content = file.read()
-                    try:
-                        return binary_content.decode('utf-8', errors='ignore').strip()
-                    except:
-                        return f"无法解析文件内容: {os.path.basename(file_path)}"
-            except Exception as e:
+            elif file_type in TEXT_TYPES:
+                return f"文本文件解析失败: {str(e)}"
+            else:
                 return f"文件读取失败: {str(e)}"
     except Exception as e:
-        print(f"文件内容提取失败 {file_path}: {e}")
+        files_log.error("文件内容提取失败", path=file_path, error=str(e))
         return f"文件内容提取失败: {str(e)}"
 
+# 解析器版本：修改 extract_file_content 或规范化规则的输出格式时需要递增，使旧缓存自动失效
+EXTRACTOR_VERSION = "2"
+
+# extract_file_content 失败时返回的提示前缀，这类结果不写入缓存
+EXTRACT_ERROR_PREFIXES = (
+    "文件不存在",
+    "PDF解析失败",
+    "DOCX解析失败",
+    "文本文件解析失败",
+    "无法解析文件内容",
+    "文件读取失败",
+    "文件内容提取失败",
+)
+
+parse_cache = ParseCache(Config.PARSE_CACHE_DIR, Config.PARSE_CACHE_MAX_BYTES, EXTRACTOR_VERSION)
+
+CONTROL_CHARS_RE = re.compile(r'[\x00-\x08\x0b\x0c\x0e-\x1f\x7f]')
+TRAILING_SPACES_RE = re.compile(r'[ \t\u3000]+$', re.MULTILINE)
+BLANK_LINES_RE = re.compile(r'\n{3,}')
+
+def normalize_extracted_text(content: str) -> str:
+    """规范化提取出的文本：统一换行符，去除控制字符和行尾空白，合并多余空行"""
+    content = content.replace('\r\n', '\n').replace('\r', '\n')
+    content = CONTROL_CHARS_RE.sub('', content)
+    content = TRAILING_SPACES_RE.sub('', content)
+    content = BLANK_LINES_RE.sub('\n\n', content)
+    return content.strip()
+
+def get_parse_cache_key(file_path: str, file_type: str, content_ref: Optional[Dict[str, Any]] = None) -> Optional[str]:
+    """获取文件对应的解析缓存键，文件无法读取时返回None；content_ref 为会话记录中保存的内容引用"""
+    try:
+        return parse_cache.make_key(parse_cache.file_hash(file_path, content_ref), file_type)
+    except OSError as e:
+        files_log.warning("计算文件哈希失败", path=file_path, error=str(e))
+        return None
+
+async def extract_file_content_cached(
+    file_path: str,
+    file_type: str,
+    progress: Optional[Callable[[int, int], None]] = None,
+    content_ref: Optional[Dict[str, Any]] = None
+) -> str:
+    """带磁盘缓存的文件内容提取，文件内容不变时直接返回上次的解析结果"""
+    if not os.path.exists(file_path):
+        return f"文件不存在: {file_path}"
+    cache_key = get_parse_cache_key(file_path, file_type, content_ref)
+    if cache_key:
+        content = parse_cache.get(cache_key)
+        parse_cache_lookups.inc(result="miss" if content is None else "hit")
+        if content is not None:
+            return content
+    
+    async def extract_and_store() -> str:
+        content = await extract_file_content(file_path, file_type, progress)
+        if content.startswith(EXTRACT_ERROR_PREFIXES):
+            return content
+        content = normalize_extracted_text(content)
+        if cache_key:
+            parse_cache.put(cache_key, content)
+        return content
+
+    if not cache_key:
+        return await extract_and_store()
+    # 同一文件被并发请求（如上传后的后台解析与前端读取同时到达）时只解析一次
+    return await extraction_flights.do(cache_key, extract_and_store)
+
+PAGE_RANGE_RE = re.compile(r'^\s*(\d+)\s*(?:-\s*(\d+)\s*)?$')
+PAGE_MARKER_LINE_RE = re.compile(r'^【第(\d+)页】$', re.MULTILINE)
+# 在解析缓存的映射字节上直接查找页码标注
+PAGE_MARKER_LINE_BYTES_RE = re.compile(PAGE_MARKER_LINE_RE.pattern.encode('utf-8'), re.MULTILINE)
+
+def parse_page_range(pages: str) -> Tuple[int, int]:
+    """解析 "3-5" / "3" 形式的页码范围（从1开始，包含两端）"""
+    match = PAGE_RANGE_RE.match(pages or "")
+    if not match:
+        raise ValueError(f"页码范围格式错误: {pages}")
+    first = int(match.group(1))
+    last = int(match.group(2) or first)
+    if first < 1 or last < first:
+        raise ValueError(f"页码范围无效: {pages}")
+    return first, last
+
+def find_page_offsets(view: MappedText) -> Dict[int, Tuple[int, int]]:
+    """在全文缓存的映射上查找【第N页】标注，返回 页码 -> 该页的字节区间 (起, 止)"""
+    markers = view.find_all(PAGE_MARKER_LINE_BYTES_RE)
+    return {
+        int(page): (start, markers[i + 1][0] if i + 1 < len(markers) else view.size)
+        for i, (start, page) in enumerate(markers)
+    }
+
+async def get_pdf_page_count(file_info: Dict[str, Any]) -> Optional[int]:
+    """PDF页数（结果写入解析缓存），文件无法读取时返回None"""
+    cache_key = get_parse_cache_key(file_info["path"], file_info["type"], file_info.get("content_ref"))
+    if not cache_key:
+        return None
+    count_key = f"{cache_key}-pages"
+    cached = parse_cache.get(count_key)
+    if cached:
+        return int(cached)
+    page_count = await parser_pool.count_pdf_pages(file_info["path"])
+    parse_cache.put(count_key, str(page_count))
+    return page_count
+
+async def extract_pdf_pages_cached(file_info: Dict[str, Any], first: int, last: int) -> List[Dict[str, Any]]:
+    """
+    只提取PDF第 first 到 last 页（从1开始），逐页缓存；
+    整个文件已解析过时按页码的字节区间只解码全文缓存中对应的页
+    """
+    cache_key = get_parse_cache_key(file_info["path"], file_info["type"], file_info.get("content_ref"))
+    page_keys = {page: f"{cache_key}-p{page}" for page in range(first, last + 1)}
+    texts: Dict[int, str] = {}
+    view = parse_cache.get_view(cache_key) if cache_key else None
+    if view is not None:
+        # 各页的字节区间只在第一次按页读取时查找，之后从解析缓存读取
+        offsets_key = f"{cache_key}-page-offsets"
+        stored_offsets = parse_cache.get(offsets_key)
+        if stored_offsets:
+            offsets = {int(page): (span[0], span[1]) for page, span in json.loads(stored_offsets).items()}
+        else:
+            offsets = find_page_offsets(view)
+        texts = {page: view.text(*offsets[page]).strip() if page in offsets else "" for page in page_keys}
+        if not stored_offsets:
+            # 解码完成后再写入：写入可能触发淘汰并关闭映射
+            parse_cache.put(offsets_key, json.dumps(offsets))
+    elif cache_key:
+        for page, page_key in page_keys.items():
+            cached = parse_cache.get(page_key)
+            if cached is not None:
+                texts[page] = cached
+    
+    missing = [page for page in page_keys if page not in texts]
+    if missing:
+        start = time.perf_counter()
+        extracted = await parser_pool.extract_pdf_range(file_info["path"], missing[0] - 1, missing[-1])
+        extraction_duration.observe(
+            time.perf_counter() - start, file_type="pdf_pages", pages=page_bucket(missing[-1] - missing[0] + 1)
+        )
+        extracted_texts = {page: normalize_extracted_text(text) for page, text in extracted}
+        for page in missing:
+            # 没有文字的页（如扫描页）也缓存为空文本，避免重复解析
+            texts[page] = extracted_texts.get(page, "")
+            if cache_key:
+                parse_cache.put(page_keys[page], texts[page])
+    return [{"page": page, "content": texts[page]} for page in page_keys]
+
+async def ingest_file(file_info: Dict[str, Any], progress: Callable[[int, int], None]) -> str:
+    """后台解析流水线的处理函数：提取、规范化并写入解析缓存"""
+    content = await extract_file_content_cached(file_info["path"], file_info["type"], progress, file_info.get("content_ref"))
+    if content.startswith(EXTRACT_ERROR_PREFIXES):
+        raise Exception(content)
+    if file_info.get("session_id"):
+        # 会话记录只保存内容引用（文件哈希、大小、修改时间），重启后无需重新计算哈希即可定位提取文本
+        content_ref = parse_cache.content_ref(file_info["path"])
+        if content_ref and content_ref != file_info.get("content_ref"):
+            session_store.update_file(file_info["session_id"], file_info["id"], {"content_ref": content_ref})
+        index = session_indexes.get(file_info["session_id"])
+        await index_file_content(index, file_info["id"], file_info.get("name", ""), content)
+    return content
+
+ingest_pipeline = IngestPipeline(ingest_file, workers=Config.INGEST_WORKERS, status_ttl=Config.INGEST_STATUS_TTL)
+
+@app.on_event("startup")
+async def start_ingest_pipeline():
+    await ingest_pipeline.start()
+
+@app.on_event("shutdown")
+async def stop_ingest_pipeline():
+    await ingest_pipeline.stop()
+    parser_pool.shutdown()
+    session_store.close()
+
+async def resolve_knowledge_base(data: Dict[str, Any], key: str, session_id: str) -> List[Dict[str, Any]]:
+    """
+    解析请求中的知识库参数
+    优先使用 {key}_ids（文件ID列表），由服务端从会话中查找文件并读取（已缓存的）内容；
+    兼容旧请求直接携带的 {key} 文件列表，其中没有 content 的条目同样按ID在服务端补全
+    """
+    file_ids = data.get(f"{key}_ids")
+    files = data.get(key) or []
+    if file_ids is None:
+        if all(file.get('content') for file in files):
+            return files
+        file_ids = [str(file.get('id')) for file in files if file.get('id') is not None]
+        files = [file for file in files if file.get('content')]
+    else:
+        files = []
+    if not file_ids or not session_id:
+        return files
+    
+    selected = session_store.get_files(session_id, file_ids)
+    contents = await asyncio.gather(*[
+        extract_file_content_cached(file_info["path"], file_info["type"], content_ref=file_info.get("content_ref"))
+        for file_info in selected
+    ])
+    return files + [
+        {"id": file_info["id"], "name": file_info["name"], "type": file_info["type"], "content": content}
+        for file_info, content in zip(selected, contents)
+    ]
+
 # API路由
 
 @app.get("/")
@@ -736,8 +1391,7 @@ async def root():
 async def create_session():
     """创建新的用户会话"""
     session_id = generate_session_id()
-    get_user_session(session_id)  # 初始化会话
-    save_user_data(session_id)    # 保存到文件
+    session_store.create_session(session_id)
     return {
         "success": True,
         "session_id": session_id,
@@ -747,15 +1401,12 @@ async def create_session():
 @app.get("/session/{session_id}")
 async def get_session_info(session_id: str):
     """获取会话信息"""
-    user_data = load_user_data(session_id)
-    if user_data:
+    files_count = session_store.count_files(session_id)
+    if files_count is not None:
         return {
             "success": True,
             "session_id": session_id,
-            "files_count": {
-                "knowledge": len(user_data.get("knowledge", [])),
-                "questions": len(user_data.get("questions", []))
-            }
+            "files_count": files_count
         }
     else:
         return {
@@ -763,6 +1414,37 @@ async def get_session_info(session_id: str):
             "message": "会话不存在"
         }
 
+async def save_upload_to_temp(file: UploadFile, target_dir: Path) -> Dict[str, Any]:
+    """
+    把上传文件按固定大小分块写入目标目录下的临时文件，边写边计算SHA-256；
+    超过 MAX_FILE_SIZE 时立即停止读取并返回413，不会把整个文件读进内存
+    """
+    too_large_detail = f"文件 {file.filename} 超过大小限制（{Config.MAX_FILE_SIZE // (1024 * 1024)}MB）"
+    if file.size is not None and file.size > Config.MAX_FILE_SIZE:
+        raise HTTPException(status_code=413, detail=too_large_detail)
+    
+    tmp_path = target_dir / f".upload-{uuid.uuid4().hex}.part"
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        async with aiofiles.open(tmp_path, 'wb') as f:
+            while True:
+                chunk = await file.read(Config.UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > Config.MAX_FILE_SIZE:
+                    raise HTTPException(status_code=413, detail=too_large_detail)
+                digest.update(chunk)
+                await f.write(chunk)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+    return {"tmp_path": tmp_path, "size": size, "sha256": digest.hexdigest()}
+
 @app.post("/upload")
 async def upload_files(
     files: List[UploadFile] = File(...),
@@ -775,44 +1457,63 @@ async def upload_files(
         uploaded_file_list = []
         
         # 获取用户会话
-        user_session = get_user_session(session_id)
+        session_store.create_session(session_id)
         
-        # 创建用户专属的上传目录
-        user_uploads_dir = DATA_DIR / "uploads" / str(session_id)
-        user_uploads_dir = Path(user_uploads_dir)
+        # 先把本批所有文件流式写入临时文件，任何一个超限或失败时整批放弃
+        saved = []
+        try:
+            for file in files:
+                saved.append(await save_upload_to_temp(file, blob_store.tmp_dir))
+        except BaseException:
+            for item in saved:
+                try:
+                    os.remove(item["tmp_path"])
+                except OSError:
+                    pass
+            raise
         
-        for file in files:
-            # 保存文件到用户专属目录
-            file_path = user_uploads_dir / str(file.filename)
-            os.makedirs(user_uploads_dir, exist_ok=True)
+        knowledge_type = file_info_data.get("type")
+        for file, item in zip(files, saved):
+            # 按内容哈希存储：相同内容只保存一份，原子替换保证读取方不会看到写了一半的文件
+            file_path = blob_store.commit(item["tmp_path"], item["sha256"])
+            file_manifest.record(str(file_path), item["sha256"])
+            # 上传时已算出内容哈希，解析缓存无需再读一遍文件
+            parse_cache.remember_hash(str(file_path), item["sha256"])
             
-            async with aiofiles.open(file_path, 'wb') as f:
-                content = await file.read()
-                await f.write(content)
+            # 同一会话中重新上传同名文件时替换原记录，而不是新增一条重复记录
+            previous = None
+            if knowledge_type in ("knowledge", "questions"):
+                previous = session_store.find_file_by_name(session_id, knowledge_type, str(file.filename))
             
             # 创建文件信息，确保ID唯一
-            user_session["file_id_counter"] += 1
+            file_id_counter = session_store.next_file_counter(session_id)
             
             file_data = {
-                "id": f"file_{user_session['file_id_counter']}_{int(datetime.now().timestamp())}",
+                "id": f"file_{file_id_counter}_{int(datetime.now().timestamp())}",
                 "name": file.filename,
-                "size": len(content),
+                "size": item["size"],
                 "type": file.content_type,
                 "path": str(file_path),
                 "upload_time": datetime.now().isoformat(),
-                "session_id": session_id
+                "session_id": session_id,
+                "content_hash": item["sha256"],
+                "content_ref": parse_cache.content_ref(str(file_path))
             }
             
             # 根据类型存储到不同的知识库
-            if file_info_data.get("type") == "knowledge":
-                user_session["knowledge"].append(file_data)
-            elif file_info_data.get("type") == "questions":
-                user_session["questions"].append(file_data)
+            if knowledge_type in ("knowledge", "questions"):
+                session_store.add_file(session_id, knowledge_type, file_data)
+                # 先写入新记录再删除旧记录：内容相同时新记录仍引用同一个blob，引用数不会归零
+                if previous:
+                    remove_session_file(session_id, previous)
             
             uploaded_file_list.append(file_data)
         
-        # 保存用户数据
-        save_user_data(session_id)
+        # 加入后台解析队列，首次提问时无需再等待解析
+        uploaded_file_list = [
+            {**file_data, "parse_status": ingest_pipeline.enqueue(session_id, file_data)["status"]}
+            for file_data in uploaded_file_list
+        ]
         
         return {
             "success": True,
@@ -820,6 +1521,8 @@ async def upload_files(
             "files": uploaded_file_list
         }
     
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"文件上传失败: {str(e)}")
 
@@ -835,14 +1538,37 @@ async def chat_api(req: Request):
         api_base = ""
     message = data.get("message")
     session_id = data.get("session_id")
-    knowledge_base_1 = data.get("knowledge_base_1", [])
-    knowledge_base_2 = data.get("knowledge_base_2", [])
-    print(f"[CHAT] 收到请求: model={model}, api_key={api_key[:8]}, api_base={api_base}, session_id={session_id}")
+    request_log.info("收到聊天请求", endpoint="/chat", model=model, api_base=api_base, session_id=session_id)
     if not model or not message or not session_id:
         raise HTTPException(status_code=400, detail="缺少必要的参数")
-    response = await call_large_model_api(message, knowledge_base_1, knowledge_base_2, model, api_key, api_base)
+    knowledge_base_1 = await resolve_knowledge_base(data, "knowledge_base_1", session_id)
+    knowledge_base_2 = await resolve_knowledge_base(data, "knowledge_base_2", session_id)
+    response = await call_large_model_api(message, knowledge_base_1, knowledge_base_2, model, api_key, api_base, session_id)
     return {"answer": response["answer"]}
 
+@app.post("/chat/stream")
+async def chat_stream_api(req: Request):
+    """流式聊天：以Server-Sent Events返回回答片段，首个片段在上游开始生成时即送达"""
+    data = await req.json()
+    model = data.get("model") or DEFAULT_MODEL
+    api_key = data.get("api_key") or ""
+    api_base = data.get("api_base") or ""
+    message = data.get("message")
+    session_id = data.get("session_id")
+    request_log.info("收到聊天请求", endpoint="/chat/stream", model=model, api_base=api_base, session_id=session_id)
+    if not model or not message or not session_id:
+        raise HTTPException(status_code=400, detail="缺少必要的参数")
+    knowledge_base_1 = await resolve_knowledge_base(data, "knowledge_base_1", session_id)
+    knowledge_base_2 = await resolve_knowledge_base(data, "knowledge_base_2", session_id)
+    return StreamingResponse(
+        stream_large_model_api(message, knowledge_base_1, knowledge_base_2, model, api_key, api_base, session_id),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no"  # 关闭nginx缓冲，保证片段及时送达
+        }
+    )
+
 @app.post("/generate-questions")
 async def generate_questions(request: Request):
     """生成题目"""
@@ -853,12 +1579,12 @@ async def generate_questions(request: Request):
         difficulty = data.get("difficulty", "medium")
         count = data.get("count", 5)
         question_type = data.get("question_type", "multiple_choice")
-        knowledge_base_1 = data.get("knowledge_base_1", [])
-        knowledge_base_2 = data.get("knowledge_base_2", [])
+        knowledge_base_1 = await resolve_knowledge_base(data, "knowledge_base_1", session_id)
+        knowledge_base_2 = await resolve_knowledge_base(data, "knowledge_base_2", session_id)
         model = data.get("model") or DEFAULT_MODEL
         api_key = data.get("api_key") or ""
         api_base = data.get("api_base") or ""
-        print(f"[GENERATE-QUESTIONS] 收到请求: model={model}, api_key={api_key[:8]}, api_base={api_base}, session_id={session_id}")
+        request_log.info("收到出题请求", endpoint="/generate-questions", model=model, api_base=api_base, session_id=session_id, count=count)
         response = await call_large_model_for_questions(
             topic,
             difficulty,
@@ -868,7 +1594,8 @@ async def generate_questions(request: Request):
             knowledge_base_2,
             model,
             api_key,
-            api_base
+            api_base,
+            session_id
         )
         return {
             "success": True,
@@ -882,42 +1609,58 @@ async def generate_questions(request: Request):
 async def get_knowledge_base(session_id: str):
     """获取知识库文件列表"""
     sync_user_files_with_uploads(session_id)  # 新增
-    user_data = load_user_data(session_id)
-    if not user_data:
-        return {
-            "success": True,
-            "knowledge_base_1": [],
-            "knowledge_base_2": []
-        }
-    
     return {
         "success": True,
-        "knowledge_base_1": user_data.get("knowledge", []),
-        "knowledge_base_2": user_data.get("questions", [])
+        "knowledge_base_1": session_store.list_files(session_id, "knowledge"),
+        "knowledge_base_2": session_store.list_files(session_id, "questions")
     }
 
 @app.get("/knowledge-base/{session_id}/{file_id}")
-async def get_file_content(session_id: str, file_id: str):
-    """获取文件内容"""
+async def get_file_content(
+    session_id: str,
+    file_id: str,
+    pages: Optional[str] = Query(None, description="PDF页码范围，如 3-5 或 3；不传时返回全文")
+):
+    """获取文件内容；PDF可按页码范围只解析需要的页"""
     try:
-        user_data = load_user_data(session_id)
-        if not user_data:
+        if not session_store.session_exists(session_id):
             raise HTTPException(status_code=404, detail="会话不存在")
         
         # 查找文件
-        all_files = user_data.get("knowledge", []) + user_data.get("questions", [])
-        file_info = None
-        
-        for file in all_files:
-            if file["id"] == file_id:
-                file_info = file
-                break
-        
+        file_info = session_store.get_file(session_id, file_id)
         if not file_info:
             raise HTTPException(status_code=404, detail="文件不存在")
         
-        # 使用新的文件内容提取函数
-        content = await extract_file_content(file_info["path"], file_info["type"])
+        is_pdf = file_info["type"] == PDF_TYPE and os.path.exists(file_info["path"])
+        page_count = await get_pdf_page_count(file_info) if is_pdf else None
+        
+        if pages is not None:
+            if not is_pdf:
+                raise HTTPException(status_code=400, detail="只有PDF文件支持按页读取")
+            try:
+                first, last = parse_page_range(pages)
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+            if page_count is not None:
+                if first > page_count:
+                    raise HTTPException(status_code=416, detail=f"页码超出范围，共 {page_count} 页")
+                last = min(last, page_count)
+            if last - first + 1 > Config.PAGE_RANGE_MAX_PAGES:
+                raise HTTPException(status_code=400, detail=f"一次最多读取 {Config.PAGE_RANGE_MAX_PAGES} 页")
+            page_contents = await extract_pdf_pages_cached(file_info, first, last)
+            content = "\n\n".join(page["content"] for page in page_contents if page["content"])
+            file_info["content"] = content
+            return {
+                "success": True,
+                "file": file_info,
+                "content": content,
+                "pages": page_contents,
+                "page_range": [first, last],
+                "page_count": page_count
+            }
+        
+        # 使用带缓存的文件内容提取函数
+        content = await extract_file_content_cached(file_info["path"], file_info["type"], content_ref=file_info.get("content_ref"))
         
         # 更新文件信息中的内容
         file_info["content"] = content
@@ -925,9 +1668,12 @@ async def get_file_content(session_id: str, file_id: str):
         return {
             "success": True,
             "file": file_info,
-            "content": content
+            "content": content,
+            "page_count": page_count
         }
     
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"获取文件内容失败: {str(e)}")
 
@@ -936,20 +1682,16 @@ async def get_all_knowledge_base_content(session_id: str):
     """获取所有知识库文件的内容"""
     try:
         sync_user_files_with_uploads(session_id)  # 新增
-        user_data = load_user_data(session_id)
-        if not user_data:
-            return {
-                "success": True,
-                "files": []
-            }
+        all_files = session_store.list_files(session_id)
         
-        all_files = user_data.get("knowledge", []) + user_data.get("questions", [])
-        files_with_content = []
+        # 并发提取所有文件内容（已缓存的直接返回，未缓存的在解析进程池中并行解析）
+        contents = await asyncio.gather(*[
+            extract_file_content_cached(file_info["path"], file_info["type"], content_ref=file_info.get("content_ref"))
+            for file_info in all_files
+        ])
         
-        for file_info in all_files:
-            # 使用新的文件内容提取函数
-            content = await extract_file_content(file_info["path"], file_info["type"])
-            
+        files_with_content = []
+        for file_info, content in zip(all_files, contents):
             file_with_content = file_info.copy()
             file_with_content["content"] = content
             files_with_content.append(file_with_content)
@@ -962,41 +1704,42 @@ async def get_all_knowledge_base_content(session_id: str):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"获取知识库内容失败: {str(e)}")
 
+def remove_session_file(session_id: str, file_info: Dict[str, Any]):
+    """删除会话中的一条文件记录，并释放对应的物理文件"""
+    session_store.remove_file(session_id, file_info["id"])
+    ingest_pipeline.forget(session_id, file_info["id"])
+    session_indexes.remove_file(session_id, file_info["id"])
+    
+    content_hash = file_info.get("content_hash")
+    if content_hash:
+        # 按内容存储的文件：引用数归零时删除
+        if session_store.count_content_refs(content_hash) == 0:
+            blob_store.delete(content_hash)
+            file_manifest.forget(str(blob_store.path_for(content_hash)))
+        return
+    # 旧版本保存在会话目录中的文件
+    try:
+        if os.path.exists(file_info["path"]):
+            os.remove(file_info["path"])
+        file_manifest.forget(file_info["path"])
+    except Exception as e:
+        files_log.warning("删除物理文件失败（忽略）", path=file_info["path"], error=str(e))
+
 @app.delete("/delete-file/{session_id}/{file_id}")
 async def delete_file(session_id: str, file_id: str, knowledge_type: str = Query(..., description="知识库类型：knowledge 或 questions")):
     """删除文件"""
     try:
         sync_user_files_with_uploads(session_id)  # 新增
-        user_data = load_user_data(session_id)
-        if not user_data:
+        if not session_store.session_exists(session_id):
             raise HTTPException(status_code=404, detail="会话不存在")
         
         # 查找文件
-        file_list = user_data.get(knowledge_type, [])
-        file_info = None
-        file_index = -1
-        
-        for i, file in enumerate(file_list):
-            if str(file["id"]) == str(file_id):  # 强制转为字符串比较
-                file_info = file
-                file_index = i
-                break
-        
+        file_info = session_store.get_file(session_id, str(file_id), knowledge_type)
         if not file_info:
             raise HTTPException(status_code=404, detail="文件不存在")
         
-        # 删除物理文件
-        try:
-            if os.path.exists(file_info["path"]):
-                os.remove(file_info["path"])
-        except Exception as e:
-            print(f"删除物理文件失败: {e}（忽略）")
-        
-        # 从内存中删除文件信息
-        user_data[knowledge_type].pop(file_index)
-        
-        # 保存用户数据
-        save_user_data(session_id)
+        # 删除文件记录；物理文件在没有其他会话引用时才删除
+        remove_session_file(session_id, file_info)
         
         return {
             "success": True,
@@ -1006,58 +1749,214 @@ async def delete_file(session_id: str, file_id: str, knowledge_type: str = Query
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"删除文件失败: {str(e)}")
 
+def get_file_ingest_status(session_id: str, file_info: Dict[str, Any]) -> Dict[str, Any]:
+    """获取单个文件的解析状态；没有记录时（如服务重启后）根据缓存判断，未解析的重新入队"""
+    status = ingest_pipeline.get_status(session_id, file_info["id"])
+    if status:
+        return status
+    cache_key = get_parse_cache_key(file_info["path"], file_info["type"], file_info.get("content_ref"))
+    if cache_key and parse_cache.contains(cache_key):
+        return {
+            "file_id": file_info["id"],
+            "name": file_info.get("name", ""),
+            "status": STATUS_READY,
+            "progress": 1.0,
+            "error": None
+        }
+    return ingest_pipeline.enqueue(session_id, file_info)
+
+@app.get("/ingest-status/{session_id}")
+async def get_session_ingest_status(session_id: str):
+    """获取会话内所有文件的解析状态"""
+    if not session_store.session_exists(session_id):
+        raise HTTPException(status_code=404, detail="会话不存在")
+    all_files = session_store.list_files(session_id)
+    return {
+        "success": True,
+        "files": [get_file_ingest_status(session_id, file_info) for file_info in all_files]
+    }
+
+@app.get("/ingest-status/{session_id}/{file_id}")
+async def get_ingest_status(session_id: str, file_id: str):
+    """获取单个文件的解析状态和进度"""
+    if not session_store.session_exists(session_id):
+        raise HTTPException(status_code=404, detail="会话不存在")
+    file_info = session_store.get_file(session_id, file_id)
+    if file_info:
+        return {
+            "success": True,
+            **get_file_ingest_status(session_id, file_info)
+        }
+    raise HTTPException(status_code=404, detail="文件不存在")
+
+@app.get("/cache-stats")
+async def get_cache_stats():
+    """缓存命中统计"""
+    return {
+        "success": True,
+        "llm_response_cache": response_cache.stats(),
+        "parse_cache": parse_cache.stats(),
+        "single_flight": {
+            "llm": {**llm_flights.counters, "in_flight": llm_flights.in_flight()},
+            "extraction": {**extraction_flights.counters, "in_flight": extraction_flights.in_flight()}
+        }
+    }
+
+def collect_cache_metrics() -> List[Tuple[str, str, str, List[Tuple[Dict[str, str], float]]]]:
+    """抓取时读取各缓存、请求合并和解析流水线的当前状态"""
+    response_stats = response_cache.stats()
+    parse_hits = parse_cache_lookups.value(result="hit")
+    parse_lookups = parse_hits + parse_cache_lookups.value(result="miss")
+    parse_stats = parse_cache.stats()
+    flights = {"llm": llm_flights, "extraction": extraction_flights}
+    return [
+        ("llm_response_cache_lookups_total", "counter", "大模型回答缓存查询次数", [
+            ({"result": "memory_hit"}, response_stats["memory_hits"]),
+            ({"result": "disk_hit"}, response_stats["disk_hits"]),
+            ({"result": "miss"}, response_stats["misses"]),
+        ]),
+        ("cache_hit_ratio", "gauge", "缓存命中率（进程启动以来）", [
+            ({"cache": "llm_response"}, response_stats["hit_ratio"]),
+            ({"cache": "parse"}, parse_hits / parse_lookups if parse_lookups else 0.0),
+        ]),
+        ("llm_response_cache_disk_bytes", "gauge", "大模型回答缓存占用的磁盘空间", [({}, response_stats["disk_bytes"])]),
+        ("llm_response_cache_disk_entries", "gauge", "大模型回答缓存的磁盘条目数", [({}, response_stats["disk_entries"])]),
+        ("parse_cache_bytes", "gauge", "解析缓存占用的磁盘空间", [({}, parse_stats["total_bytes"])]),
+        ("parse_cache_entries", "gauge", "解析缓存条目数", [({}, parse_stats["entries"])]),
+        ("single_flight_calls_total", "counter", "请求合并的调用次数（leader 实际执行，follower 复用结果）", [
+            ({"flight": name, "role": role}, flight.counters[role + "s"])
+            for name, flight in flights.items() for role in ("leader", "follower")
+        ]),
+        ("single_flight_in_flight", "gauge", "正在执行的合并请求数", [
+            ({"flight": name}, flight.in_flight()) for name, flight in flights.items()
+        ]),
+    ]
+
+metrics.register_collector(collect_cache_metrics)
+
+def collect_log_metrics() -> List[Tuple[str, str, str, List[Tuple[Dict[str, str], float]]]]:
+    return [
+        ("log_records_total", "counter", "日志记录数（emitted 已写出，sampled_out 被采样跳过，dropped 因队列满丢弃）", [
+            ({"category": category, "outcome": outcome}, count)
+            for (category, outcome), count in sorted(log_stats.snapshot().items())
+        ]),
+    ]
+
+metrics.register_collector(collect_log_metrics)
+
+@app.get("/metrics")
+async def get_metrics():
+    """Prometheus 文本格式的运行指标"""
+    return Response(metrics.render(), media_type=CONTENT_TYPE)
+
 @app.get("/health")
 async def health_check():
     """健康检查"""
+    totals = session_store.totals()
     return {
         "status": "healthy",
         "timestamp": datetime.now().isoformat(),
-        "files_count": {
-            "knowledge": len(uploaded_files["knowledge"]),
-            "questions": len(uploaded_files["questions"])
-        },
+        "sessions_count": totals["sessions"],
+        "files_count": totals["files"],
         "api_key_configured": bool(DEFAULT_API_KEY)
     }
 
+async def reconcile_upload_dirs() -> Dict[str, List[str]]:
+    """增量对账所有上传目录的文件清单，并以有限并发同步所有会话"""
+    loop = asyncio.get_running_loop()
+    # 清单的根目录包含uploads目录，对账一次后直接按清单重建其文件信息
+    changes = await loop.run_in_executor(None, file_manifest.reconcile_all)
+    rebuild_uploaded_files()
+    files_log.info(
+        "上传目录对账完成",
+        added=len(changes['added']),
+        changed=len(changes['changed']),
+        removed=len(changes['removed'])
+    )
+    
+    semaphore = asyncio.Semaphore(Config.RESCAN_CONCURRENCY)
+    
+    async def sync_session(session_id: str):
+        async with semaphore:
+            missing = await loop.run_in_executor(None, find_missing_session_files, session_id)
+        remove_missing_session_files(session_id, missing)
+    
+    await asyncio.gather(*[sync_session(session_id) for session_id in session_store.session_ids()])
+    return changes
+
+async def watch_upload_dirs():
+    """启动时先对账一次，之后监听上传目录变化；没有 watchfiles 时定期增量对账"""
+    try:
+        await reconcile_upload_dirs()
+    except Exception as e:
+        files_log.error("上传目录对账失败", error=str(e))
+    if Config.MANIFEST_WATCH and await file_manifest.watch(manifest_stop_event):
+        return
+    while not manifest_stop_event.is_set():
+        try:
+            await asyncio.wait_for(manifest_stop_event.wait(), timeout=Config.MANIFEST_RECONCILE_INTERVAL)
+        except asyncio.TimeoutError:
+            try:
+                await reconcile_upload_dirs()
+            except Exception as e:
+                files_log.error("上传目录对账失败", error=str(e))
+
+manifest_stop_event = asyncio.Event()
+manifest_watch_task = None
+
+@app.on_event("startup")
+async def start_manifest_watch():
+    global manifest_watch_task
+    manifest_watch_task = asyncio.create_task(watch_upload_dirs())
+
+@app.on_event("shutdown")
+async def stop_manifest_watch():
+    manifest_stop_event.set()
+    if manifest_watch_task:
+        manifest_watch_task.cancel()
+    file_manifest.close()
+
+@app.on_event("shutdown")
+async def flush_logs():
+    # 最后执行：写出其他关闭钩子产生的日志
+    shutdown_logging()
+
 @app.post("/rescan-files")
 async def rescan_files():
-    """重新扫描uploads目录，重建文件信息并同步所有session索引"""
+    """重新扫描上传目录（只处理新增、变化或删除的文件），重建文件信息并同步所有session索引"""
     try:
-        scan_uploads_directory()
-        # 同步所有 session
-        for user_file in USERS_DIR.glob("*.json"):
-            session_id = user_file.stem
-            sync_user_files_with_uploads(session_id)
+        changes = await reconcile_upload_dirs()
         return {
             "success": True,
             "message": "文件扫描完成并已同步所有会话索引",
             "files_count": {
                 "knowledge": len(uploaded_files["knowledge"]),
                 "questions": len(uploaded_files["questions"])
-            }
+            },
+            "changes": {kind: len(paths) for kind, paths in changes.items()}
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"重新扫描文件失败: {str(e)}")
 
 # 新增：同步 session 文件索引与 uploads 目录
+def find_missing_session_files(session_id: str) -> List[str]:
+    """找出会话中物理文件已不存在的文件ID；清单中存在的文件不再访问磁盘"""
+    return [
+        file["id"] for file in session_store.list_files(session_id)
+        if not file_manifest.is_present(file["path"]) and not os.path.exists(file["path"])
+    ]
+
+def remove_missing_session_files(session_id: str, missing: List[str]):
+    if not missing:
+        return
+    session_store.remove_files(session_id, missing)
+    for file_id in missing:
+        ingest_pipeline.forget(session_id, file_id)
+        session_indexes.remove_file(session_id, file_id)
+
 def sync_user_files_with_uploads(session_id: str):
     """同步用户 session 文件索引，只保留实际存在的文件"""
-    user_data = load_user_data(session_id)
-    if not user_data:
-        return
-    changed = False
-    for key in ["knowledge", "questions"]:
-        file_list = user_data.get(key, [])
-        new_file_list = []
-        for file in file_list:
-            if os.path.exists(file["path"]):
-                new_file_list.append(file)
-            else:
-                changed = True
-        user_data[key] = new_file_list
-    if changed:
-        user_sessions[session_id] = user_data
-        save_user_data(session_id)
+    remove_missing_session_files(session_id, find_missing_session_files(session_id))
 
 if __name__ == "__main__":
     uvicorn.run(
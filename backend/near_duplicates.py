@@ -0,0 +1,78 @@
+"""
+题目近似去重
+题干先规范化（去掉空白、标点和题号，英文转小写），再去掉问法用词（"下列""哪些""是""的"等），
+剩下的内容词按问法用词断开成若干段，取各段内相邻两个字组成的集合（单字段取该字）作为题干的特征。
+两道题特征集合的Jaccard相似度不低于阈值（默认0.9，较严格）时视为重复：
+只改了问法、题号或标点的同一道题特征相同，会被过滤；
+换了一个专业名词的题目（如"直流"与"交流"、"积分"与"微分"）特征不同，会被保留
+"""
+
+import re
+from typing import List, Set
+
+# 题干开头的题号，如 "1." "（2）" "第3题" "题目1-2："
+LEADING_NUMBER_RE = re.compile(r'^\s*(?:第?\s*\d+(?:[\-_.．、]\d+)*\s*题?[.．、:：)）]?|[（(]\s*\d+\s*[)）]|题目\s*\d+(?:[\-_.．]\d+)*\s*[:：]?)')
+# 空白和中英文标点
+IGNORED_CHARS_RE = re.compile(r'[\s　-〿＀-／：-＠［-｀｛-･!-/:-@\[-`{-~]+')
+# 只改变问法、不改变考点的用词（长的写在前面，优先匹配）
+QUESTION_WORDS = (
+    "为什么", "是什么", "有哪些", "哪几种", "哪几个", "哪一项", "哪一个", "哪一种", "怎么样",
+    "下列", "以下", "哪些", "哪种", "哪个", "哪项", "什么", "如何", "怎样", "怎么", "请问",
+    "简述", "简要", "说明", "试述", "叙述", "阐述", "属于", "包括", "包含", "一个", "一种", "一项",
+    "的", "是", "有", "了", "呢", "吗", "请", "试",
+)
+QUESTION_WORDS_RE = re.compile("|".join(QUESTION_WORDS))
+
+
+def normalize_stem(text: str) -> str:
+    """去掉题号、空白和标点，英文转小写"""
+    return IGNORED_CHARS_RE.sub("", LEADING_NUMBER_RE.sub("", text or "")).lower()
+
+
+def stem_features(stem: str) -> Set[str]:
+    """规范化题干的内容词特征：问法用词断开的各段内相邻两个字，单字段取该字"""
+    features: Set[str] = set()
+    for part in QUESTION_WORDS_RE.split(stem):
+        if len(part) == 1:
+            features.add(part)
+        features.update(part[i:i + 2] for i in range(len(part) - 1))
+    return features
+
+
+def jaccard(a: Set[str], b: Set[str]) -> float:
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+class NearDuplicateFilter:
+    """逐个加入题干，与已加入的题干近似重复时拒绝"""
+
+    def __init__(self, min_similarity: float = 0.9):
+        self.min_similarity = min_similarity
+        self.features: List[Set[str]] = []
+        self._seen = set()
+
+    def is_duplicate(self, stem: str, features: Set[str]) -> bool:
+        if stem in self._seen:
+            return True
+        for other in self.features:
+            # 集合大小相差过大时相似度不可能达到阈值
+            if min(len(features), len(other)) < self.min_similarity * max(len(features), len(other)):
+                continue
+            if jaccard(features, other) >= self.min_similarity:
+                return True
+        return False
+
+    def add(self, text: str) -> bool:
+        """题干不与已加入的重复时记录并返回True"""
+        stem = normalize_stem(text)
+        if not stem:
+            # 空题干无法比较，不作去重
+            return True
+        features = stem_features(stem)
+        if self.is_duplicate(stem, features):
+            return False
+        self._seen.add(stem)
+        self.features.append(features)
+        return True
@@ -0,0 +1,232 @@
+"""
+文件解析结果缓存（提取文本存储）
+按“文件内容哈希 + 文件类型 + 解析器版本”缓存 extract_file_content 的结果，
+每个条目是一个UTF-8文本文件，通过 mmap 只读映射读取：按页读取等只需要部分内容的场景
+直接在映射上查找位置并只解码对应的字节区间；会话记录中只保存内容引用。
+结果落盘保存（重启后仍然有效），总大小超过上限时按LRU淘汰最久未使用的条目
+"""
+
+import hashlib
+import mmap
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Pattern, Tuple
+
+from backend.structured_log import get_logger
+
+log = get_logger("cache")
+
+HASH_CHUNK_SIZE = 1024 * 1024
+# 同时保持映射的缓存条目数
+MAX_OPEN_VIEWS = 64
+
+
+class MappedText:
+    """只读映射的UTF-8文本文件，按字节区间切片时不复制文件数据"""
+
+    def __init__(self, path: Path):
+        with open(path, 'rb') as f:
+            self.size = os.fstat(f.fileno()).st_size
+            # 空文件不能映射
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if self.size else None
+
+    def view(self, start: int = 0, end: Optional[int] = None) -> memoryview:
+        """返回字节区间的只读视图（零拷贝）"""
+        if self._mmap is None:
+            return memoryview(b'')
+        return memoryview(self._mmap)[start:end]
+
+    def text(self, start: int = 0, end: Optional[int] = None) -> str:
+        """解码字节区间为文本；区间边界落在多字节字符中间时忽略残缺字符"""
+        view = self.view(start, end)
+        try:
+            return str(view, 'utf-8', 'ignore')
+        finally:
+            view.release()
+
+    def find_all(self, pattern: Pattern[bytes]) -> List[Tuple[int, bytes]]:
+        """直接在映射的字节上查找（不解码全文），返回每处匹配的 (起始字节位置, 第一个分组)"""
+        if self._mmap is None:
+            return []
+        return [(match.start(), match.group(1)) for match in pattern.finditer(self._mmap)]
+
+    def close(self):
+        if self._mmap is not None:
+            try:
+                self._mmap.close()
+            except BufferError:
+                # 仍有调用方持有视图，交给垃圾回收释放
+                pass
+            self._mmap = None
+
+
+class ParseCache:
+    """磁盘解析缓存，一个条目对应缓存目录下的一个 .txt 文件"""
+
+    def __init__(self, cache_dir: str, max_bytes: int, version: str):
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self.version = version
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        # key -> 条目大小，顺序即LRU顺序（最久未使用的在前）
+        self._entries: "OrderedDict[str, int]" = OrderedDict()
+        self._total_bytes = 0
+        # 文件路径 -> (大小, 修改时间, 内容哈希)，避免每次请求都重新计算哈希
+        self._hash_memo: Dict[str, Tuple[int, int, str]] = {}
+        # key -> 已映射的条目，按LRU顺序保留 MAX_OPEN_VIEWS 个
+        self._views: "OrderedDict[str, MappedText]" = OrderedDict()
+        # 索引在第一次使用时才从缓存目录重建，导入和启动时不扫描目录
+        self._index_loaded = False
+
+    def _ensure_index_locked(self):
+        """从缓存目录重建索引，按文件修改时间恢复LRU顺序"""
+        if self._index_loaded:
+            return
+        self._index_loaded = True
+        entries = []
+        for path in self.cache_dir.glob("*.txt"):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, path.stem, stat.st_size))
+        for _, key, size in sorted(entries):
+            self._entries[key] = size
+            self._total_bytes += size
+
+    def file_hash(self, file_path: str, content_ref: Optional[Dict[str, Any]] = None) -> str:
+        """
+        计算文件内容的SHA-256，文件未变化时直接复用上次的结果；
+        content_ref 为会话记录中保存的内容引用，文件大小和修改时间一致时直接使用其中的哈希
+        """
+        stat = os.stat(file_path)
+        if content_ref and content_ref.get("size") == stat.st_size and content_ref.get("mtime_ns") == stat.st_mtime_ns:
+            self._hash_memo[file_path] = (stat.st_size, stat.st_mtime_ns, content_ref["hash"])
+        memo = self._hash_memo.get(file_path)
+        if memo and memo[0] == stat.st_size and memo[1] == stat.st_mtime_ns:
+            return memo[2]
+        digest = hashlib.sha256()
+        with open(file_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+                digest.update(chunk)
+        content_hash = digest.hexdigest()
+        self._hash_memo[file_path] = (stat.st_size, stat.st_mtime_ns, content_hash)
+        return content_hash
+
+    def remember_hash(self, file_path: str, content_hash: str):
+        """记录已知的文件内容哈希（如上传时边写边算出的哈希）"""
+        stat = os.stat(file_path)
+        self._hash_memo[file_path] = (stat.st_size, stat.st_mtime_ns, content_hash)
+
+    def content_ref(self, file_path: str) -> Optional[Dict[str, Any]]:
+        """生成保存到会话记录中的内容引用（需先调用过 file_hash）"""
+        memo = self._hash_memo.get(file_path)
+        if not memo:
+            return None
+        return {"hash": memo[2], "size": memo[0], "mtime_ns": memo[1]}
+
+    def make_key(self, content_hash: str, file_type: str) -> str:
+        """生成缓存键：同一内容按不同类型解析的结果分开存放"""
+        type_tag = hashlib.md5((file_type or "").encode('utf-8')).hexdigest()[:8]
+        return f"{content_hash}-{type_tag}-v{self.version}"
+
+    def _entry_path(self, key: str) -> Path:
+        return self.cache_dir / f"{key}.txt"
+
+    def contains(self, key: str) -> bool:
+        with self._lock:
+            self._ensure_index_locked()
+            return key in self._entries
+
+    def _close_view_locked(self, key: str):
+        view = self._views.pop(key, None)
+        if view is not None:
+            view.close()
+
+    def get_view(self, key: str) -> Optional[MappedText]:
+        """获取条目的只读映射，命中时刷新LRU顺序"""
+        with self._lock:
+            self._ensure_index_locked()
+            if key not in self._entries:
+                return None
+            self._entries.move_to_end(key)
+            view = self._views.get(key)
+            if view is not None:
+                self._views.move_to_end(key)
+                return view
+        path = self._entry_path(key)
+        try:
+            view = MappedText(path)
+            # 刷新修改时间，使LRU顺序在重启后依然有效
+            os.utime(path)
+        except (OSError, ValueError):
+            with self._lock:
+                size = self._entries.pop(key, None)
+                if size is not None:
+                    self._total_bytes -= size
+            return None
+        with self._lock:
+            self._close_view_locked(key)
+            self._views[key] = view
+            while len(self._views) > MAX_OPEN_VIEWS:
+                _, oldest = self._views.popitem(last=False)
+                oldest.close()
+        return view
+
+    def get(self, key: str) -> Optional[str]:
+        """读取缓存文本"""
+        view = self.get_view(key)
+        return view.text() if view is not None else None
+
+    def put(self, key: str, content: str):
+        """写入缓存（先写临时文件再原子替换），必要时淘汰旧条目"""
+        data = content.encode('utf-8')
+        if len(data) > self.max_bytes:
+            return
+        path = self._entry_path(key)
+        tmp_path = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        with self._lock:
+            # Windows 下不能替换仍被映射的文件
+            self._close_view_locked(key)
+        try:
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            log.warning("写入解析缓存失败", error=str(e))
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            return
+        with self._lock:
+            self._ensure_index_locked()
+            old_size = self._entries.pop(key, None)
+            if old_size is not None:
+                self._total_bytes -= old_size
+            self._entries[key] = len(data)
+            self._total_bytes += len(data)
+            self._evict_locked()
+
+    def _evict_locked(self):
+        while self._total_bytes > self.max_bytes and self._entries:
+            key, size = self._entries.popitem(last=False)
+            self._total_bytes -= size
+            self._close_view_locked(key)
+            try:
+                os.remove(self._entry_path(key))
+            except OSError:
+                pass
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            self._ensure_index_locked()
+            return {
+                "entries": len(self._entries),
+                "mapped_entries": len(self._views),
+                "total_bytes": self._total_bytes,
+                "max_bytes": self.max_bytes
+            }
@@ -0,0 +1,115 @@
+"""
+进程池文档解析引擎
+PyPDF2 / python-docx 的解析是CPU密集的同步代码，直接在事件循环里调用会阻塞所有请求。
+这里把解析放到进程池中执行，用信号量限制同时提交的任务数，
+大PDF按页码区间拆分成多个任务，在多个CPU核心上并行解析
+"""
+
+import asyncio
+import threading
+from concurrent.futures import Executor, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, List, Optional, Tuple
+
+from backend import extractors
+from backend.structured_log import get_logger
+
+log = get_logger("files")
+
+PDF_TYPE = "application/pdf"
+DOCX_TYPE = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+TEXT_TYPES = ("text/plain", "text/markdown")
+
+
+class ParserPool:
+    """解析任务调度器；workers 为 0 时退化为线程池执行（不创建子进程）"""
+
+    def __init__(self, workers: int, max_concurrency: int, pdf_pages_per_task: int):
+        self.workers = workers
+        self.max_concurrency = max(1, max_concurrency)
+        self.pdf_pages_per_task = max(1, pdf_pages_per_task)
+        self._executor: Optional[Executor] = None
+        # 保护进程池的创建和替换（并发调用方可能同时发现进程池已损坏）
+        self._executor_lock = threading.Lock()
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    def _get_executor(self) -> Optional[Executor]:
+        if self.workers <= 0:
+            return None  # 使用事件循环默认的线程池
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            return self._executor
+
+    def _replace_broken(self, broken: Optional[Executor]):
+        """丢弃已损坏的进程池；其他调用方已经重建过时保留新的进程池"""
+        with self._executor_lock:
+            if broken is None or self._executor is not broken:
+                return
+            self._executor = None
+        broken.shutdown(wait=False)
+
+    async def run(self, func: Callable, *args):
+        """在进程池中执行一个解析函数，受并发上限约束"""
+        if self._semaphore is None:
+            # 信号量需要在事件循环内创建
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        loop = asyncio.get_running_loop()
+        async with self._semaphore:
+            executor = self._get_executor()
+            try:
+                return await loop.run_in_executor(executor, func, *args)
+            except BrokenProcessPool:
+                # 子进程异常退出（如被OOM杀掉）后重建进程池再试一次
+                log.warning("解析进程池已损坏，正在重建")
+                self._replace_broken(executor)
+                return await loop.run_in_executor(self._get_executor(), func, *args)
+
+    def _page_ranges(self, total_pages: int) -> List[Tuple[int, int]]:
+        step = self.pdf_pages_per_task
+        return [(start, min(start + step, total_pages)) for start in range(0, total_pages, step)]
+
+    async def count_pdf_pages(self, file_path: str) -> int:
+        return await self.run(extractors.count_pdf_pages, file_path)
+
+    async def extract_pdf_range(self, file_path: str, start: int, end: int) -> List[Tuple[int, str]]:
+        """只提取PDF第 start 到 end-1 页（从0开始），返回 [(页码, 带页码标注的文本)]"""
+        results = await asyncio.gather(*[
+            self.run(extractors.extract_pdf_pages, file_path, range_start, min(range_start + self.pdf_pages_per_task, end))
+            for range_start in range(start, end, self.pdf_pages_per_task)
+        ])
+        return [page for pages in results for page in pages]
+
+    async def extract_pdf(self, file_path: str, progress: Optional[Callable[[int, int], None]] = None) -> str:
+        """按页码区间并行提取PDF，结果按页码顺序拼接"""
+        total_pages = await self.run(extractors.count_pdf_pages, file_path)
+        done_pages = 0
+
+        async def extract_range(start: int, end: int):
+            nonlocal done_pages
+            pages = await self.run(extractors.extract_pdf_pages, file_path, start, end)
+            done_pages += end - start
+            if progress:
+                progress(done_pages, total_pages)
+            return pages
+
+        results = await asyncio.gather(*[
+            extract_range(start, end) for start, end in self._page_ranges(total_pages)
+        ])
+        return "".join(text for pages in results for _, text in pages).strip()
+
+    async def extract(self, file_path: str, file_type: str, progress: Optional[Callable[[int, int], None]] = None) -> str:
+        """根据文件类型提取内容，解析异常直接抛出"""
+        if file_type == PDF_TYPE:
+            return await self.extract_pdf(file_path, progress)
+        if file_type == DOCX_TYPE:
+            return await self.run(extractors.extract_docx, file_path)
+        if file_type in TEXT_TYPES:
+            return await self.run(extractors.extract_text_file, file_path)
+        return await self.run(extractors.extract_binary_file, file_path)
+
+    def shutdown(self):
+        with self._executor_lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False)
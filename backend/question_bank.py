@@ -0,0 +1,128 @@
+"""
+题库结构化索引
+题库文件在解析入库时按“题目”切分成结构化记录（题号、题干、答案、解析、来源页码），
+按规范化题号建立字典索引，题号查询为O(1)，不再对全文跑回溯正则
+"""
+
+import bisect
+import re
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+QUESTION_START_RE = re.compile(r'题目')
+QUESTION_NO_RE = re.compile(r'\d+(?:[\-_.．、]\d+)?')
+QUESTION_NO_SEPARATOR_RE = re.compile(r'[\-_.．、]')
+PAGE_MARKER_RE = re.compile(r'【第(\d+)页】')
+TOPIC_TERM_RE = re.compile(r'[a-z0-9]+|[一-鿿]+')
+LABEL_PREFIX_RE = re.compile(r'^(答案|解析)\s*[:：]?\s*')
+
+# 与原正则保持一致：题号需出现在“题目”之后20个字符以内，题干/答案/解析分别不超过2000/1000/1000字
+NUMBER_WINDOW = 20
+MAX_STEM_CHARS = 2000
+MAX_PART_CHARS = 1000
+
+
+def normalize_question_no(question_no: str) -> str:
+    """统一题号写法：2-2、2_2、2.2、2．2、2、2 都视为同一题号"""
+    return QUESTION_NO_SEPARATOR_RE.sub('-', question_no.strip())
+
+
+def parse_question_bank(content: str) -> List[Dict[str, Any]]:
+    """把题库文本切分成结构化题目记录；没有答案部分的片段不视为题目"""
+    starts = [match.start() for match in QUESTION_START_RE.finditer(content)]
+    page_positions = []
+    page_numbers = []
+    for match in PAGE_MARKER_RE.finditer(content):
+        page_positions.append(match.start())
+        page_numbers.append(int(match.group(1)))
+
+    records = []
+    for i, start in enumerate(starts):
+        end = starts[i + 1] if i + 1 < len(starts) else len(content)
+        block = content[start:end]
+        separator = block.find('---')
+        if separator != -1:
+            block = block[:separator]
+
+        number_match = QUESTION_NO_RE.search(block, len('题目'), len('题目') + NUMBER_WINDOW + 1)
+        answer_idx = block.find('答案')
+        if not number_match or answer_idx == -1 or answer_idx > MAX_STEM_CHARS + NUMBER_WINDOW:
+            continue
+        explain_idx = block.find('解析', answer_idx)
+        if explain_idx != -1 and explain_idx - answer_idx <= MAX_PART_CHARS:
+            answer = block[answer_idx:explain_idx]
+            explanation = block[explain_idx:explain_idx + MAX_PART_CHARS]
+        else:
+            answer = block[answer_idx:answer_idx + MAX_PART_CHARS]
+            explanation = ""
+
+        page_idx = bisect.bisect_right(page_positions, start) - 1
+        records.append({
+            "number": normalize_question_no(number_match.group(0)),
+            "stem": block[:answer_idx].strip(),
+            "answer": answer.strip(),
+            "explanation": explanation.strip(),
+            "page": page_numbers[page_idx] if page_idx >= 0 else None
+        })
+    return records
+
+
+def strip_label(text: str) -> str:
+    """去掉“答案：”“解析：”等前缀"""
+    return LABEL_PREFIX_RE.sub('', text).strip()
+
+
+def _topic_terms(text: str) -> Set[str]:
+    """主题匹配用的词：英文单词和中文双字"""
+    terms = set()
+    for token in TOPIC_TERM_RE.findall(text.lower()):
+        if token.isascii() or len(token) == 1:
+            terms.add(token)
+        else:
+            terms.update(token[i:i + 2] for i in range(len(token) - 1))
+    return terms
+
+
+class QuestionBankIndex:
+    """题号 -> 题目记录 的字典索引，按文件增删"""
+
+    def __init__(self):
+        self._file_records: Dict[str, Tuple[str, List[Dict[str, Any]]]] = {}
+        self._by_number: Dict[str, List[Tuple[str, Dict[str, Any]]]] = {}
+
+    def add_file(self, file_id: str, file_name: str, records: List[Dict[str, Any]]):
+        self.remove_file(file_id)
+        self._file_records[file_id] = (file_name, records)
+        for record in records:
+            self._by_number.setdefault(record["number"], []).append((file_id, record))
+
+    def remove_file(self, file_id: str):
+        _, records = self._file_records.pop(file_id, ("", []))
+        for record in records:
+            entries = self._by_number.get(record["number"], [])
+            entries[:] = [entry for entry in entries if entry[0] != file_id]
+            if not entries:
+                self._by_number.pop(record["number"], None)
+
+    def lookup(self, question_no: str, file_ids: Optional[Set[str]] = None) -> Optional[Tuple[str, Dict[str, Any]]]:
+        """按题号查找，返回 (文件名, 题目记录)"""
+        for file_id, record in self._by_number.get(normalize_question_no(question_no), []):
+            if file_ids is None or file_id in file_ids:
+                return self._file_records[file_id][0], record
+        return None
+
+    def search_by_topic(self, topic: str, limit: int, file_ids: Optional[Set[str]] = None, min_overlap: float = 0.5) -> List[Tuple[str, Dict[str, Any]]]:
+        """找出题干与主题相关的题目，按匹配程度排序"""
+        terms = _topic_terms(topic)
+        if not terms:
+            return []
+        scored = []
+        for file_id, (file_name, records) in self._file_records.items():
+            if file_ids is not None and file_id not in file_ids:
+                continue
+            for record in records:
+                stem_terms = _topic_terms(record["stem"])
+                overlap = len(terms & stem_terms) / len(terms)
+                if overlap >= min_overlap:
+                    scored.append((overlap, file_name, record))
+        scored.sort(key=lambda item: item[0], reverse=True)
+        return [(file_name, record) for _, file_name, record in scored[:limit]]
@@ -0,0 +1,225 @@
+"""
+大模型回答缓存
+同一课程的学生经常针对相同资料问相同的问题。按（请求类型、模型、规范化后的问题、知识库内容哈希）
+缓存回答：内存LRU + 磁盘两级，超过TTL视为过期；上游调用失败时可以返回未超过保留期的过期回答。
+磁盘层同样有条目数和字节数上限（按LRU淘汰），超过保留期的条目定期清理
+"""
+
+import hashlib
+import json
+import os
+import re
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from backend.structured_log import get_logger
+
+log = get_logger("cache")
+
+WHITESPACE_RE = re.compile(r'\s+')
+TRAILING_PUNCTUATION = '?？。.!！~～ '
+# 两次清理超过保留期的磁盘条目之间的最短间隔（秒）
+SWEEP_INTERVAL = 600
+
+
+def normalize_prompt(text: str) -> str:
+    """规范化问题文本：合并空白、统一大小写、去掉结尾标点"""
+    return WHITESPACE_RE.sub(' ', text or '').strip().lower().rstrip(TRAILING_PUNCTUATION)
+
+
+def knowledge_base_hash(files: Iterable[Dict[str, Any]]) -> str:
+    """知识库内容哈希：文件顺序不影响结果"""
+    file_hashes = sorted(
+        hashlib.sha256(
+            f"{file.get('name', '')}\0{file.get('content', '')}".encode('utf-8', errors='ignore')
+        ).hexdigest()
+        for file in files
+    )
+    return hashlib.sha256("\n".join(file_hashes).encode('utf-8')).hexdigest()
+
+
+class ResponseCache:
+    """内存LRU + 磁盘JSON文件的两级缓存"""
+
+    def __init__(
+        self,
+        cache_dir: str,
+        max_memory_entries: int,
+        ttl: float,
+        stale_ttl: float,
+        enabled: bool = True,
+        max_disk_entries: int = 10000,
+        max_disk_bytes: int = 256 * 1024 * 1024
+    ):
+        self.cache_dir = Path(cache_dir)
+        self.max_memory_entries = max_memory_entries
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.enabled = enabled
+        self.max_disk_entries = max_disk_entries
+        self.max_disk_bytes = max_disk_bytes
+        self._memory: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        # 磁盘条目 key -> (写入时间, 文件大小)，顺序即LRU顺序（最久未使用的在前）
+        self._disk: "OrderedDict[str, Tuple[float, int]]" = OrderedDict()
+        self._disk_bytes = 0
+        self._last_sweep = 0.0
+        # 磁盘索引在第一次使用时才从缓存目录重建，导入和启动时不扫描目录
+        self._index_loaded = False
+        self.counters = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "stale_served": 0,
+            "writes": 0,
+            "disk_evictions": 0
+        }
+        if enabled:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+    def _ensure_index(self):
+        if self._index_loaded:
+            return
+        self._index_loaded = True
+        self._load_index()
+        self.sweep()
+
+    def _load_index(self):
+        """从缓存目录重建磁盘索引，按文件修改时间恢复LRU顺序"""
+        entries = []
+        for path in self.cache_dir.glob("*.json"):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, path.stem, stat.st_size))
+        for mtime, key, size in sorted(entries):
+            self._disk[key] = (mtime, size)
+            self._disk_bytes += size
+
+    def make_key(self, kind: str, model: str, prompt: str, files: Iterable[Dict[str, Any]]) -> str:
+        raw = "\0".join([kind, model or "", normalize_prompt(prompt), knowledge_base_hash(files)])
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def _entry_path(self, key: str) -> Path:
+        return self.cache_dir / f"{key}.json"
+
+    def _remember(self, key: str, created_at: float, value: Any):
+        self._memory[key] = (created_at, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+
+    def _remove_disk_entry(self, key: str):
+        entry = self._disk.pop(key, None)
+        if entry is not None:
+            self._disk_bytes -= entry[1]
+        try:
+            os.remove(self._entry_path(key))
+        except OSError:
+            pass
+
+    def _evict_disk(self):
+        """超过条目数或字节数上限时删除最久未使用的磁盘条目"""
+        while self._disk and (len(self._disk) > self.max_disk_entries or self._disk_bytes > self.max_disk_bytes):
+            key = next(iter(self._disk))
+            self._remove_disk_entry(key)
+            self.counters["disk_evictions"] += 1
+
+    def sweep(self) -> int:
+        """删除超过保留期（TTL + 过期保留期）的磁盘条目，返回删除数"""
+        self._ensure_index()
+        self._last_sweep = time.time()
+        deadline = self._last_sweep - self.ttl - self.stale_ttl
+        expired = [key for key, (created_at, _) in self._disk.items() if created_at < deadline]
+        for key in expired:
+            self._memory.pop(key, None)
+            self._remove_disk_entry(key)
+        return len(expired)
+
+    def _load(self, key: str) -> Optional[Tuple[float, Any, str]]:
+        """依次查内存和磁盘，返回 (写入时间, 值, 命中层级)"""
+        self._ensure_index()
+        entry = self._memory.get(key)
+        if entry is not None:
+            self._memory.move_to_end(key)
+            if key in self._disk:
+                self._disk.move_to_end(key)
+            return entry[0], entry[1], "memory"
+        if key not in self._disk:
+            return None
+        try:
+            with open(self._entry_path(key), 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            self._remove_disk_entry(key)
+            return None
+        created_at = data.get("created_at", 0)
+        if time.time() - created_at > self.ttl + self.stale_ttl:
+            # 超过保留期，删除磁盘文件
+            self._remove_disk_entry(key)
+            return None
+        self._disk.move_to_end(key)
+        self._remember(key, created_at, data.get("value"))
+        return created_at, data.get("value"), "disk"
+
+    def get(self, key: str) -> Optional[Any]:
+        """读取未过期的缓存"""
+        if not self.enabled:
+            return None
+        entry = self._load(key)
+        if entry is None or time.time() - entry[0] > self.ttl:
+            self.counters["misses"] += 1
+            return None
+        self.counters["memory_hits" if entry[2] == "memory" else "disk_hits"] += 1
+        return entry[1]
+
+    def get_stale(self, key: str) -> Optional[Any]:
+        """上游失败时使用：读取已过期但仍在保留期内的缓存"""
+        if not self.enabled:
+            return None
+        entry = self._load(key)
+        if entry is None or time.time() - entry[0] > self.ttl + self.stale_ttl:
+            return None
+        self.counters["stale_served"] += 1
+        return entry[1]
+
+    def put(self, key: str, value: Any):
+        if not self.enabled:
+            return
+        self._ensure_index()
+        created_at = time.time()
+        self._remember(key, created_at, value)
+        path = self._entry_path(key)
+        tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+        data = json.dumps({"created_at": created_at, "value": value}, ensure_ascii=False).encode('utf-8')
+        try:
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+            self.counters["writes"] += 1
+        except OSError as e:
+            log.warning("写入回答缓存失败", error=str(e))
+            return
+        old = self._disk.pop(key, None)
+        if old is not None:
+            self._disk_bytes -= old[1]
+        self._disk[key] = (created_at, len(data))
+        self._disk_bytes += len(data)
+        self._evict_disk()
+        if created_at - self._last_sweep > SWEEP_INTERVAL:
+            self.sweep()
+
+    def stats(self) -> Dict[str, Any]:
+        if self.enabled:
+            self._ensure_index()
+        lookups = self.counters["memory_hits"] + self.counters["disk_hits"] + self.counters["misses"]
+        hits = self.counters["memory_hits"] + self.counters["disk_hits"]
+        return {
+            **self.counters,
+            "memory_entries": len(self._memory),
+            "disk_entries": len(self._disk),
+            "disk_bytes": self._disk_bytes,
+            "hit_ratio": round(hits / lookups, 4) if lookups else 0.0
+        }
@@ -0,0 +1,262 @@
+"""
+知识库分块检索
+把提取出的文本按【第N页】/【章节】标注切分成块，用BM25（关键词）和本地向量检索（语义）
+对块排序并融合，只把与问题最相关的若干块发给大模型。
+每份文档内容的倒排表和向量只建一次（文档段，按内容指纹跨会话共享），每个会话的索引只引用这些段，可增量增删
+"""
+
+import math
+import re
+import weakref
+from collections import Counter, OrderedDict
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from backend.question_bank import QuestionBankIndex
+
+MARKER_RE = re.compile(r'^【([^】\n]{1,60})】$')
+LATIN_TOKEN_RE = re.compile(r'[a-z0-9]+(?:\.[0-9]+)*')
+CJK_RUN_RE = re.compile(r'[一-鿿]+')
+
+
+def split_into_chunks(text: str, max_chars: int = 800) -> List[Dict[str, str]]:
+    """按页码/章节标注切分文本，过长的段落再按行切成不超过 max_chars 的块"""
+    segments: List[Tuple[str, List[str]]] = [("", [])]
+    for line in text.splitlines():
+        marker = MARKER_RE.match(line.strip())
+        if marker:
+            segments.append((marker.group(1), []))
+        elif line.strip():
+            segments[-1][1].append(line)
+
+    chunks = []
+    for label, lines in segments:
+        buffer = ""
+        for line in lines:
+            while len(line) > max_chars:
+                if buffer:
+                    chunks.append({"label": label, "text": buffer})
+                    buffer = ""
+                chunks.append({"label": label, "text": line[:max_chars]})
+                line = line[max_chars:]
+            if buffer and len(buffer) + len(line) + 1 > max_chars:
+                chunks.append({"label": label, "text": buffer})
+                buffer = ""
+            buffer = f"{buffer}\n{line}" if buffer else line
+        if buffer:
+            chunks.append({"label": label, "text": buffer})
+    return chunks
+
+
+def tokenize(text: str) -> List[str]:
+    """中英文混合分词：英文/数字按单词，中文取单字和相邻双字"""
+    text = text.lower()
+    tokens = LATIN_TOKEN_RE.findall(text)
+    for run in CJK_RUN_RE.findall(text):
+        tokens.extend(run)
+        tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return tokens
+
+
+def analyze_document(text: str, max_chars: int = 800) -> List[Tuple[Dict[str, str], Dict[str, int]]]:
+    """切块并统计词频；纯函数，可以放到线程池中执行"""
+    return [(chunk, dict(Counter(tokenize(chunk["text"])))) for chunk in split_into_chunks(text, max_chars)]
+
+
+class DocumentSegment:
+    """
+    一份文档内容的切块、BM25倒排表、向量段和题目记录，构建后只读；
+    内容相同的文件（如多个学生上传的同一份课件）在所有会话之间共享同一个段，各会话索引只保存引用
+    """
+
+    def __init__(
+        self,
+        analyzed: List[Tuple[Dict[str, str], Dict[str, int]]],
+        question_records: Optional[List[Dict[str, Any]]] = None,
+        vector_dim: int = 4096
+    ):
+        from backend.vector_index import VectorSegment
+        self.chunks = [
+            {"label": chunk["label"], "text": chunk["text"], "length": sum(term_freqs.values())}
+            for chunk, term_freqs in analyzed
+        ]
+        self.total_length = sum(chunk["length"] for chunk in self.chunks)
+        # 词 -> [(块在文档中的顺序, 词频)]
+        self.postings: Dict[str, List[Tuple[int, int]]] = {}
+        for position, (_, term_freqs) in enumerate(analyzed):
+            for term, freq in term_freqs.items():
+                self.postings.setdefault(term, []).append((position, freq))
+        self.vectors = VectorSegment([term_freqs for _, term_freqs in analyzed], vector_dim)
+        self.question_records = question_records or []
+
+
+class SegmentCache:
+    """
+    内容指纹 -> 文档段。仍被会话索引引用的段通过弱引用找到，
+    另外按LRU强引用最近用过的 max_entries 个段，没有会话引用时也能复用
+    """
+
+    def __init__(self, max_entries: int = 64):
+        self.max_entries = max_entries
+        self._live: "weakref.WeakValueDictionary[Any, DocumentSegment]" = weakref.WeakValueDictionary()
+        self._recent: "OrderedDict[Any, DocumentSegment]" = OrderedDict()
+
+    def get(self, fingerprint: Any) -> Optional[DocumentSegment]:
+        segment = self._live.get(fingerprint)
+        if segment is not None:
+            self._remember(fingerprint, segment)
+        return segment
+
+    def put(self, fingerprint: Any, segment: DocumentSegment):
+        self._live[fingerprint] = segment
+        self._remember(fingerprint, segment)
+
+    def _remember(self, fingerprint: Any, segment: DocumentSegment):
+        self._recent[fingerprint] = segment
+        self._recent.move_to_end(fingerprint)
+        while len(self._recent) > self.max_entries:
+            self._recent.popitem(last=False)
+
+    def clear(self):
+        self._live.clear()
+        self._recent.clear()
+
+    def __len__(self) -> int:
+        return len(self._live)
+
+
+class BM25Index:
+    """BM25检索：按文件引用共享的文档段，支持增删；文档频率等统计按索引内的所有文件累计"""
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        # 文件ID -> (文档段, 与段中各块对应的块对象)
+        self._files: Dict[str, Tuple[DocumentSegment, List[Dict[str, Any]]]] = {}
+        self._file_fingerprints: Dict[str, Any] = {}
+        self._total_chunks = 0
+        self._total_length = 0
+
+    def has_file(self, file_id: str, fingerprint: Any = None) -> bool:
+        if file_id not in self._files:
+            return False
+        return fingerprint is None or self._file_fingerprints.get(file_id) == fingerprint
+
+    def add_document(self, file_id: str, chunks: List[Dict[str, Any]], segment: DocumentSegment, fingerprint: Any = None):
+        """加入（或替换）一个文件；chunks 与段中的块一一对应"""
+        self.remove_document(file_id)
+        self._files[file_id] = (segment, chunks)
+        self._file_fingerprints[file_id] = fingerprint
+        self._total_chunks += len(chunks)
+        self._total_length += segment.total_length
+
+    def remove_document(self, file_id: str):
+        entry = self._files.pop(file_id, None)
+        self._file_fingerprints.pop(file_id, None)
+        if entry is not None:
+            segment, chunks = entry
+            self._total_chunks -= len(chunks)
+            self._total_length -= segment.total_length
+
+    def file_chunks(self, file_id: str) -> List[Dict[str, Any]]:
+        entry = self._files.get(file_id)
+        return entry[1] if entry else []
+
+    def search(self, query: str, top_k: int, file_ids: Optional[Set[str]] = None) -> List[Tuple[float, Dict[str, Any]]]:
+        """返回得分最高的 top_k 个块，可限定在指定文件内"""
+        if not self._total_chunks:
+            return []
+        avg_length = self._total_length / self._total_chunks or 1.0
+        targets = [
+            (file_id, self._files[file_id]) for file_id in (self._files if file_ids is None else file_ids)
+            if file_id in self._files
+        ]
+        scores: Dict[Tuple[str, int], float] = {}
+        for term in set(tokenize(query)):
+            df = sum(len(segment.postings.get(term, ())) for segment, _ in self._files.values())
+            if not df:
+                continue
+            idf = math.log(1 + (self._total_chunks - df + 0.5) / (df + 0.5))
+            for file_id, (segment, _) in targets:
+                for position, freq in segment.postings.get(term, ()):
+                    norm = self.k1 * (1 - self.b + self.b * segment.chunks[position]["length"] / avg_length)
+                    key = (file_id, position)
+                    scores[key] = scores.get(key, 0.0) + idf * freq * (self.k1 + 1) / (freq + norm)
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:top_k]
+        return [(score, self._files[file_id][1][position]) for (file_id, position), score in ranked]
+
+
+class SessionIndex:
+    """会话检索索引：BM25与向量检索的结果按倒数排名融合（RRF）"""
+
+    RRF_K = 60
+
+    def __init__(self, vector_dim: int = 4096):
+        # 向量索引依赖NumPy，在第一次建立会话索引时才导入，缩短服务启动时间
+        from backend.vector_index import VectorIndex
+        self.bm25 = BM25Index()
+        self.vectors = VectorIndex(vector_dim)
+        self.questions = QuestionBankIndex()
+
+    def has_file(self, file_id: str, fingerprint: Any = None) -> bool:
+        return self.bm25.has_file(file_id, fingerprint)
+
+    def add_document(self, file_id: str, file_name: str, segment: DocumentSegment, fingerprint: Any = None):
+        """引用共享的文档段加入文件；只为本会话生成带文件ID/文件名的块对象"""
+        chunks = [
+            {
+                "file_id": file_id,
+                "file_name": file_name,
+                "label": chunk["label"],
+                "text": chunk["text"],
+                "position": position  # 块在文件中的顺序
+            }
+            for position, chunk in enumerate(segment.chunks)
+        ]
+        self.bm25.add_document(file_id, chunks, segment, fingerprint)
+        # 两个索引共享同一批块对象，融合时按对象去重
+        self.vectors.add_document(file_id, chunks, segment.vectors)
+        self.questions.add_file(file_id, file_name, segment.question_records)
+
+    def remove_document(self, file_id: str):
+        self.bm25.remove_document(file_id)
+        self.vectors.remove_document(file_id)
+        self.questions.remove_file(file_id)
+
+    def file_chunks(self, file_id: str) -> List[Dict[str, Any]]:
+        return self.bm25.file_chunks(file_id)
+
+    def search(self, query: str, top_k: int, file_ids: Optional[Set[str]] = None) -> List[Tuple[float, Dict[str, Any]]]:
+        lexical = self.bm25.search(query, top_k * 2, file_ids)
+        semantic = self.vectors.search(dict(Counter(tokenize(query))), top_k * 2, file_ids)
+        fused: Dict[int, List[Any]] = {}
+        for results in (lexical, semantic):
+            for rank, (_, chunk) in enumerate(results):
+                entry = fused.setdefault(id(chunk), [0.0, chunk])
+                entry[0] += 1.0 / (self.RRF_K + rank + 1)
+        ranked = sorted(fused.values(), key=lambda entry: entry[0], reverse=True)[:top_k]
+        return [(score, chunk) for score, chunk in ranked]
+
+
+class SessionIndexRegistry:
+    """会话ID -> 检索索引，超过上限时淘汰最久未使用的会话（之后按需重建）"""
+
+    def __init__(self, max_sessions: int = 200, vector_dim: int = 4096):
+        self.max_sessions = max_sessions
+        self.vector_dim = vector_dim
+        self._indexes: "OrderedDict[str, SessionIndex]" = OrderedDict()
+
+    def get(self, session_id: str) -> SessionIndex:
+        index = self._indexes.get(session_id)
+        if index is None:
+            index = SessionIndex(self.vector_dim)
+            self._indexes[session_id] = index
+            while len(self._indexes) > self.max_sessions:
+                self._indexes.popitem(last=False)
+        else:
+            self._indexes.move_to_end(session_id)
+        return index
+
+    def remove_file(self, session_id: str, file_id: str):
+        index = self._indexes.get(session_id)
+        if index is not None:
+            index.remove_document(file_id)
@@ -0,0 +1,293 @@
+"""
+会话存储
+会话和文件元数据保存在SQLite（WAL模式）中：按会话ID、文件ID建立索引，
+上传/删除只改动对应的行，不再每次请求读取并整体重写 data/users/{session_id}.json。
+首次启动时把旧的JSON会话文件一次性导入数据库（原文件保留不动）
+"""
+
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional
+
+from backend.structured_log import get_logger
+
+log = get_logger("session")
+
+FILE_KINDS = ("knowledge", "questions")
+# 独立列存储的文件字段，其余字段放在 extra（JSON）中
+FILE_COLUMNS = ("name", "size", "type", "path", "upload_time")
+# 值为空时不出现在文件记录中的列（旧记录没有内容哈希）
+OPTIONAL_FILE_COLUMNS = ("content_hash",)
+STORED_COLUMNS = FILE_COLUMNS + OPTIONAL_FILE_COLUMNS
+INSERT_FILE_SQL = (
+    f"INTO files (session_id, file_id, kind, {', '.join(STORED_COLUMNS)}, extra) "
+    f"VALUES ({', '.join('?' * (len(STORED_COLUMNS) + 4))})"
+)
+UPDATE_FILE_SQL = f"UPDATE files SET {', '.join(f'{column} = ?' for column in STORED_COLUMNS)}, extra = ? WHERE seq = ?"
+# 不再保存到会话记录中的字段：提取的文本由解析缓存按文件内容保存
+DROPPED_FIELDS = ("content",)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    session_id TEXT PRIMARY KEY,
+    file_id_counter INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS files (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    session_id TEXT NOT NULL,
+    file_id TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    name TEXT,
+    size INTEGER,
+    type TEXT,
+    path TEXT,
+    upload_time TEXT,
+    content_hash TEXT,
+    extra TEXT
+);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_files_session_file ON files(session_id, file_id);
+CREATE INDEX IF NOT EXISTS idx_files_session_kind ON files(session_id, kind, seq);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+
+class SessionStore:
+    """基于SQLite的会话/文件元数据存储，所有方法线程安全"""
+
+    def __init__(self, db_path: str):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        self._upgrade_schema()
+
+    def _upgrade_schema(self):
+        """为旧版本创建的数据库补充新增的列和索引"""
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(files)")}
+        if "content_hash" not in columns:
+            self._conn.execute("ALTER TABLE files ADD COLUMN content_hash TEXT")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_files_content_hash ON files(content_hash)")
+
+    def _execute(self, sql: str, params: Iterable[Any] = ()) -> int:
+        """执行写语句，返回影响的行数"""
+        with self._lock:
+            return self._conn.execute(sql, tuple(params)).rowcount
+
+    def _query(self, sql: str, params: Iterable[Any] = ()) -> List[sqlite3.Row]:
+        with self._lock:
+            return self._conn.execute(sql, tuple(params)).fetchall()
+
+    @staticmethod
+    def _row_to_file(row: sqlite3.Row) -> Dict[str, Any]:
+        file_info = {"id": row["file_id"]}
+        for column in FILE_COLUMNS:
+            file_info[column] = row[column]
+        for column in OPTIONAL_FILE_COLUMNS:
+            if row[column] is not None:
+                file_info[column] = row[column]
+        if row["extra"]:
+            file_info.update(json.loads(row["extra"]))
+        return file_info
+
+    @staticmethod
+    def _file_values(session_id: str, kind: str, file_info: Dict[str, Any]) -> List[Any]:
+        extra = {
+            key: value for key, value in file_info.items()
+            if key != "id" and key not in STORED_COLUMNS and key not in DROPPED_FIELDS
+        }
+        return [session_id, str(file_info["id"]), kind] + [file_info.get(column) for column in STORED_COLUMNS] + [
+            json.dumps(extra, ensure_ascii=False) if extra else None
+        ]
+
+    # ---------- 会话 ----------
+
+    def create_session(self, session_id: str, file_id_counter: int = 0):
+        self._execute(
+            "INSERT OR IGNORE INTO sessions (session_id, file_id_counter, created_at) VALUES (?, ?, ?)",
+            (session_id, file_id_counter, time.time())
+        )
+
+    def session_exists(self, session_id: str) -> bool:
+        return bool(self._query("SELECT 1 FROM sessions WHERE session_id = ?", (session_id,)))
+
+    def session_ids(self) -> List[str]:
+        return [row[0] for row in self._query("SELECT session_id FROM sessions ORDER BY created_at")]
+
+    def next_file_counter(self, session_id: str) -> int:
+        """会话的文件计数器加一并返回新值（会话不存在时自动创建）"""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute(
+                    "INSERT OR IGNORE INTO sessions (session_id, file_id_counter, created_at) VALUES (?, 0, ?)",
+                    (session_id, time.time())
+                )
+                self._conn.execute(
+                    "UPDATE sessions SET file_id_counter = file_id_counter + 1 WHERE session_id = ?",
+                    (session_id,)
+                )
+                counter = self._conn.execute(
+                    "SELECT file_id_counter FROM sessions WHERE session_id = ?", (session_id,)
+                ).fetchone()[0]
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return counter
+
+    def count_files(self, session_id: str) -> Optional[Dict[str, int]]:
+        """各知识库的文件数，会话不存在时返回None"""
+        if not self.session_exists(session_id):
+            return None
+        counts = {kind: 0 for kind in FILE_KINDS}
+        for row in self._query(
+            "SELECT kind, COUNT(*) FROM files WHERE session_id = ? GROUP BY kind", (session_id,)
+        ):
+            counts[row[0]] = row[1]
+        return counts
+
+    def totals(self) -> Dict[str, Any]:
+        """所有会话合计的会话数和各知识库文件数"""
+        counts = {kind: 0 for kind in FILE_KINDS}
+        for row in self._query("SELECT kind, COUNT(*) FROM files GROUP BY kind"):
+            counts[row[0]] = row[1]
+        sessions = self._query("SELECT COUNT(*) FROM sessions")[0][0]
+        return {"sessions": sessions, "files": counts}
+
+    # ---------- 文件 ----------
+
+    def add_file(self, session_id: str, kind: str, file_info: Dict[str, Any]):
+        """加入（或替换同ID的）文件记录"""
+        self._execute(
+            "INSERT OR REPLACE " + INSERT_FILE_SQL,
+            self._file_values(session_id, kind, file_info)
+        )
+
+    def update_file(self, session_id: str, file_id: str, fields: Dict[str, Any]) -> bool:
+        """只更新一条文件记录的部分字段"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT * FROM files WHERE session_id = ? AND file_id = ?", (session_id, str(file_id))
+            ).fetchone()
+            if row is None:
+                return False
+            file_info = self._row_to_file(row)
+            file_info.update(fields)
+            values = self._file_values(session_id, row["kind"], file_info)
+            self._conn.execute(
+                UPDATE_FILE_SQL,
+                values[3:] + [row["seq"]]
+            )
+        return True
+
+    def get_file(self, session_id: str, file_id: str, kind: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        sql = "SELECT * FROM files WHERE session_id = ? AND file_id = ?"
+        params = [session_id, str(file_id)]
+        if kind is not None:
+            sql += " AND kind = ?"
+            params.append(kind)
+        rows = self._query(sql, params)
+        return self._row_to_file(rows[0]) if rows else None
+
+    def get_files(self, session_id: str, file_ids: Iterable[str]) -> List[Dict[str, Any]]:
+        """按给定的ID顺序返回存在的文件记录"""
+        file_ids = [str(file_id) for file_id in file_ids]
+        if not file_ids:
+            return []
+        placeholders = ",".join("?" * len(file_ids))
+        rows = self._query(
+            f"SELECT * FROM files WHERE session_id = ? AND file_id IN ({placeholders})",
+            [session_id] + file_ids
+        )
+        by_id = {row["file_id"]: self._row_to_file(row) for row in rows}
+        return [by_id[file_id] for file_id in file_ids if file_id in by_id]
+
+    def list_files(self, session_id: str, kind: Optional[str] = None) -> List[Dict[str, Any]]:
+        """按上传顺序列出文件；不指定 kind 时先知识库后题库"""
+        if kind is not None:
+            rows = self._query(
+                "SELECT * FROM files WHERE session_id = ? AND kind = ? ORDER BY seq", (session_id, kind)
+            )
+            return [self._row_to_file(row) for row in rows]
+        return [file_info for kind in FILE_KINDS for file_info in self.list_files(session_id, kind)]
+
+    def remove_files(self, session_id: str, file_ids: Iterable[str]) -> int:
+        file_ids = [str(file_id) for file_id in file_ids]
+        if not file_ids:
+            return 0
+        placeholders = ",".join("?" * len(file_ids))
+        return self._execute(
+            f"DELETE FROM files WHERE session_id = ? AND file_id IN ({placeholders})",
+            [session_id] + file_ids
+        )
+
+    def remove_file(self, session_id: str, file_id: str) -> bool:
+        return self.remove_files(session_id, [file_id]) > 0
+
+    def find_file_by_name(self, session_id: str, kind: str, name: str) -> Optional[Dict[str, Any]]:
+        rows = self._query(
+            "SELECT * FROM files WHERE session_id = ? AND kind = ? AND name = ? ORDER BY seq DESC LIMIT 1",
+            (session_id, kind, name)
+        )
+        return self._row_to_file(rows[0]) if rows else None
+
+    def count_content_refs(self, content_hash: str) -> int:
+        """引用同一内容（blob）的文件记录数，所有会话合计"""
+        return self._query("SELECT COUNT(*) FROM files WHERE content_hash = ?", (content_hash,))[0][0]
+
+    # ---------- 迁移 ----------
+
+    def migrate_json_sessions(self, users_dir: Path) -> int:
+        """把旧的 data/users/*.json 会话文件导入数据库，只执行一次；返回导入的会话数"""
+        with self._lock:
+            done = self._conn.execute("SELECT value FROM meta WHERE key = 'json_migrated'").fetchone()
+        if done:
+            return 0
+        migrated = 0
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                for user_file in sorted(Path(users_dir).glob("*.json")):
+                    try:
+                        with open(user_file, 'r', encoding='utf-8') as f:
+                            data = json.load(f)
+                    except (OSError, ValueError) as e:
+                        log.warning("迁移会话文件失败", path=str(user_file), error=str(e))
+                        continue
+                    session_id = user_file.stem
+                    self._conn.execute(
+                        "INSERT OR IGNORE INTO sessions (session_id, file_id_counter, created_at) VALUES (?, ?, ?)",
+                        (session_id, int(data.get("file_id_counter", 0)), user_file.stat().st_mtime)
+                    )
+                    for kind in FILE_KINDS:
+                        for file_info in data.get(kind, []):
+                            if "id" not in file_info:
+                                continue
+                            self._conn.execute(
+                                "INSERT OR IGNORE " + INSERT_FILE_SQL,
+                                self._file_values(session_id, kind, file_info)
+                            )
+                    migrated += 1
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO meta (key, value) VALUES ('json_migrated', ?)", (str(time.time()),)
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return migrated
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
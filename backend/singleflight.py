@@ -0,0 +1,39 @@
+"""
+并发请求合并（single-flight）
+相同键的工作同时只执行一次：第一个请求发起任务，其余并发请求等待同一个任务的结果。
+任务独立于发起者运行，发起请求被取消（如客户端断开）时不影响其他等待者
+"""
+
+import asyncio
+from typing import Any, Awaitable, Callable, Dict
+
+
+class SingleFlight:
+    """按键合并并发的异步任务"""
+
+    def __init__(self, name: str = ""):
+        self.name = name
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self.counters = {"leaders": 0, "followers": 0}
+
+    def _done(self, key: str, task: asyncio.Future):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        # 标记异常已被读取，避免所有等待者都被取消时出现 "exception was never retrieved" 警告
+        if not task.cancelled():
+            task.exception()
+
+    async def do(self, key: str, func: Callable[[], Awaitable[Any]]) -> Any:
+        """执行 func 或等待正在执行的相同任务，返回共享的结果（异常同样共享）"""
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(func())
+            self._inflight[key] = task
+            task.add_done_callback(lambda done, key=key: self._done(key, done))
+            self.counters["leaders"] += 1
+        else:
+            self.counters["followers"] += 1
+        return await asyncio.shield(task)
+
+    def in_flight(self) -> int:
+        return len(self._inflight)
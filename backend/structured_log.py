@@ -0,0 +1,218 @@
+"""
+结构化日志
+日志记录通过有界队列交给后台线程（QueueHandler/QueueListener）格式化为JSON并写出，
+请求处理只做一次入队：队列满时直接丢弃并计数，不会阻塞事件循环；
+INFO及以下级别可按类别采样，字段值超过长度上限时截断
+"""
+
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import sys
+import threading
+import traceback
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional
+
+ROOT_LOGGER = "exam"
+TRUNCATED_MARK = "…(截断，原长 {} 字符)"
+
+
+def parse_sample_rates(spec: str) -> Dict[str, float]:
+    """解析 "request=0.1,upstream=0.5" 形式的采样率配置"""
+    rates: Dict[str, float] = {}
+    for item in (spec or "").split(","):
+        if "=" not in item:
+            continue
+        category, rate = item.split("=", 1)
+        try:
+            rates[category.strip()] = min(1.0, max(0.0, float(rate)))
+        except ValueError:
+            continue
+    return rates
+
+
+def truncate(value: str, max_chars: int) -> str:
+    if len(value) <= max_chars:
+        return value
+    return value[:max_chars] + TRUNCATED_MARK.format(len(value))
+
+
+class LogStats:
+    """各类别日志的写出/采样丢弃/队列满丢弃计数"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts: Dict[tuple, int] = {}
+
+    def inc(self, category: str, outcome: str):
+        with self._lock:
+            self.counts[(category, outcome)] = self.counts.get((category, outcome), 0) + 1
+
+    def snapshot(self) -> Dict[tuple, int]:
+        with self._lock:
+            return dict(self.counts)
+
+
+def _category(record: logging.LogRecord) -> str:
+    return record.name[len(ROOT_LOGGER) + 1:] if record.name.startswith(ROOT_LOGGER + ".") else record.name
+
+
+class SamplingFilter(logging.Filter):
+    """按类别采样INFO及以下级别的日志，WARNING及以上始终保留"""
+
+    def __init__(self, rates: Dict[str, float], stats: LogStats):
+        super().__init__()
+        self.rates = rates
+        self.stats = stats
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        category = _category(record)
+        rate = self.rates.get(category, 1.0)
+        if rate >= 1.0 or random.random() < rate:
+            return True
+        self.stats.inc(category, "sampled_out")
+        return False
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """队列满时丢弃记录而不是等待"""
+
+    def __init__(self, log_queue: queue.Queue, stats: LogStats, max_chars: int):
+        super().__init__(log_queue)
+        self.stats = stats
+        self.max_chars = max_chars
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # 只在调用方线程里拼接消息、格式化异常（异常对象引用的栈帧不能跨线程保留），
+        # JSON序列化留给后台线程
+        record.msg = truncate(record.getMessage(), self.max_chars)
+        record.args = None
+        if record.exc_info:
+            record.exc_text = truncate("".join(traceback.format_exception(*record.exc_info)), self.max_chars * 4)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.stats.inc(_category(record), "dropped")
+
+
+class JsonFormatter(logging.Formatter):
+    """一行一个JSON对象：时间、级别、类别、消息和结构化字段"""
+
+    def __init__(self, max_chars: int, stats: LogStats):
+        super().__init__()
+        self.max_chars = max_chars
+        self.stats = stats
+
+    def _field_value(self, value: Any) -> Any:
+        if value is None or isinstance(value, (bool, int, float)):
+            return value
+        if isinstance(value, str):
+            return truncate(value, self.max_chars)
+        try:
+            text = json.dumps(value, ensure_ascii=False, default=str)
+        except (TypeError, ValueError):
+            return truncate(repr(value), self.max_chars)
+        # 未超长的字典/列表保持原结构，超长时截断为字符串
+        return value if len(text) <= self.max_chars else truncate(text, self.max_chars)
+
+    def format(self, record: logging.LogRecord) -> str:
+        category = _category(record)
+        entry: Dict[str, Any] = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "category": category,
+            "msg": record.getMessage(),
+        }
+        fields = getattr(record, "fields", None)
+        if fields:
+            for key, value in fields.items():
+                entry[key] = self._field_value(value)
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        self.stats.inc(category, "emitted")
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class EventLogger:
+    """带结构化字段的日志接口：logger.info("消息", 字段=值, ...)"""
+
+    def __init__(self, logger: logging.Logger):
+        self.logger = logger
+
+    def log(self, level: int, msg: str, exc_info: bool = False, **fields):
+        # 级别未开启时不构造记录
+        if self.logger.isEnabledFor(level):
+            self.logger.log(level, msg, exc_info=exc_info, extra={"fields": fields})
+
+    def debug(self, msg: str, **fields):
+        self.log(logging.DEBUG, msg, **fields)
+
+    def info(self, msg: str, **fields):
+        self.log(logging.INFO, msg, **fields)
+
+    def warning(self, msg: str, **fields):
+        self.log(logging.WARNING, msg, **fields)
+
+    def error(self, msg: str, exc_info: bool = False, **fields):
+        self.log(logging.ERROR, msg, exc_info=exc_info, **fields)
+
+
+log_stats = LogStats()
+_listener: Optional[logging.handlers.QueueListener] = None
+_setup_lock = threading.Lock()
+
+
+def setup_logging(
+    level: str = "INFO",
+    queue_size: int = 10000,
+    sample_rates: Optional[Dict[str, float]] = None,
+    max_field_chars: int = 2000,
+    log_file: Optional[str] = None
+):
+    """配置 exam.* 日志并启动后台写出线程（重复调用时忽略）"""
+    global _listener
+    with _setup_lock:
+        if _listener is not None:
+            return
+        if log_file:
+            output: logging.Handler = logging.handlers.WatchedFileHandler(log_file, encoding="utf-8")
+        else:
+            output = logging.StreamHandler(sys.stdout)
+        output.setFormatter(JsonFormatter(max_field_chars, log_stats))
+
+        log_queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        queue_handler = DroppingQueueHandler(log_queue, log_stats, max_field_chars)
+        queue_handler.addFilter(SamplingFilter(sample_rates or {}, log_stats))
+
+        root = logging.getLogger(ROOT_LOGGER)
+        root.setLevel(level.upper())
+        root.handlers = [queue_handler]
+        root.propagate = False
+
+        _listener = logging.handlers.QueueListener(log_queue, output)
+        _listener.start()
+        atexit.register(shutdown_logging)
+
+
+def shutdown_logging():
+    """写出队列中剩余的日志并停止后台线程"""
+    global _listener
+    with _setup_lock:
+        if _listener is None:
+            return
+        _listener.stop()
+        _listener = None
+
+
+def get_logger(category: str) -> EventLogger:
+    return EventLogger(logging.getLogger(f"{ROOT_LOGGER}.{category}"))
@@ -0,0 +1,120 @@
+"""
+按模型上下文窗口分配知识库上下文
+用本地的快速估算代替分词器：中文（及全角标点）和其他非ASCII字符按每字1个token、英文按每4个字母1个token、数字按每3位1个token、
+标点符号每个1个token计算，对常见模型的分词结果略为高估，保证不会超出窗口；
+再按检索得分从高到低把文本块装入剩余预算，装入的块按固定顺序排列；
+需要把知识库分给多个并发请求时，按固定顺序切成token数相近的连续切片
+"""
+
+import math
+import re
+import string
+from typing import Any, Dict, List, Sequence, Tuple
+
+CJK_RE = re.compile(r'[　-〿㐀-䶿一-鿿豈-﫿＀-￯]')
+ASCII_LETTERS = string.ascii_letters.encode()
+ASCII_DIGITS = string.digits.encode()
+ASCII_SYMBOLS = string.punctuation.encode()
+ALL_BYTES = bytes(range(128))
+# bytes.translate(None, delete) 的删除表：只保留某一类ASCII字符
+NON_LETTERS = bytes(b for b in ALL_BYTES if b not in ASCII_LETTERS)
+NON_DIGITS = bytes(b for b in ALL_BYTES if b not in ASCII_DIGITS)
+NON_SYMBOLS = bytes(b for b in ALL_BYTES if b not in ASCII_SYMBOLS)
+
+# 为消息格式、角色标记等额外开销预留的token数
+SAFETY_MARGIN_TOKENS = 256
+# 剩余预算不足以放下整块时，至少还剩这么多token才截取块的前半部分
+MIN_PARTIAL_TOKENS = 128
+
+
+def estimate_tokens(text: str) -> int:
+    """估算文本的token数（中英文混合）"""
+    if not text:
+        return 0
+    ascii_bytes = text.encode('ascii', 'ignore')
+    cjk = len(CJK_RE.findall(text))
+    # 其他非ASCII字符（希腊字母、数学符号等）每个按1个token计
+    other = len(text) - len(ascii_bytes) - cjk
+    return (
+        cjk
+        + other
+        + math.ceil(len(ascii_bytes.translate(None, NON_LETTERS)) / 4)
+        + math.ceil(len(ascii_bytes.translate(None, NON_DIGITS)) / 3)
+        + len(ascii_bytes.translate(None, NON_SYMBOLS))
+    )
+
+
+def context_budget(context_window: int, output_tokens: int, prompt_tokens: int, max_context_tokens: int) -> int:
+    """扣除输出预留、提示词模板和安全余量后，可用于知识库内容的token数"""
+    available = context_window - output_tokens - prompt_tokens - SAFETY_MARGIN_TOKENS
+    return max(0, min(available, max_context_tokens))
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """截取文本开头，使估算的token数不超过 max_tokens"""
+    low, high = 0, len(text)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if estimate_tokens(text[:middle]) <= max_tokens:
+            low = middle
+        else:
+            high = middle - 1
+    return text[:low]
+
+
+def pack_chunks(
+    candidates: Sequence[Tuple[float, Tuple, str, int]],
+    budget_tokens: int
+) -> List[Tuple[Tuple, str]]:
+    """
+    candidates 为 (得分, 排序键, 渲染后的文本行, 该行token数)；按得分从高到低贪心装入预算，
+    放不下的块跳过（继续尝试更小的块），预算还剩不少时截取放不下的块的开头。
+    返回选中的 (排序键, 文本行)，按排序键而不是得分排列，选中相同的块时总是得到相同的文本
+    """
+    selected: List[Tuple[Tuple, str]] = []
+    remaining = budget_tokens
+    for _, key, line, tokens in sorted(candidates, key=lambda item: item[0], reverse=True):
+        if remaining <= 0:
+            break
+        # 每行额外计入1个换行符
+        cost = tokens + 1
+        if cost <= remaining:
+            selected.append((key, line))
+            remaining -= cost
+        elif remaining >= MIN_PARTIAL_TOKENS:
+            partial = truncate_to_tokens(line, remaining - 1)
+            if partial:
+                selected.append((key, partial + "…"))
+                remaining -= estimate_tokens(partial) + 2
+    selected.sort(key=lambda item: item[0])
+    return selected
+
+
+def split_candidates(
+    candidates: Sequence[Tuple[float, Tuple, str, int]],
+    parts: int
+) -> List[List[Tuple[float, Tuple, str, int]]]:
+    """按排序键把候选块切成 parts 段连续的切片，各切片的token数尽量接近（块数少于 parts 时只返回非空的切片）"""
+    ordered = sorted(candidates, key=lambda item: item[1])
+    total = sum(tokens + 1 for _, _, _, tokens in ordered)
+    slices: List[List[Tuple[float, Tuple, str, int]]] = []
+    current: List[Tuple[float, Tuple, str, int]] = []
+    used = 0
+    for candidate in ordered:
+        current.append(candidate)
+        used += candidate[3] + 1
+        # 累计token数达到第 k 个等分点时结束当前切片
+        if len(slices) < parts - 1 and used >= total * (len(slices) + 1) / parts:
+            slices.append(current)
+            current = []
+    if current:
+        slices.append(current)
+    return slices
+
+
+def group_lines(selected: List[Tuple[Tuple, str]]) -> Dict[Any, str]:
+    """把选中的文本行按排序键的第一项（分组）拼接"""
+    grouped: Dict[Any, List[str]] = {}
+    for key, line in selected:
+        grouped.setdefault(key[0], []).append(line)
+    return {group: "\n".join(lines) for group, lines in grouped.items()}
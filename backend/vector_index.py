@@ -0,0 +1,108 @@
+"""
+本地稠密向量检索
+不依赖网络和外部模型：把文本块的字符n-gram（与BM25相同的单字/双字/英文单词）
+哈希到固定维度，按TF-IDF加权后做余弦相似度检索。
+每份文档的块向量存放在一个只读的NumPy矩阵（向量段）中，内容相同的文件在各会话之间共享同一个段；
+会话索引只引用这些段并维护IDF，一次查询对每个段做一次矩阵-向量乘法
+"""
+
+import zlib
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+import numpy as np
+
+
+def vectorize(term_freqs: Dict[str, int], dim: int) -> np.ndarray:
+    """词频 -> 哈希后的次线性TF向量（1 + log tf）"""
+    vector = np.zeros(dim, dtype=np.float32)
+    for term, freq in term_freqs.items():
+        vector[zlib.crc32(term.encode('utf-8')) % dim] += freq
+    nonzero = vector > 0
+    vector[nonzero] = 1.0 + np.log(vector[nonzero])
+    return vector
+
+
+class VectorSegment:
+    """一份文档所有块的哈希TF矩阵（构建后只读，可被多个索引引用）"""
+
+    def __init__(self, term_freqs: List[Dict[str, int]], dim: int = 4096):
+        self.dim = dim
+        self.matrix = np.zeros((len(term_freqs), dim), dtype=np.float32)
+        for row, freqs in enumerate(term_freqs):
+            self.matrix[row] = vectorize(freqs, dim)
+        # 每个哈希桶出现在本文档多少个块中，会话索引累加后计算IDF
+        self.doc_freq = (self.matrix > 0).sum(axis=0).astype(np.float32)
+        self.matrix.setflags(write=False)
+
+    def __len__(self) -> int:
+        return self.matrix.shape[0]
+
+
+class VectorIndex:
+    """哈希TF-IDF向量索引：按文件引用共享的向量段，支持增量增删"""
+
+    def __init__(self, dim: int = 4096):
+        self.dim = dim
+        # 文件ID -> (向量段, 与段中各行对应的块对象)
+        self._files: Dict[str, Tuple[VectorSegment, List[Dict[str, Any]]]] = {}
+        self._active_rows = 0
+        self._doc_freq = np.zeros(dim, dtype=np.float32)
+        self._idf: Optional[np.ndarray] = None
+        # 文件ID -> 各行IDF加权后的范数，随IDF一起失效
+        self._norms: Dict[str, np.ndarray] = {}
+
+    def add_document(self, file_id: str, chunks: List[Dict[str, Any]], segment: VectorSegment):
+        """加入（或替换）一个文件；chunks 与段中的行一一对应"""
+        self.remove_document(file_id)
+        if not chunks:
+            return
+        self._files[file_id] = (segment, chunks)
+        self._active_rows += len(chunks)
+        self._doc_freq += segment.doc_freq
+        self._idf = None
+
+    def remove_document(self, file_id: str):
+        entry = self._files.pop(file_id, None)
+        if entry is None:
+            return
+        segment, chunks = entry
+        self._active_rows -= len(chunks)
+        self._doc_freq -= segment.doc_freq
+        self._idf = None
+
+    def _refresh_weights(self):
+        """IDF随文档增删变化，重新计算IDF和每行加权后的范数（惰性执行）"""
+        active = max(self._active_rows, 1)
+        self._idf = np.log((1 + active) / (1 + self._doc_freq)).astype(np.float32) + 1.0
+        self._norms = {}
+        for file_id, (segment, _) in self._files.items():
+            weighted = segment.matrix * self._idf
+            norms = np.sqrt(np.einsum('ij,ij->i', weighted, weighted))
+            norms[norms == 0] = 1.0
+            self._norms[file_id] = norms
+
+    def search(self, term_freqs: Dict[str, int], top_k: int, file_ids: Optional[Set[str]] = None) -> List[Tuple[float, Dict[str, Any]]]:
+        """按余弦相似度返回 top_k 个块，可限定在指定文件内"""
+        if self._active_rows == 0 or not term_freqs or top_k <= 0:
+            return []
+        if self._idf is None:
+            self._refresh_weights()
+        query = vectorize(term_freqs, self.dim) * self._idf
+        query_norm = float(np.linalg.norm(query))
+        if query_norm == 0:
+            return []
+        # 行向量存的是未加权TF，乘以 idf^2 等价于两侧都做IDF加权
+        weighted_query = query * self._idf
+        results: List[Tuple[float, Dict[str, Any]]] = []
+        for file_id in (self._files if file_ids is None else file_ids):
+            entry = self._files.get(file_id)
+            if entry is None:
+                continue
+            segment, chunks = entry
+            scores = (segment.matrix @ weighted_query) / (self._norms[file_id] * query_norm)
+            rows = np.flatnonzero(scores > 0)
+            if len(rows) > top_k:
+                rows = rows[np.argpartition(-scores[rows], top_k - 1)[:top_k]]
+            results.extend((float(scores[row]), chunks[row]) for row in rows)
+        results.sort(key=lambda item: item[0], reverse=True)
+        return results[:top_k]
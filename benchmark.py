@@ -0,0 +1,293 @@
+#!/usr/bin/env python3
+"""
+后端热点路径基准测试
+覆盖：各类型文件内容提取（data/uploads 下的PDF、合成的大DOCX/TXT）、聊天提示词（知识库上下文）构建、
+合成题库（1千～10万题）的切分与题号查询、会话数据库读写。
+结果以JSON输出，可保存为基线并与之比较：
+    python benchmark.py --output bench.json                 # 运行并保存结果
+    python benchmark.py --baseline bench.json               # 与基线比较，变慢超过阈值时以非0状态码退出
+    python benchmark.py --only question --quick             # 只运行名称包含 question 的项目，缩小数据规模
+"""
+
+import argparse
+import asyncio
+import glob
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO_ROOT = os.path.dirname(os.path.abspath(__file__))
+UPLOADS_GLOB = os.path.join(REPO_ROOT, "data", "uploads", "**", "*.pdf")
+DEFAULT_THRESHOLD = 0.10  # 中位数变慢超过10%视为退化
+
+PARAGRAPH = (
+    "伺服电动机的控制方式分为位置控制、速度控制和转矩控制三种。"
+    "The servo drive compares the command signal with encoder feedback and corrects the error. "
+    "步进电动机按脉冲数转动固定角度，适合开环定位。"
+)
+
+
+def measure(func, repeat, number=1):
+    """调用 func number 次为一轮，共 repeat 轮；返回每次调用的耗时统计（毫秒）"""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        samples.append((time.perf_counter() - start) * 1000 / number)
+    samples.sort()
+    return {
+        "median_ms": round(statistics.median(samples), 4),
+        "min_ms": round(samples[0], 4),
+        "mean_ms": round(statistics.fmean(samples), 4),
+        "p95_ms": round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 4),
+        "runs": repeat,
+        "calls_per_run": number,
+    }
+
+
+def run_async(loop, coro_func):
+    return lambda: loop.run_until_complete(coro_func())
+
+
+def make_text_file(path, paragraphs):
+    with open(path, "w", encoding="utf-8") as f:
+        for i in range(paragraphs):
+            f.write(f"第{i // 50 + 1}节 {PARAGRAPH}\n")
+    return path
+
+
+def make_docx_file(path, paragraphs):
+    import docx
+    document = docx.Document()
+    for i in range(paragraphs):
+        if i % 50 == 0:
+            document.add_heading(f"第{i // 50 + 1}节 伺服系统", level=1)
+        document.add_paragraph(PARAGRAPH)
+    document.save(path)
+    return path
+
+
+def make_question_bank(count):
+    """合成题库文本：每题包含题号、题干、答案和解析，每20题一页"""
+    parts = []
+    for i in range(count):
+        if i % 20 == 0:
+            parts.append(f"【第{i // 20 + 1}页】")
+        chapter, number = divmod(i, 100)
+        parts.append(
+            f"题目{chapter + 1}-{number + 1}：简述第{i}种控制方式的特点。\n"
+            f"答案：该方式通过反馈环节实现闭环控制。\n解析：考查伺服系统的基本组成。\n---"
+        )
+    return "\n".join(parts)
+
+
+def bench_extraction(main, loop, workdir, quick):
+    results = {}
+    pdfs = sorted(glob.glob(UPLOADS_GLOB, recursive=True))
+    for path in pdfs[:1] if quick else pdfs:
+        name = os.path.basename(path)
+        results[f"extract.pdf.{name}"] = dict(
+            measure(run_async(loop, lambda: main.extract_file_content(path, main.PDF_TYPE)), repeat=3),
+            bytes=os.path.getsize(path)
+        )
+    paragraphs = 2000 if quick else 20000
+    txt_path = make_text_file(os.path.join(workdir, "synthetic.txt"), paragraphs)
+    results["extract.txt"] = dict(
+        measure(run_async(loop, lambda: main.extract_file_content(txt_path, "text/plain")), repeat=5),
+        bytes=os.path.getsize(txt_path)
+    )
+    try:
+        docx_path = make_docx_file(os.path.join(workdir, "synthetic.docx"), paragraphs // 4)
+    except ImportError:
+        results["extract.docx"] = {"skipped": "未安装 python-docx"}
+    else:
+        results["extract.docx"] = dict(
+            measure(run_async(loop, lambda: main.extract_file_content(docx_path, main.DOCX_TYPE)), repeat=3),
+            bytes=os.path.getsize(docx_path)
+        )
+    # 解析缓存命中：同一文件第二次读取
+    loop.run_until_complete(main.extract_file_content_cached(txt_path, "text/plain"))
+    results["extract.txt.cached"] = measure(
+        run_async(loop, lambda: main.extract_file_content_cached(txt_path, "text/plain")), repeat=20
+    )
+    return results
+
+
+def bench_context(main, loop, workdir, quick):
+    results = {}
+    paragraphs = 500 if quick else 3000
+    knowledge = [
+        {"id": f"kb{i}", "name": f"资料{i}.txt", "content": main.normalize_extracted_text(
+            open(make_text_file(os.path.join(workdir, f"kb{i}.txt"), paragraphs), encoding="utf-8").read()
+        )}
+        for i in range(3)
+    ]
+    questions = [{"id": "qb", "name": "题库.txt", "content": make_question_bank(500)}]
+    counter = iter(range(10 ** 9))
+
+    def cold():
+        # 每次使用新会话并清空共享的文档段，包含切块和建索引
+        main.shared_segments.clear()
+        return main.build_chat_prompt("伺服电动机有哪些控制方式？", knowledge, questions, f"bench-cold-{next(counter)}")
+
+    results["context.build_chat_prompt.cold"] = measure(run_async(loop, cold), repeat=3)
+    loop.run_until_complete(main.build_chat_prompt("预热", knowledge, questions, "bench-warm"))
+    results["context.build_chat_prompt.warm"] = measure(run_async(
+        loop, lambda: main.build_chat_prompt("伺服电动机有哪些控制方式？", knowledge, questions, "bench-warm")
+    ), repeat=20)
+    results["context.question_number_hit"] = measure(run_async(
+        loop, lambda: main.build_chat_prompt("3-15题的答案是什么", knowledge, questions, "bench-warm")
+    ), repeat=50)
+    return results
+
+
+def bench_questions(main, quick):
+    from backend.question_bank import QuestionBankIndex, parse_question_bank
+    results = {}
+    sizes = (1000, 10000) if quick else (1000, 10000, 100000)
+    for size in sizes:
+        content = make_question_bank(size)
+        results[f"question.parse.{size}"] = dict(
+            measure(lambda: parse_question_bank(content), repeat=3), chars=len(content)
+        )
+        index = QuestionBankIndex()
+        index.add_file("bank", "题库.txt", parse_question_bank(content))
+        rng = random.Random(size)
+        queries = [f"{rng.randint(1, size // 100)}.{rng.randint(1, 100)}" for _ in range(1000)]
+        results[f"question.lookup.{size}"] = measure(
+            lambda: [index.lookup(query, {"bank"}) for query in queries], repeat=5
+        )
+        results[f"question.lookup.{size}"]["lookups_per_call"] = len(queries)
+    return results
+
+
+def bench_sessions(workdir, quick):
+    from backend.session_store import SessionStore
+    results = {}
+    store = SessionStore(os.path.join(workdir, "bench_sessions.db"))
+    file_count = 100 if quick else 500
+    session_id = "bench-session"
+    store.create_session(session_id)
+
+    def add_files():
+        for _ in range(file_count):
+            counter = store.next_file_counter(session_id)
+            store.add_file(session_id, "knowledge", {
+                "id": f"file_{counter}", "name": f"资料{counter}.pdf", "size": 1024, "type": "application/pdf",
+                "path": f"/tmp/{counter}.pdf", "upload_time": "2024-01-01T00:00:00", "content_hash": f"{counter:064x}"
+            })
+
+    results["session.save"] = dict(measure(add_files, repeat=1), files=file_count)
+    file_ids = [f["id"] for f in store.list_files(session_id)][:50]
+    results["session.list_files"] = dict(measure(lambda: store.list_files(session_id), repeat=20), files=file_count)
+    results["session.get_files.50"] = measure(lambda: store.get_files(session_id, file_ids), repeat=20)
+    results["session.count_files"] = measure(lambda: store.count_files(session_id), repeat=20, number=10)
+    store.close()
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, capture_output=True, text=True, timeout=10
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def run_benchmarks(only, quick):
+    # 在临时目录中运行，避免解析缓存、会话数据库等写入仓库的 data/ 目录
+    workdir = tempfile.mkdtemp(prefix="bench-")
+    os.chdir(workdir)
+    os.environ.setdefault("LLM_PREWARM", "false")
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    sys.path.insert(0, REPO_ROOT)
+    from backend import main
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    groups = {
+        "extract": lambda: bench_extraction(main, loop, workdir, quick),
+        "context": lambda: bench_context(main, loop, workdir, quick),
+        "question": lambda: bench_questions(main, quick),
+        "session": lambda: bench_sessions(workdir, quick),
+    }
+    results = {}
+    for name, group in groups.items():
+        if only and not any(pattern in name for pattern in only):
+            continue
+        print(f"⏱  {name} ...", file=sys.stderr)
+        results.update(group())
+    main.parser_pool.shutdown()
+    loop.close()
+    os.chdir(REPO_ROOT)
+    shutil.rmtree(workdir, ignore_errors=True)
+    return {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "quick": quick,
+        },
+        "results": results,
+    }
+
+
+def compare(current, baseline, threshold):
+    """按中位数与基线比较，返回是否有退化"""
+    regressed = False
+    print(f"\n{'项目':<44}{'基线(ms)':>12}{'当前(ms)':>12}{'变化':>10}")
+    for name, result in current["results"].items():
+        base = baseline.get("results", {}).get(name)
+        if "median_ms" not in result or not base or "median_ms" not in base:
+            print(f"{name:<44}{'-':>12}{result.get('median_ms', '-'):>12}{'新增':>10}")
+            continue
+        change = (result["median_ms"] - base["median_ms"]) / base["median_ms"] if base["median_ms"] else 0.0
+        mark = ""
+        if change > threshold:
+            mark = " ❌"
+            regressed = True
+        elif change < -threshold:
+            mark = " ✅"
+        print(f"{name:<44}{base['median_ms']:>12.3f}{result['median_ms']:>12.3f}{change:>+9.1%}{mark}")
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="后端热点路径基准测试")
+    parser.add_argument("--output", help="把结果JSON写入文件（默认输出到标准输出）")
+    parser.add_argument("--baseline", help="与此基线JSON比较")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="判定退化的中位数变慢比例")
+    parser.add_argument("--only", action="append", help="只运行名称包含该字符串的组：extract/context/question/session")
+    parser.add_argument("--quick", action="store_true", help="缩小数据规模，用于快速检查")
+    args = parser.parse_args()
+
+    output = os.path.abspath(args.output) if args.output else None
+    baseline_path = os.path.abspath(args.baseline) if args.baseline else None
+    report = run_benchmarks(args.only, args.quick)
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if output:
+        with open(output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+        print(f"结果已写入 {output}", file=sys.stderr)
+    elif not baseline_path:
+        print(text)
+    if baseline_path:
+        with open(baseline_path, encoding="utf-8") as f:
+            baseline = json.load(f)
+        return 1 if compare(report, baseline, args.threshold) else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,369 @@
+#!/usr/bin/env python3
+"""
+端到端压测脚本
+启动一个本地的 OpenAI 兼容模拟上游（可配置首字延迟、生成速度、流式输出和错误注入），
+再以指定并发依次压测 /upload、/knowledge-base-content、/chat、/generate-questions，
+输出每个接口的吞吐量和 p50/p95/p99 延迟，无需真实的大模型API即可评估容量。
+
+用法:
+    python load_test.py --start-backend                          # 同时启动一个临时后端（数据写入临时目录）
+    python load_test.py --target http://127.0.0.1:8000 -c 50 -n 500 --error-rate 0.05
+    python load_test.py upstream --port 9100 --latency 0.5       # 只启动模拟上游
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import random
+import re
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+
+REPO_ROOT = os.path.dirname(os.path.abspath(__file__))
+PHASES = ("upload", "kb_content", "chat", "questions")
+# 模拟上游出题用的考点和问法
+MOCK_SUBJECTS = ("伺服系统", "步进电动机", "直流电动机", "交流电动机", "变频器", "编码器", "PLC", "PID控制器")
+MOCK_ASPECTS = ("由哪些部分组成？", "的工作原理是什么？", "有哪些常见故障？", "的主要性能指标有哪些？")
+
+KNOWLEDGE_TEXT = (
+    "伺服电动机的控制方式分为位置控制、速度控制和转矩控制三种。"
+    "步进电动机按脉冲数转动固定角度，适合开环定位。"
+    "直流电动机的调速方法有调压调速、串电阻调速和弱磁调速。\n"
+)
+
+
+# ---------- 模拟上游 ----------
+
+def create_upstream_app(latency, jitter, token_rate, completion_tokens, error_rate, error_status):
+    """OpenAI 兼容的 /chat/completions 模拟实现"""
+    from fastapi import FastAPI, Request
+    from fastapi.responses import JSONResponse, StreamingResponse
+
+    app = FastAPI()
+    token = "答"
+
+    # 依次轮换考点和问法，同一次出题的各个子请求得到的是不同的题目
+    question_sequence = itertools.count()
+
+    def questions_text(count):
+        numbers = [next(question_sequence) for _ in range(count)]
+        return json.dumps({
+            "questions": [
+                {"question": f"{MOCK_SUBJECTS[n % len(MOCK_SUBJECTS)]}{MOCK_ASPECTS[n // len(MOCK_SUBJECTS) % len(MOCK_ASPECTS)]}",
+                 "answer": "模拟答案", "explanation": "模拟解析", "source": "generated"}
+                for n in numbers
+            ],
+            "total": count,
+            "source_type": "基于知识点生成"
+        }, ensure_ascii=False)
+
+    @app.get("/models")
+    async def models():
+        return {"data": [{"id": "mock"}]}
+
+    @app.post("/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        messages = body.get("messages") or []
+        prompt_chars = sum(len(str(message.get("content", ""))) for message in messages)
+        await asyncio.sleep(max(0.0, latency + random.uniform(-jitter, jitter)))
+        if random.random() < error_rate:
+            return JSONResponse({"error": {"message": "injected error"}}, status_code=error_status)
+
+        if any("JSON格式" in str(message.get("content", "")) for message in messages):
+            match = re.search(r'生成(\d+)道', str(messages[-1].get("content", "")))
+            text = questions_text(int(match.group(1)) if match else 5)
+        else:
+            text = token * completion_tokens
+        # 以固定速度逐字“生成”，中文大致一字一token
+        pieces = [text[i:i + 4] for i in range(0, len(text), 4)]
+        piece_delay = 4 / token_rate if token_rate > 0 else 0
+        usage = {"prompt_tokens": prompt_chars // 2, "completion_tokens": len(text)}
+
+        if body.get("stream"):
+            async def generate():
+                for piece in pieces:
+                    yield "data: " + json.dumps({"choices": [{"delta": {"content": piece}}]}, ensure_ascii=False) + "\n\n"
+                    await asyncio.sleep(piece_delay)
+                yield "data: " + json.dumps({"choices": [{"delta": {}, "finish_reason": "stop"}], "usage": usage}) + "\n\n"
+                yield "data: [DONE]\n\n"
+            return StreamingResponse(generate(), media_type="text/event-stream")
+
+        await asyncio.sleep(piece_delay * len(pieces))
+        return {
+            "model": body.get("model"),
+            "choices": [{"message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+            "usage": usage
+        }
+
+    return app
+
+
+def serve_upstream(args):
+    import uvicorn
+    app = create_upstream_app(
+        args.latency, args.jitter, args.token_rate, args.completion_tokens, args.error_rate, args.error_status
+    )
+    uvicorn.run(app, host="127.0.0.1", port=args.port, log_level="warning")
+
+
+# ---------- 进程管理 ----------
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def wait_until_ready(client, url, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if (await client.get(url, timeout=2)).status_code < 500:
+                return
+        except Exception:
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError(f"等待服务启动超时: {url}")
+
+
+def start_process(command, cwd, env=None, log_path=None):
+    log = open(log_path, "w") if log_path else subprocess.DEVNULL
+    return subprocess.Popen(command, cwd=cwd, env=env, stdout=log, stderr=subprocess.STDOUT)
+
+
+# ---------- 压测 ----------
+
+def percentile(sorted_values, pct):
+    """最近秩法百分位"""
+    if not sorted_values:
+        return None
+    rank = max(1, int(round(pct / 100 * len(sorted_values))))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+async def run_phase(make_request, total, concurrency):
+    """以固定并发发出 total 个请求，make_request(i) 返回 (是否成功, 附加信息)"""
+    latencies = []
+    errors = {}
+    next_index = iter(range(total))
+
+    async def worker():
+        for i in next_index:
+            start = time.perf_counter()
+            try:
+                ok, detail = await make_request(i)
+            except Exception as e:
+                ok, detail = False, type(e).__name__
+            latencies.append((time.perf_counter() - start) * 1000)
+            if not ok:
+                errors[detail] = errors.get(detail, 0) + 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(min(concurrency, total))])
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    failed = sum(errors.values())
+    return {
+        "requests": total,
+        "succeeded": total - failed,
+        "errors": errors,
+        "concurrency": concurrency,
+        "duration_s": round(elapsed, 3),
+        "throughput_rps": round(total / elapsed, 2) if elapsed else None,
+        "latency_ms": {
+            "p50": round(percentile(latencies, 50), 2),
+            "p95": round(percentile(latencies, 95), 2),
+            "p99": round(percentile(latencies, 99), 2),
+            "max": round(latencies[-1], 2),
+        } if latencies else {},
+    }
+
+
+async def drive(args, target, upstream_url):
+    import httpx
+
+    limits = httpx.Limits(max_connections=args.concurrency * 2, max_keepalive_connections=args.concurrency * 2)
+    async with httpx.AsyncClient(base_url=target, timeout=args.timeout, limits=limits) as client:
+        await wait_until_ready(client, f"{target}/health")
+        session_id = (await client.post("/create-session")).json()["session_id"]
+        file_ids = []
+        common = {"model": args.model, "api_base": upstream_url, "api_key": "load-test", "session_id": session_id}
+        run_id = uuid.uuid4().hex[:8]
+
+        async def upload(i):
+            # 每个文件内容不同（避免被内容去重），大小约为 --file-kb
+            content = (f"压测文件 {run_id}-{i}\n" + KNOWLEDGE_TEXT * max(1, args.file_kb * 1024 // 300)).encode("utf-8")
+            response = await client.post(
+                "/upload",
+                files={"files": (f"load-{run_id}-{i}.txt", content, "text/plain")},
+                data={"file_info": json.dumps({"type": "knowledge"}), "session_id": session_id}
+            )
+            if response.status_code == 200:
+                file_ids.extend(file["id"] for file in response.json()["files"])
+            return response.status_code == 200, f"HTTP {response.status_code}"
+
+        async def kb_content(i):
+            response = await client.get(f"/knowledge-base-content/{session_id}")
+            return response.status_code == 200, f"HTTP {response.status_code}"
+
+        def kb_ids(i):
+            if not file_ids:
+                return []
+            start = i % len(file_ids)
+            return (file_ids[start:] + file_ids[:start])[:args.kb_files]
+
+        async def chat(i):
+            message = "伺服电动机有哪些控制方式？" if args.cacheable else f"伺服电动机有哪些控制方式？（{run_id}-{i}）"
+            response = await client.post("/chat", json={**common, "message": message, "knowledge_base_1_ids": kb_ids(i)})
+            if response.status_code != 200:
+                return False, f"HTTP {response.status_code}"
+            # 上游失败时接口仍返回200，回答中带有失败提示
+            if "AI服务调用失败" in response.json().get("answer", ""):
+                return False, "upstream error"
+            return True, ""
+
+        async def questions(i):
+            topic = "伺服系统" if args.cacheable else f"伺服系统（{run_id}-{i}）"
+            response = await client.post("/generate-questions", json={
+                **common, "topic": topic, "count": args.question_count, "knowledge_base_1_ids": kb_ids(i)
+            })
+            return response.status_code == 200, f"HTTP {response.status_code}"
+
+        handlers = {"upload": upload, "kb_content": kb_content, "chat": chat, "questions": questions}
+        report = {}
+        for phase in args.phases:
+            print(f"▶ {phase}: {args.requests} 个请求，并发 {args.concurrency}", file=sys.stderr)
+            report[phase] = await run_phase(handlers[phase], args.requests, args.concurrency)
+            summary = report[phase]
+            print(
+                f"  吞吐 {summary['throughput_rps']} req/s，p50 {summary['latency_ms'].get('p50')}ms，"
+                f"p95 {summary['latency_ms'].get('p95')}ms，p99 {summary['latency_ms'].get('p99')}ms，"
+                f"失败 {summary['requests'] - summary['succeeded']}",
+                file=sys.stderr
+            )
+        return report
+
+
+def run_load_test(args):
+    processes = []
+    workdir = tempfile.mkdtemp(prefix="load-test-")
+    try:
+        upstream_url = args.upstream
+        if not upstream_url:
+            port = free_port()
+            processes.append(start_process([
+                sys.executable, os.path.abspath(__file__), "upstream", "--port", str(port),
+                "--latency", str(args.latency), "--jitter", str(args.jitter), "--token-rate", str(args.token_rate),
+                "--completion-tokens", str(args.completion_tokens), "--error-rate", str(args.error_rate),
+                "--error-status", str(args.error_status)
+            ], cwd=workdir, log_path=os.path.join(workdir, "upstream.log")))
+            upstream_url = f"http://127.0.0.1:{port}"
+
+        target = args.target
+        if args.start_backend:
+            port = free_port()
+            env = dict(
+                os.environ,
+                PYTHONPATH=REPO_ROOT + os.pathsep + os.environ.get("PYTHONPATH", ""),
+                LLM_PREWARM="false",
+                LOG_LEVEL=os.environ.get("LOG_LEVEL", "WARNING")
+            )
+            processes.append(start_process([
+                sys.executable, "-m", "uvicorn", "backend.main:app", "--host", "127.0.0.1", "--port", str(port),
+                "--log-level", "warning"
+            ], cwd=workdir, env=env, log_path=os.path.join(workdir, "backend.log")))
+            target = f"http://127.0.0.1:{port}"
+
+        report = asyncio.run(_with_upstream_ready(args, target, upstream_url))
+        return {
+            "config": {
+                "target": target, "upstream": upstream_url, "requests": args.requests, "concurrency": args.concurrency,
+                "latency": args.latency, "token_rate": args.token_rate, "completion_tokens": args.completion_tokens,
+                "error_rate": args.error_rate, "cacheable": args.cacheable
+            },
+            "phases": report,
+        }
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        if args.keep_workdir:
+            print(f"日志和数据保留在 {workdir}", file=sys.stderr)
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+async def _with_upstream_ready(args, target, upstream_url):
+    import httpx
+    async with httpx.AsyncClient() as client:
+        await wait_until_ready(client, f"{upstream_url}/models")
+    return await drive(args, target, upstream_url)
+
+
+def add_upstream_arguments(parser):
+    parser.add_argument("--latency", type=float, default=0.5, help="模拟上游首字延迟（秒）")
+    parser.add_argument("--jitter", type=float, default=0.1, help="首字延迟的随机抖动（秒）")
+    parser.add_argument("--token-rate", type=float, default=200, help="模拟生成速度（token/秒），0表示立即返回")
+    parser.add_argument("--completion-tokens", type=int, default=200, help="聊天回答的token数")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="注入错误的比例（0～1）")
+    parser.add_argument("--error-status", type=int, default=500, help="注入错误的HTTP状态码（如429、503）")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="端到端压测（本地模拟大模型上游）")
+    subparsers = parser.add_subparsers(dest="command")
+    upstream_parser = subparsers.add_parser("upstream", help="只启动模拟上游")
+    upstream_parser.add_argument("--port", type=int, default=9100)
+    add_upstream_arguments(upstream_parser)
+
+    add_upstream_arguments(parser)
+    parser.add_argument("--target", default="http://127.0.0.1:8000", help="被压测的后端地址")
+    parser.add_argument("--start-backend", action="store_true", help="在临时目录中启动一个后端进程进行压测")
+    parser.add_argument("--upstream", help="使用已启动的上游地址，而不是自动启动模拟上游")
+    parser.add_argument("-n", "--requests", type=int, default=200, help="每个接口的请求数")
+    parser.add_argument("-c", "--concurrency", type=int, default=20, help="并发数")
+    parser.add_argument("--phases", default=",".join(PHASES), help=f"要压测的接口，逗号分隔：{','.join(PHASES)}")
+    parser.add_argument("--model", default="deepseek-chat")
+    parser.add_argument("--file-kb", type=int, default=64, help="上传文件大小（KB）")
+    parser.add_argument("--kb-files", type=int, default=3, help="每次聊天/出题引用的知识库文件数")
+    parser.add_argument("--question-count", type=int, default=5, help="每次出题的题目数")
+    parser.add_argument("--cacheable", action="store_true", help="重复相同的问题（测试回答缓存命中的情况）")
+    parser.add_argument("--timeout", type=float, default=180, help="单个请求的超时（秒）")
+    parser.add_argument("--output", help="把结果JSON写入文件")
+    parser.add_argument("--keep-workdir", action="store_true", help="保留临时目录中的日志和数据")
+    args = parser.parse_args()
+
+    if args.command == "upstream":
+        serve_upstream(args)
+        return 0
+
+    args.phases = [phase.strip() for phase in args.phases.split(",") if phase.strip()]
+    unknown = [phase for phase in args.phases if phase not in PHASES]
+    if unknown:
+        parser.error(f"未知的接口: {', '.join(unknown)}")
+
+    report = run_load_test(args)
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+        print(f"结果已写入 {args.output}", file=sys.stderr)
+    else:
+        print(text)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
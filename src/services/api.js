@@ -49,42 +49,15 @@ export const sendMessageToAI = async (message, knowledgeBase1, knowledgeBase2) =
     
     const sessionId = await getSessionId()
     
-    // 首先获取知识库内容
-    console.log('获取知识库内容...')
-    let knowledgeFiles = []
-    let questionFiles = []
-    
-    try {
-      const knowledgeResponse = await api.get(`${API_BASE_URL}/knowledge-base-content/${sessionId}`)
-      console.log('知识库响应:', knowledgeResponse.data)
-      const allFiles = knowledgeResponse.data.files || []
-      
-      // 根据文件类型分类
-      knowledgeFiles = allFiles.filter(file => 
-        knowledgeBase1.some(kb => kb.id === file.id)
-      )
-      questionFiles = allFiles.filter(file => 
-        knowledgeBase2.some(kb => kb.id === file.id)
-      )
-      
-      console.log('过滤后的知识库文件:', knowledgeFiles.length)
-      console.log('过滤后的题目文件:', questionFiles.length)
-    } catch (knowledgeError) {
-      console.error('获取知识库内容失败:', knowledgeError)
-      // 如果获取知识库内容失败，使用原始数据
-      knowledgeFiles = knowledgeBase1
-      questionFiles = knowledgeBase2
-    }
-    
     // 获取apiKey
     const apiKey = localStorage.getItem('api_key') || ''
     
-    // 调用聊天接口
+    // 调用聊天接口：只传文件ID，文件内容由后端从会话中读取
     const payload = {
       message,
       session_id: sessionId,
-      knowledge_base_1: knowledgeFiles,
-      knowledge_base_2: questionFiles
+      knowledge_base_1_ids: knowledgeBase1.map(file => file.id),
+      knowledge_base_2_ids: knowledgeBase2.map(file => file.id)
     }
     // 只有apiKey有值且非空字符串时才传递
     if (apiKey && apiKey.trim() !== '') {
@@ -155,26 +128,15 @@ export const generateQuestions = async (topic, difficulty, count, knowledgeBase1
   try {
     const sessionId = await getSessionId()
     
-    // 首先获取知识库内容
-    const knowledgeResponse = await api.get(`${API_BASE_URL}/knowledge-base-content/${sessionId}`)
-    const allFiles = knowledgeResponse.data.files || []
-    
-    // 根据文件类型分类
-    const knowledgeFiles = allFiles.filter(file => 
-      knowledgeBase1.some(kb => kb.id === file.id)
-    )
-    const questionFiles = allFiles.filter(file => 
-      knowledgeBase2.some(kb => kb.id === file.id)
-    )
-    
+    // 只传文件ID，文件内容由后端从会话中读取
     const payload = {
       topic,
       session_id: sessionId,
       difficulty,
       count,
       question_type: "multiple_choice",
-      knowledge_base_1: knowledgeFiles,
-      knowledge_base_2: questionFiles
+      knowledge_base_1_ids: knowledgeBase1.map(file => file.id),
+      knowledge_base_2_ids: knowledgeBase2.map(file => file.id)
     }
 
     const response = await api.post(`${API_BASE_URL}/generate-questions`, payload)
@@ -0,0 +1,18 @@
+import os
+
+import pytest
+
+
+@pytest.fixture(scope="session")
+def app_module(tmp_path_factory):
+    # 数据库、blob目录等使用相对路径，导入前切换到临时目录
+    workdir = tmp_path_factory.mktemp("app")
+    previous_cwd = os.getcwd()
+    os.chdir(workdir)
+    os.environ.setdefault("LLM_PREWARM", "false")
+    os.environ.setdefault("MANIFEST_WATCH", "false")
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    from backend import main
+    yield main
+    main.parser_pool.shutdown()
+    os.chdir(previous_cwd)
@@ -0,0 +1,72 @@
+"""上传目录文件清单：监听和对账时不重复计算文件的哈希"""
+
+import asyncio
+import os
+
+import pytest
+
+from backend import file_manifest
+from backend.file_manifest import FileManifest
+
+
+async def watch_until(manifest, condition, timeout=10.0):
+    stop_event = asyncio.Event()
+    task = asyncio.create_task(manifest.watch(stop_event))
+    try:
+        deadline = asyncio.get_running_loop().time() + timeout
+        while not condition() and asyncio.get_running_loop().time() < deadline:
+            await asyncio.sleep(0.05)
+    finally:
+        stop_event.set()
+        await task
+
+
+@pytest.mark.skipif(file_manifest.awatch is None, reason="未安装 watchfiles")
+def test_watch_skips_files_already_recorded_with_hash(tmp_path, monkeypatch):
+    hashed = []
+    original_hash_file = file_manifest.hash_file
+    monkeypatch.setattr(file_manifest, "hash_file", lambda path: hashed.append(path) or original_hash_file(path))
+
+    uploads = tmp_path / "uploads"
+    uploads.mkdir()
+    manifest = FileManifest(str(tmp_path / "manifest.db"))
+    manifest.add_root(str(uploads))
+
+    recorded = str(uploads / "recorded.txt")
+    unknown = str(uploads / "unknown.txt")
+
+    async def scenario():
+        async def write_files():
+            await asyncio.sleep(0.3)
+            with open(recorded, "w", encoding="utf-8") as f:
+                f.write("上传时已算出哈希")
+            manifest.record(recorded, "known-hash")
+            with open(unknown, "w", encoding="utf-8") as f:
+                f.write("其他进程写入的文件")
+
+        writer = asyncio.create_task(write_files())
+        await watch_until(manifest, lambda: manifest.get(unknown) is not None)
+        await writer
+
+    asyncio.run(scenario())
+
+    assert manifest.get(unknown) is not None
+    assert hashed == [os.path.abspath(unknown)]
+    assert manifest.get(recorded)[2] == "known-hash"
+    manifest.close()
+
+
+def test_reconcile_upload_dirs_visits_legacy_uploads_once(app_module, monkeypatch):
+    walked = []
+    original_walk = FileManifest._walk
+    monkeypatch.setattr(FileManifest, "_walk", lambda self, root, recursive: walked.append(root) or original_walk(self, root, recursive))
+    os.makedirs(app_module.Config.UPLOAD_DIR, exist_ok=True)
+    legacy = os.path.join(app_module.Config.UPLOAD_DIR, "旧资料.txt")
+    with open(legacy, "w", encoding="utf-8") as f:
+        f.write("旧版本上传目录中的文件")
+
+    changes = asyncio.run(app_module.reconcile_upload_dirs())
+
+    assert changes["added"] == [os.path.abspath(legacy)]
+    assert walked.count(os.path.abspath(app_module.Config.UPLOAD_DIR)) == 1
+    assert [file["name"] for file in app_module.uploaded_files["knowledge"]] == ["旧资料.txt"]
@@ -0,0 +1,82 @@
+"""
+导入耗时：在新的Python进程中导入 backend.main，
+检查导入耗时不超过预算、重量级依赖按需导入，且导入时不扫描缓存目录和旧会话目录
+（工作目录中预先放入大量缓存条目和旧的JSON会话文件，扫描目录的代码回到导入路径上时会被发现）
+"""
+
+import json
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BUDGET_MS = float(os.getenv("IMPORT_TIME_BUDGET_MS", 1000))
+RUNS = 3
+SEEDED_ENTRIES = 2000
+SEEDED_SESSIONS = 200
+
+# 这些模块应在第一次使用时才导入
+LAZY_MODULES = ("PyPDF2", "docx", "openai", "requests", "numpy", "httpx")
+
+MEASURE_CODE = """
+import json, sys, time
+start = time.perf_counter()
+import backend.main as main
+elapsed = (time.perf_counter() - start) * 1000
+from backend import structured_log
+migrated = main.session_store._conn.execute("SELECT value FROM meta WHERE key = 'json_migrated'").fetchone()
+print(json.dumps({
+    "ms": elapsed,
+    "loaded": [m for m in %r if m in sys.modules],
+    "scanned": {
+        "response_cache": main.response_cache._index_loaded,
+        "parse_cache": main.parse_cache._index_loaded,
+        "sessions": migrated is not None,
+        "logging": structured_log._listener is not None,
+    },
+    # 第一次使用时才建立索引
+    "response_cache_entries": main.response_cache.stats()["disk_entries"],
+    "parse_cache_entries": main.parse_cache.stats()["entries"],
+}))
+""" % (LAZY_MODULES,)
+
+
+@pytest.fixture(scope="module")
+def populated_workdir(tmp_path_factory):
+    workdir = tmp_path_factory.mktemp("populated")
+    data = workdir / "data"
+    llm_cache, parse_cache, users = data / "llm_cache", data / "parse_cache", data / "users"
+    for directory in (llm_cache, parse_cache, users):
+        directory.mkdir(parents=True)
+    now = time.time()
+    for i in range(SEEDED_ENTRIES):
+        (llm_cache / f"{i:064x}.json").write_text(json.dumps({"created_at": now, "value": {"answer": "回答"}}), encoding="utf-8")
+        (parse_cache / f"{i:064x}-00000000-v1.txt").write_text("【第1页】\n解析结果", encoding="utf-8")
+    for i in range(SEEDED_SESSIONS):
+        (users / f"session-{i}.json").write_text(json.dumps({"file_id_counter": 0, "knowledge": []}), encoding="utf-8")
+    return workdir
+
+
+def measure_once(workdir):
+    env = {key: value for key, value in os.environ.items() if not key.endswith(("_DIR", "_DB_PATH"))}
+    env["PYTHONPATH"] = REPO_ROOT + os.pathsep + os.environ.get("PYTHONPATH", "")
+    result = subprocess.run(
+        [sys.executable, "-c", MEASURE_CODE],
+        cwd=workdir, env=env, capture_output=True, text=True, timeout=120
+    )
+    assert result.returncode == 0, f"导入 backend.main 失败:\n{result.stderr}"
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def test_import_does_not_scan_cache_or_session_dirs(populated_workdir):
+    samples = [measure_once(populated_workdir) for _ in range(RUNS)]
+
+    for sample in samples:
+        assert sample["scanned"] == {"response_cache": False, "parse_cache": False, "sessions": False, "logging": False}
+        assert sample["response_cache_entries"] == SEEDED_ENTRIES
+        assert sample["parse_cache_entries"] == SEEDED_ENTRIES
+    assert sorted({module for sample in samples for module in sample["loaded"]}) == []
+    assert min(sample["ms"] for sample in samples) <= BUDGET_MS
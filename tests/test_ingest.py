@@ -0,0 +1,34 @@
+"""上传解析流水线：已结束的状态记录按保留时间移除"""
+
+import asyncio
+
+from backend import ingest
+from backend.ingest import STATUS_READY, IngestPipeline
+
+
+def test_finished_status_records_expire(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(ingest.time, "monotonic", lambda: now[0])
+
+    async def process(file_info, progress):
+        return "解析结果"
+
+    async def scenario():
+        pipeline = IngestPipeline(process, workers=1, status_ttl=60)
+        await pipeline.start()
+        for i in range(3):
+            pipeline.enqueue("session", {"id": f"file_{i}", "name": f"{i}.txt"})
+        await pipeline._queue.join()
+        statuses = [pipeline.get_status("session", f"file_{i}")["status"] for i in range(3)]
+
+        now[0] += 61
+        pipeline.enqueue("session", {"id": "file_3", "name": "3.txt"})
+        await pipeline._queue.join()
+        await pipeline.stop()
+        return pipeline, statuses
+
+    pipeline, statuses = asyncio.run(scenario())
+    assert statuses == [STATUS_READY] * 3
+    assert [pipeline.get_status("session", f"file_{i}") for i in range(3)] == [None] * 3
+    assert pipeline.get_status("session", "file_3")["status"] == STATUS_READY
+    assert list(pipeline._status) == [("session", "file_3")]
@@ -0,0 +1,40 @@
+"""题目近似去重：只改了问法的同一道题被过滤，换了考点的题目保留"""
+
+from backend.near_duplicates import NearDuplicateFilter
+
+
+def test_rewordings_are_dropped():
+    duplicates = NearDuplicateFilter()
+    assert duplicates.add("1. 伺服电动机常用的控制方式有哪几种？")
+    assert not duplicates.add("（2）伺服电动机常用的控制方式有哪些")
+    assert not duplicates.add("伺服电动机常用的控制方式有哪几种?")
+    assert duplicates.add("下列哪一项不是PLC的编程语言？")
+    assert not duplicates.add("下列哪一项不属于PLC的编程语言？")
+    assert duplicates.add("PLC的扫描周期包括哪几个阶段？")
+    assert not duplicates.add("PLC的一个扫描周期包括哪几个阶段？")
+    assert not duplicates.add("简述PLC的扫描周期包括哪几个阶段")
+
+
+def test_questions_differing_in_one_domain_term_are_kept():
+    duplicates = NearDuplicateFilter()
+    stems = [
+        "直流电动机的调速方法有哪些？",
+        "交流电动机的调速方法有哪些？",
+        "简述PID控制器中积分环节的作用。",
+        "简述PID控制器中微分环节的作用。",
+        "数模转换器的作用是什么？",
+        "模数转换器的作用是什么？",
+        "简述三相异步电动机的启动方法",
+        "三相异步电动机的制动方法有哪些",
+        "什么是变频器？",
+        "什么是变压器？",
+        "下列说法中正确的是（ ）",
+        "下列说法中错误的是（ ）",
+    ]
+    assert all(duplicates.add(stem) for stem in stems)
+
+
+def test_empty_stems_are_not_filtered():
+    duplicates = NearDuplicateFilter()
+    assert duplicates.add("")
+    assert duplicates.add("？")
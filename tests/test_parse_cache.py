@@ -0,0 +1,28 @@
+"""解析缓存：在映射上按字节区间读取部分内容"""
+
+import re
+
+from backend.parse_cache import ParseCache
+
+PAGE_RE = re.compile('^【第(\\d+)页】$'.encode('utf-8'), re.MULTILINE)
+
+
+def test_find_all_and_range_text_read_single_pages(tmp_path):
+    cache = ParseCache(str(tmp_path), max_bytes=1024 * 1024, version="test")
+    pages = [f"【第{page}页】\n伺服电动机第{page}页的内容，包含中文和 English text。" for page in range(1, 6)]
+    cache.put("doc", "\n".join(pages))
+
+    view = cache.get_view("doc")
+    markers = view.find_all(PAGE_RE)
+    assert [int(page) for _, page in markers] == [1, 2, 3, 4, 5]
+    starts = [start for start, _ in markers] + [view.size]
+    for i, expected in enumerate(pages):
+        assert view.text(starts[i], starts[i + 1]).strip() == expected
+
+
+def test_empty_entry_has_no_matches(tmp_path):
+    cache = ParseCache(str(tmp_path), max_bytes=1024, version="test")
+    cache.put("empty", "")
+    view = cache.get_view("empty")
+    assert view.find_all(PAGE_RE) == []
+    assert view.text() == ""
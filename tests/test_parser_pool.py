@@ -0,0 +1,47 @@
+"""解析进程池：进程池损坏后并发调用方只重建一次"""
+
+import asyncio
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from backend import parser_pool
+from backend.parser_pool import ParserPool
+
+
+class BrokenExecutor:
+    """已损坏的进程池：提交的任务都以 BrokenProcessPool 失败"""
+
+    def submit(self, func, *args):
+        future = Future()
+        future.set_exception(BrokenProcessPool("子进程异常退出"))
+        return future
+
+    def shutdown(self, wait=True):
+        pass
+
+
+class TrackingExecutor(ThreadPoolExecutor):
+    def __init__(self, max_workers):
+        super().__init__(max_workers)
+        self.closed = False
+
+    def shutdown(self, wait=True, **kwargs):
+        self.closed = True
+        super().shutdown(wait, **kwargs)
+
+
+def test_concurrent_callers_rebuild_broken_pool_once(monkeypatch):
+    created = []
+    monkeypatch.setattr(parser_pool, "ProcessPoolExecutor", lambda max_workers: created.append(TrackingExecutor(max_workers)) or created[-1])
+    pool = ParserPool(workers=2, max_concurrency=4, pdf_pages_per_task=10)
+    pool._executor = BrokenExecutor()
+
+    async def scenario():
+        # 四个调用方都提交到了已损坏的进程池
+        return await asyncio.gather(*(pool.run(pow, n, 2) for n in range(4)))
+
+    assert asyncio.run(scenario()) == [0, 1, 4, 9]
+    assert len(created) == 1
+    assert pool._executor is created[0] and not created[0].closed
+    pool.shutdown()
+    assert created[0].closed
@@ -0,0 +1,58 @@
+"""批量出题：去重后题目不足时补题"""
+
+import asyncio
+import json
+
+from backend.response_cache import ResponseCache
+
+DUPLICATE = "伺服电动机常用的控制方式有哪几种？"
+DISTINCT = ["直流电动机的调速方法有哪些？", "交流电动机的调速方法有哪些？", "步进电动机的步距角如何计算？",
+            "编码器的分辨率如何表示？", "PLC的扫描周期包括哪几个阶段？", "变频器的控制方式有哪些？"]
+
+
+class FakeCompletion:
+    status_code = 200
+
+    def __init__(self, stems):
+        self.stems = stems
+
+    def json(self):
+        questions = [{"question": stem, "answer": "答案", "explanation": "解析", "source": "generated"} for stem in self.stems]
+        content = json.dumps({"questions": questions, "source_type": "基于知识点生成"}, ensure_ascii=False)
+        return {"choices": [{"message": {"content": content}}]}
+
+
+def run(app_module, monkeypatch, tmp_path, responses, count):
+    monkeypatch.setattr(app_module, "response_cache", ResponseCache(str(tmp_path), 8, 3600, 3600))
+    monkeypatch.setattr(app_module.Config, "QUESTIONS_BATCH_SIZE", 2)
+    prompts = []
+
+    async def post_chat_completions(api_base, api_key, payload, timeout=None):
+        prompts.append(payload["messages"][-1]["content"])
+        return FakeCompletion(responses.pop(0) if responses else [DUPLICATE])
+
+    monkeypatch.setattr(app_module.llm_http_client, "post_chat_completions", post_chat_completions)
+    result = asyncio.run(app_module.call_large_model_for_questions(
+        "电动机", "中等", count, "简答题", [], [], "test-model", "key", "http://upstream.invalid"
+    ))
+    return result, prompts
+
+
+def test_duplicates_are_topped_up_to_count(app_module, monkeypatch, tmp_path):
+    # 两个子请求都返回同一道题，补题请求列出已有题目并返回新题
+    responses = [[DUPLICATE, DISTINCT[0]], ["（2）伺服电动机常用的控制方式有哪些", DISTINCT[1]], [DISTINCT[2]]]
+    result, prompts = run(app_module, monkeypatch, tmp_path, responses, 4)
+
+    assert [question["question"] for question in result["questions"]] == [DUPLICATE, DISTINCT[0], DISTINCT[1], DISTINCT[2]]
+    assert result["total"] == 4
+    assert len(prompts) == 3
+    assert "生成1道" in prompts[-1] and DISTINCT[0] in prompts[-1]
+
+
+def test_topup_rounds_are_capped(app_module, monkeypatch, tmp_path):
+    monkeypatch.setattr(app_module.Config, "QUESTIONS_TOPUP_ROUNDS", 2)
+    # 上游始终只返回同一道题
+    result, prompts = run(app_module, monkeypatch, tmp_path, [], 4)
+
+    assert result["total"] == 1
+    assert len(prompts) == 2 + 2 * 2
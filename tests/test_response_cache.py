@@ -0,0 +1,66 @@
+"""大模型回答缓存磁盘层的淘汰与清理"""
+
+import os
+import time
+
+from backend.response_cache import ResponseCache
+
+
+def make_cache(cache_dir, **kwargs):
+    options = dict(max_memory_entries=2, ttl=60, stale_ttl=60)
+    options.update(kwargs)
+    return ResponseCache(str(cache_dir), **options)
+
+
+def disk_keys(cache_dir):
+    return sorted(path.stem for path in cache_dir.glob("*.json"))
+
+
+def test_disk_tier_evicts_least_recently_used_over_entry_limit(tmp_path):
+    cache = make_cache(tmp_path, max_disk_entries=3)
+    for key in ("a", "b", "c"):
+        cache.put(key, {"answer": key})
+    # 读取 a 后，最久未使用的是 b
+    cache._memory.clear()
+    assert cache.get("a") == {"answer": "a"}
+    cache.put("d", {"answer": "d"})
+    assert disk_keys(tmp_path) == ["a", "c", "d"]
+    assert cache.stats()["disk_entries"] == 3
+    assert cache.stats()["disk_evictions"] == 1
+
+
+def test_disk_tier_evicts_over_byte_limit(tmp_path):
+    cache = make_cache(tmp_path, max_disk_bytes=1000)
+    for i in range(10):
+        cache.put(f"k{i}", {"answer": "x" * 200})
+    assert cache.stats()["disk_bytes"] <= 1000
+    assert sum(path.stat().st_size for path in tmp_path.glob("*.json")) == cache.stats()["disk_bytes"]
+    assert "k9" in disk_keys(tmp_path) and "k0" not in disk_keys(tmp_path)
+
+
+def test_expired_entries_are_swept_on_first_use_after_restart(tmp_path):
+    cache = make_cache(tmp_path)
+    cache.put("old", {"answer": "old"})
+    cache.put("new", {"answer": "new"})
+    # 把 old 的写入时间改到保留期之前
+    past = time.time() - 500
+    os.utime(tmp_path / "old.json", (past, past))
+
+    # 创建时不扫描缓存目录，第一次使用时才建立索引并清理
+    reopened = make_cache(tmp_path)
+    assert disk_keys(tmp_path) == ["new", "old"]
+    assert reopened.get("new") == {"answer": "new"}
+    assert disk_keys(tmp_path) == ["new"]
+    assert reopened.get_stale("old") is None
+
+
+def test_index_survives_restart(tmp_path):
+    cache = make_cache(tmp_path, max_disk_entries=2)
+    cache.put("a", {"answer": "a"})
+    cache.put("b", {"answer": "b"})
+
+    reopened = make_cache(tmp_path, max_disk_entries=2)
+    assert reopened.stats()["disk_entries"] == 2
+    reopened.put("c", {"answer": "c"})
+    assert len(disk_keys(tmp_path)) == 2
+    assert "c" in disk_keys(tmp_path)
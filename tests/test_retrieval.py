@@ -0,0 +1,34 @@
+"""检索索引：内容相同的文件在会话之间共享文档段"""
+
+from backend.retrieval import DocumentSegment, SegmentCache, SessionIndex, analyze_document
+
+TEXT = "\n".join(f"【第{page}页】\n伺服电动机第{page}种控制方式的特点，编码器反馈实现闭环。" for page in range(1, 20))
+
+
+def test_sessions_reference_one_segment_with_their_own_file_names():
+    segment = DocumentSegment(analyze_document(TEXT, 200))
+    first, second = SessionIndex(), SessionIndex()
+    first.add_document("a", "课件.pdf", segment)
+    second.add_document("b", "复习资料.pdf", segment)
+
+    assert first.bm25._files["a"][0] is second.bm25._files["b"][0]
+    hits = second.search("第7种控制方式", 3)
+    assert hits and all(chunk["file_id"] == "b" and chunk["file_name"] == "复习资料.pdf" for _, chunk in hits)
+    assert "第7种" in hits[0][1]["text"]
+
+    # 从一个会话删除不影响另一个会话
+    first.remove_document("a")
+    assert first.search("第7种控制方式", 3) == []
+    assert second.search("第7种控制方式", 3)[0][1]["text"] == hits[0][1]["text"]
+
+
+def test_segment_cache_keeps_referenced_segments_beyond_lru_limit():
+    cache = SegmentCache(max_entries=1)
+    index = SessionIndex()
+    referenced = DocumentSegment(analyze_document(TEXT, 200))
+    cache.put("referenced", referenced)
+    index.add_document("a", "a.txt", referenced)
+    cache.put("other", DocumentSegment(analyze_document("另一份资料", 200)))
+
+    # 被会话引用的段即使已被LRU挤出也能找到
+    assert cache.get("referenced") is referenced
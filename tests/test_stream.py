@@ -0,0 +1,50 @@
+"""流式聊天：上游中途失败时的处理"""
+
+import asyncio
+import json
+
+from backend.response_cache import ResponseCache
+
+
+def collect_events(generator):
+    async def run():
+        return [chunk async for chunk in generator]
+
+    events = []
+    for chunk in asyncio.run(run()):
+        lines = chunk.strip().split("\n")
+        events.append((lines[0][len("event: "):], json.loads(lines[1][len("data: "):])))
+    return events
+
+
+def prepare(app_module, monkeypatch, tmp_path, fail_after):
+    # ttl=0：缓存中的回答立即过期，只能作为过期回答返回
+    cache = ResponseCache(str(tmp_path), max_memory_entries=8, ttl=0, stale_ttl=3600)
+    monkeypatch.setattr(app_module, "response_cache", cache)
+    cache.put(cache.make_key("chat", "test-model", "问题", []), {"answer": "过期的完整回答", "references": []})
+
+    async def build_chat_prompt(*args, **kwargs):
+        return {"system_prompt": "系统", "user_message": "问题"}
+
+    async def stream_chat_completions(*args, **kwargs):
+        for content in ["部分", "回答"][:fail_after]:
+            yield {"choices": [{"delta": {"content": content}}]}
+        raise RuntimeError("上游连接中断")
+
+    monkeypatch.setattr(app_module, "build_chat_prompt", build_chat_prompt)
+    monkeypatch.setattr(app_module.llm_http_client, "stream_chat_completions", stream_chat_completions)
+
+
+def test_failure_mid_stream_does_not_append_stale_answer(app_module, monkeypatch, tmp_path):
+    prepare(app_module, monkeypatch, tmp_path, fail_after=2)
+    events = collect_events(app_module.stream_large_model_api("问题", [], [], "test-model", "", ""))
+
+    assert events[:2] == [("delta", {"content": "部分"}), ("delta", {"content": "回答"})]
+    assert [event for event, _ in events[2:]] == ["error"]
+
+
+def test_failure_before_first_delta_serves_stale_answer(app_module, monkeypatch, tmp_path):
+    prepare(app_module, monkeypatch, tmp_path, fail_after=0)
+    events = collect_events(app_module.stream_large_model_api("问题", [], [], "test-model", "", ""))
+
+    assert events == [("delta", {"content": "过期的完整回答"}), ("done", {})]
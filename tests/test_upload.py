@@ -0,0 +1,73 @@
+"""上传接口：按内容存储的文件在重新上传时不能被误删"""
+
+import os
+
+import pytest
+
+
+@pytest.fixture()
+def client(app_module):
+    from fastapi.testclient import TestClient
+    return TestClient(app_module.app)
+
+
+def upload(client, session_id, name, data):
+    response = client.post(
+        "/upload",
+        files={"files": (name, data, "text/plain")},
+        data={"file_info": '{"type": "knowledge"}', "session_id": session_id},
+    )
+    assert response.status_code == 200, response.text
+    return response.json()["files"][0]
+
+
+def test_reupload_same_name_same_content_keeps_blob(app_module, client):
+    session_id = "reupload-same"
+    first = upload(client, session_id, "a.txt", "伺服电动机的控制方式".encode("utf-8"))
+    second = upload(client, session_id, "a.txt", "伺服电动机的控制方式".encode("utf-8"))
+
+    assert second["id"] != first["id"]
+    assert second["content_hash"] == first["content_hash"]
+    assert os.path.exists(second["path"])
+
+    files = client.get(f"/knowledge-base/{session_id}").json()["knowledge_base_1"]
+    assert [file["id"] for file in files] == [second["id"]]
+    statuses = client.get(f"/ingest-status/{session_id}").json()["files"]
+    assert len(statuses) == 1
+
+
+def test_reupload_same_name_new_content_releases_old_blob(app_module, client):
+    session_id = "reupload-changed"
+    first = upload(client, session_id, "b.txt", "第一版内容".encode("utf-8"))
+    second = upload(client, session_id, "b.txt", "第二版内容".encode("utf-8"))
+
+    assert os.path.exists(second["path"])
+    assert not os.path.exists(first["path"])
+    files = client.get(f"/knowledge-base/{session_id}").json()["knowledge_base_1"]
+    assert [file["id"] for file in files] == [second["id"]]
+
+
+def test_oversized_request_is_rejected_before_reading_body(app_module, client, monkeypatch):
+    monkeypatch.setattr(app_module.Config, "MAX_UPLOAD_REQUEST_SIZE", 4096)
+    saved = []
+    monkeypatch.setattr(app_module, "save_upload_to_temp", lambda *args: saved.append(args))
+
+    response = client.post(
+        "/upload",
+        files={"files": ("big.txt", b"x" * 8192, "text/plain")},
+        data={"file_info": '{"type": "knowledge"}', "session_id": "too-large"},
+    )
+    assert response.status_code == 413
+    assert saved == []
+
+
+def test_file_over_limit_is_rejected_while_streaming(app_module, client, monkeypatch):
+    # 请求体在总大小限制内，单个文件超过 MAX_FILE_SIZE 时由分块写入兜底
+    monkeypatch.setattr(app_module.Config, "MAX_FILE_SIZE", 1024)
+    response = client.post(
+        "/upload",
+        files={"files": ("big.txt", b"x" * 2048, "text/plain")},
+        data={"file_info": '{"type": "knowledge"}', "session_id": "file-too-large"},
+    )
+    assert response.status_code == 413
+    assert client.get("/knowledge-base/file-too-large").json()["knowledge_base_1"] == []